@@ -47,6 +47,18 @@ def unregister():
 	from .util.ui_images import reset_image_cache
 	reset_image_cache()
 
+	from .util.scheduler import scheduler
+	scheduler.shutdown()
+
+	from .util.runtime import runtime
+	runtime.shutdown()
+
+	from .util.download import speculative_downloads
+	speculative_downloads.cancel_all()
+
+	from .util.http import close_provider_sessions
+	close_provider_sessions()
+
 	from .ui import unregister
 	ui.unregister()
 
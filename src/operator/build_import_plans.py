@@ -1,185 +1,305 @@
+import json
+import logging
+from typing import Dict, List, Tuple
 import bpy, os
 from ..util.addon_constants import *
 from ..util.af_constants import *
+from ..util import planner, runtime, scheduler
+from ..util.cache import AF_LruCache
 from ..property.core import *
 
+LOGGER = logging.getLogger("af.ops.build_import_plans")
+LOGGER.setLevel(logging.DEBUG)
+
+# Import plans of recently seen implementations, by the key from get_import_plan_cache_key()
+import_plan_cache = AF_LruCache(max_entries=256)
+
+
+def get_import_plan_cache_key(current_impl: AF_PR_Implementation) -> str:
+	"""Identifies the plan of an implementation by the data the provider has sent for it and everything else that influences planning:
+	The provider, asset and download directory (which make up the implementation directory) and the state of the unlocking queries."""
+	af: AF_PR_AssetFetch = bpy.context.window_manager.af
+	unlocked_query_ids = set()
+	for comp in current_impl.components:
+		if comp.fetch_download.is_set and comp.fetch_download.unlock_query_id != "":
+			try:
+				if af.current_implementation_list.get_unlock_query_by_id(comp.fetch_download.unlock_query_id).unlocked:
+					unlocked_query_ids.add(comp.fetch_download.unlock_query_id)
+			except Exception:
+				# A missing unlocking query is reported during planning
+				pass
+	return json.dumps([
+		current_impl.payload_hash,
+		af.current_provider_initialization.name,
+		af.current_asset_list.assets[af.current_asset_list_index].name,
+		AF_PR_Preferences.get_prefs().get_current_download_directory(),
+		sorted(unlocked_query_ids)
+	])
+
+
+def create_import_plan(current_impl: AF_PR_Implementation) -> Dict:
+	"""Plans how to import an implementation, without modifying it.
+	The plan contains whether the implementation is valid, the messages explaining why it isn't, the implementation directory
+	and the import steps, each as the name of its configure_* method on AF_PR_ImplementationImportStep along with the arguments
+	and the indices of the steps it depends on."""
+	af: AF_PR_AssetFetch = bpy.context.window_manager.af
+
+	steps = []
+	plan = {"is_valid": True, "messages": [], "local_directory": "", "steps": steps}
+
+	# Enter try-catch block
+	# Failing this block causes an implementation to be considered unreadable.
+	# If it passes, it is considered readable.
+
+	try:
+
+		# Step 0: Set/create helpful variables
+
+		# Keeps track of which components were already processed.
+		# This becomes an interesting question when recursively resolving dependencies, for example when working with archives.
+		already_processed_component_ids = set()
+
+		# Keeps track of which of the unlocking queries offered by the provider are already scheduled to be called for this implementation.
+		already_scheduled_unlocking_query_ids = set()
+
+		# Other useful shorthands
+		provider_id = af.current_provider_initialization.name
+		asset_id = af.current_asset_list.assets[af.current_asset_list_index].name
+		implementation_id = current_impl.name
+
+		if provider_id == "":
+			raise Exception("No provider ID to create implementation directory.")
+		if asset_id == "":
+			raise Exception("No asset ID to create implementation directory.")
+		if implementation_id == "":
+			raise Exception("No implementation ID to create implementation directory.")
+
+		# Step 1: Find the implementation directory - Where should all the downloaded files for this implementation be stored?
+
+		# Start with the base directory and append the provider/asset/implementation structure to it
+		local_directory = AF_PR_Preferences.get_prefs().get_current_download_directory()
+		local_directory = os.path.join(local_directory, provider_id)
+		local_directory = os.path.join(local_directory, asset_id)
+		local_directory = os.path.join(local_directory, implementation_id)
+		plan['local_directory'] = local_directory
+
+		# Register the step to create the directory
+		steps.append(("configure_create_directory", [local_directory]))
+
+		# Step 2: Find the relevant unlocking queries - Which unlockings/purchases need to be made with the provider in order to use this implementation?
+		for comp in current_impl.components: 
+			comp: AF_PR_Component
+
+			# Is this a component that requires unlocking?
+			if comp.fetch_download.is_set and comp.fetch_download.unlock_query_id != "":
+
+				unlocking_query_id = comp.fetch_download.unlock_query_id
+
+				# Get the unlocking query that this component is linked to
+				referenced_query = af.current_implementation_list.get_unlock_query_by_id(unlocking_query_id)
+
+				# Test if the query is already unlocked or already scheduled to be unlocked.
+				# Otherwise schedule it.
+				if (not referenced_query.unlocked) and (referenced_query.name not in already_scheduled_unlocking_query_ids):
+
+					# Create new step for performing the unlocking query
+					steps.append(("configure_unlock", [unlocking_query_id]))
+
+					# Add the query id to the set of already scheduled queries
+					already_scheduled_unlocking_query_ids.add(unlocking_query_id)
+
+		# Step 3: Download all files
+		# After the preparations in steps 2 and 3 (if those were even required) the actual file download can now be scheduled.
+		for comp in current_impl.components:
+			if comp.fetch_download.is_set:
+
+				# This schedules the actual file download using the HTTP query that was either there in the first place or
+				# which has been obtained during a previous step.
+				steps.append(("configure_fetch_download", [comp.name]))
+
+		# Step 4: Extract files from archives
+		# If the implementation makes use of archives for data transfer then the files must be unpacked.
+		# This must happen in proper order to ensure that unpacking works even if the provider is sending nested ZIP files
+		# (Yes, this is actually a thing sometimes!)
+
+		# Every component that needs to be extracted becomes a node in a dependency graph, depending on the archive it is extracted from.
+		# Archives that are downloaded directly are not part of the graph, meaning that they count as available already.
+		components_by_id = {comp.name: comp for comp in current_impl.components}
+		extraction_graph = planner.AF_DependencyGraph()
+		for comp in current_impl.components:
+			# Does the component have the "file_fetch.from_archive" datablock? If yes: Add it to the graph
+			if comp.fetch_from_archive.is_set:
+				source_archive_comp_id = comp.fetch_from_archive.archive_component_id
+				if source_archive_comp_id not in components_by_id:
+					raise Exception(f"Referenced component {source_archive_comp_id} could not be found.")
+				extraction_graph.add_node(comp.name, [source_archive_comp_id], component=comp)
+
+		# Schedule the extractions such that every archive is extracted before the files inside it.
+		try:
+			extraction_order = extraction_graph.get_order()
+		except planner.AF_DependencyCycleException as e:
+			raise Exception(f"Components {' -> '.join(e.chain)} are extracted from each other in a circle and could not be resolved.")
+
+		for node in extraction_order:
+			steps.append(("configure_fetch_from_zip_archive", [node.node_id]))
+
+		# Step 5: Plan how to import files
+		# "Importing" includes loading the file using Blender's native format handler
+		# and creating or applying loose materials referenced in loose_material.* datablocks
+
+		# This is the list of extensions that should be treated as material maps (if they have the loose_material.define datablock)
+		for comp in current_impl.components:
+
+			# Material maps and HDRIs get a completely separate treatment
+			if comp.handle_loose_material_map.is_set:
+				steps.append(("configure_import_loose_material_map_from_local_path", [comp.name]))
+				
+
+			elif comp.handle_loose_environment_map.is_set:
+				
+				if comp.format.extension not in ['.exr','.hdr']:
+					raise Exception(f"The addon does not know how to handle HDRI environments with the extension '{comp.format.extension}'.")
+
+				if comp.handle_loose_environment_map.projection != "equirectangular":
+					raise Exception("The addon currently only supports HDRIs with equirectangular projection.")
+
+				steps.append(("configure_import_loose_environment_from_local_path", [comp.name]))
+
+			# Handle all other files
+			elif comp.handle_native.is_set:
+
+				# OBJ Model
+				if comp.format.extension == ".obj" or comp.format_obj.is_set:
+					steps.append(("configure_import_obj_from_local_path", [comp.name]))
+
+				# USD Files
+				elif comp.format.extension in [".usd", ".usda", ".usdc", ".usdz"]:
+					steps.append(("configure_import_usd_from_local_path", [comp.name]))
+
+				# TODO: More extensions to be added here in the future
+
+				else:
+					raise Exception(f"The addon does not know how to actively handle this '{comp.format.extension}'-file using the given metadata.")
+
+		# Step 6: Determine which steps depend on each other, so that independent steps can run at the same time
+		plan['steps'] = [(configure_method_name, arguments, dependencies) for (configure_method_name, arguments), dependencies in zip(steps, get_step_dependencies(current_impl, steps))]
+
+	except Exception as e:
+		plan['is_valid'] = False
+		plan['messages'].append(("crit", str(e)))
+		plan['steps'] = []
+		LOGGER.warning(f"Implementation {current_impl.name} can not be imported: {e}")
+
+	return plan
+
+
+def get_step_dependencies(current_impl: AF_PR_Implementation, steps: List[Tuple[str, List]]) -> List[List[int]]:
+	"""Returns the indices of the steps that every step depends on:
+	Downloads need the implementation directory and their unlocking query, extractions need the archive
+	and imports need the file they import. Steps are planned such that they only depend on steps before them."""
+
+	# Which step puts the file of a component into place or performs an unlocking query
+	file_step_indices: Dict[str, int] = {}
+	unlock_step_indices: Dict[str, int] = {}
+	directory_step_indices: List[int] = []
+	for index, (configure_method_name, arguments) in enumerate(steps):
+		if configure_method_name in ["configure_fetch_download", "configure_fetch_from_zip_archive"]:
+			file_step_indices[arguments[0]] = index
+		elif configure_method_name == "configure_unlock":
+			unlock_step_indices[arguments[0]] = index
+		elif configure_method_name == "configure_create_directory":
+			directory_step_indices.append(index)
+
+	step_dependencies = []
+	for index, (configure_method_name, arguments) in enumerate(steps):
+		dependencies = []
+		if configure_method_name not in ["configure_create_directory", "configure_unlock"]:
+			component = current_impl.get_component_by_id(arguments[0])
+			dependencies += directory_step_indices
+
+			if configure_method_name == "configure_fetch_download":
+				if component.fetch_download.unlock_query_id in unlock_step_indices:
+					dependencies.append(unlock_step_indices[component.fetch_download.unlock_query_id])
+			elif configure_method_name == "configure_fetch_from_zip_archive":
+				if component.fetch_from_archive.archive_component_id in file_step_indices:
+					dependencies.append(file_step_indices[component.fetch_from_archive.archive_component_id])
+			elif component.name in file_step_indices:
+				dependencies.append(file_step_indices[component.name])
+
+		if any(dependency >= index for dependency in dependencies):
+			raise Exception(f"Step {index} ({configure_method_name}) depends on a step that is planned after it.")
+		step_dependencies.append(dependencies)
+
+	return step_dependencies
+
+
+def ensure_import_plan(current_impl: AF_PR_Implementation, include_steps: bool = True):
+	"""Makes sure that the implementation's validity is known and (if include_steps is set) that its import steps have been created.
+	Plans are taken from the cache if the same implementation has been planned before."""
+	if current_impl.is_planned or (current_impl.is_checked and not include_steps):
+		return
+
+	cache_key = get_import_plan_cache_key(current_impl)
+	cache_entry = import_plan_cache.get(cache_key)
+	if cache_entry is not None:
+		plan = cache_entry.value
+	else:
+		plan = create_import_plan(current_impl)
+		import_plan_cache.put(cache_key, plan)
+
+	# The messages from configure() remain, the ones from planning are only added once
+	if not current_impl.is_checked:
+		for kind, text in plan['messages']:
+			current_impl.validation_messages.add().set(kind, text)
+		current_impl.is_valid = plan['is_valid']
+		current_impl.local_directory = plan['local_directory']
+		current_impl.is_checked = True
+
+	if include_steps:
+		current_impl.import_steps.clear()
+		for configure_method_name, arguments, dependencies in plan['steps']:
+			step = current_impl.import_steps.add()
+			getattr(step, configure_method_name)(*arguments)
+			for dependency in dependencies:
+				step.add_dependency(dependency)
+		current_impl.is_planned = True
+
+
+def request_import_plan_check(implementation_name: str):
+	"""Asks for the validity of an implementation to be determined, which is needed to display it in the implementation list.
+	This is safe to call while drawing the UI, the check itself happens right afterwards on a timer."""
+	if implementation_name not in pending_import_plan_checks:
+		pending_import_plan_checks.add(implementation_name)
+		scheduler.scheduler.schedule("import_plan_check", check_requested_import_plans, 0.0)
+
+
+def check_requested_import_plans():
+	af: AF_PR_AssetFetch = bpy.context.window_manager.af
+	implementation_names = list(pending_import_plan_checks)
+	pending_import_plan_checks.clear()
+	for implementation_name in implementation_names:
+		current_impl = af.current_implementation_list.implementations.get(implementation_name)
+		if current_impl is not None:
+			ensure_import_plan(current_impl, include_steps=False)
+	runtime.tag_redraw_all()
+
+
+# Names of the implementations that have been drawn without having been checked yet
+pending_import_plan_checks = set()
+
 
 class AF_OP_BuildImportPlans(bpy.types.Operator):
-	"""Populates every currently loaded implementation with a plan for how to import it, if possible."""
+	"""Populates the currently selected implementation with a plan for how to import it, if possible.
+	Other implementations are only checked for validity once the implementation list shows them (see ensure_import_plan())."""
 
 	# Standard metadata
 	bl_idname = "af.build_import_plans"
 	bl_label = "Build Import Plans"
 	bl_options = {"REGISTER", "INTERNAL"}
 
-	#def __init__(self) -> None:
-	#	self.already_processed_component_ids = set()
-	#	self.current_impl: AF_PR_Implementation = None
-
 	def execute(self, context):
 		af: AF_PR_AssetFetch = bpy.context.window_manager.af
-
-		# Loop over all currently loaded implementations
-		for current_impl in af.current_implementation_list.implementations:
-
-			# Enter try-catch block
-			# Failing this block causes an implementation to be considered unreadable.
-			# If it passes, it is considered readable.
-
-			try:
-
-				# Step 0: Set/create helpful variables
-
-				# Keeps track of which components were already processed.
-				# This becomes an interesting question when recursively resolving dependencies, for example when working with archives.
-				already_processed_component_ids = set()
-
-				# Keeps track of which of the unlocking queries offered by the provider are already scheduled to be called for this implementation.
-				already_scheduled_unlocking_query_ids = set()
-
-				# Other useful shorthands
-				provider_id = af.current_provider_initialization.name
-				asset_id = af.current_asset_list.assets[af.current_asset_list_index].name
-				implementation_id = current_impl.name
-
-				if provider_id == "":
-					raise Exception("No provider ID to create implementation directory.")
-				if asset_id == "":
-					raise Exception("No asset ID to create implementation directory.")
-				if implementation_id == "":
-					raise Exception("No implementation ID to create implementation directory.")
-
-				# We start by assuming that the implementation is valid, has no existing steps and costs nothing.
-				current_impl.is_valid = True
-				current_impl.import_steps.clear()
-
-				# Step 1: Find the implementation directory - Where should all the downloaded files for this implementation be stored?
-
-				# Start with the base directory and append the provider/asset/implementation structure to it
-				local_directory = AF_PR_Preferences.get_prefs().get_current_download_directory()
-				local_directory = os.path.join(local_directory, provider_id)
-				local_directory = os.path.join(local_directory, asset_id)
-				local_directory = os.path.join(local_directory, implementation_id)
-				current_impl.local_directory = local_directory
-
-				# Register the step to create the directory
-				current_impl.import_steps.add().configure_create_directory(current_impl.local_directory)
-
-				# Step 2: Find the relevant unlocking queries - Which unlockings/purchases need to be made with the provider in order to use this implementation?
-				for comp in current_impl.components: 
-					comp: AF_PR_Component
-
-					# Is this a component that requires unlocking?
-					if comp.fetch_download.is_set and comp.fetch_download.unlock_query_id != "":
-
-						unlocking_query_id = comp.fetch_download.unlock_query_id
-
-						# Get the unlocking query that this component is linked to
-						referenced_query = af.current_implementation_list.get_unlock_query_by_id(unlocking_query_id)
-
-						# Test if the query is already unlocked or already scheduled to be unlocked.
-						# Otherwise schedule it.
-						if (not referenced_query.unlocked) and (referenced_query.name not in already_scheduled_unlocking_query_ids):
-
-							# Create new step for performing the unlocking query
-							unlocking_step = current_impl.import_steps.add()
-							unlocking_step.configure_unlock(unlocking_query_id)
-
-							# Add the query id to the set of already scheduled queries
-							already_scheduled_unlocking_query_ids.add(unlocking_query_id)
-
-				# Step 3: Download all files
-				# After the preparations in steps 2 and 3 (if those were even required) the actual file download can now be scheduled.
-				for comp in current_impl.components:
-					if comp.fetch_download.is_set:
-
-						# This schedules the actual file download using the HTTP query that was either there in the first place or
-						# which has been obtained during a previous step.
-						current_impl.import_steps.add().configure_fetch_download(comp.name)
-
-				# Step 4: Extract files from archives
-				# If the implementation makes use of archives for data transfer then the files must be unpacked.
-				# This must happen in proper order to ensure that unpacking works even if the provider is sending nested ZIP files
-				# (Yes, this is actually a thing sometimes!)
-
-				# This list contains all the components that need to be extracted from an archive
-				pending_extraction_comps = []
-				for comp in current_impl.components:
-					# Does the component have the "file_fetch.from_archive" datablock? If yes: Add it to the list
-					if comp.fetch_from_archive.is_set:
-						pending_extraction_comps.append(comp)
-
-				# Work through the list and process the components.
-				# Components are removed from the list afterwards.
-				#
-				while len(pending_extraction_comps) > 0:
-					scheduled_in_this_iteration = 0
-					for pcomp in pending_extraction_comps:
-
-						# Get the target archive component that the current component lists as its source.
-						source_archive_comp_id = pcomp.fetch_from_archive.archive_component_id
-						source_archive_comp = current_impl.get_component_by_id(source_archive_comp_id)
-						if not source_archive_comp:
-							raise Exception(f"Referenced component {source_archive_comp_id} could not be found.")
-
-						if source_archive_comp in pending_extraction_comps:
-							# The target is still pending, we can't schedule with this one yet and need to revisit it during the next iteration.
-							continue
-						else:
-							# The referenced component is not pending (anymore or never in the first place), so we can schedule
-							# the extraction and remove this one from the list of pending components.
-							current_impl.import_steps.add().configure_fetch_from_zip_archive(pcomp.name)
-							pending_extraction_comps.remove(pcomp)
-							scheduled_in_this_iteration += 1
-
-					# Doing a full iteration without being able to schedule a single component indicates that the remaining components are unreachable.
-					# This is a failure state.
-					if scheduled_in_this_iteration < 1:
-						unreachable_components_formatted = ""
-						for pcomp in pending_extraction_comps:
-							unreachable_components_formatted += pcomp.name + " "
-						raise Exception(f"Components {unreachable_components_formatted} could not be resolved in the provided implementation definition.")
-
-				# Step 5: Plan how to import files
-				# "Importing" includes loading the file using Blender's native format handler
-				# and creating or applying loose materials referenced in loose_material.* datablocks
-
-				# This is the list of extensions that should be treated as material maps (if they have the loose_material.define datablock)
-				for comp in current_impl.components:
-
-					# Material maps and HDRIs get a completely separate treatment
-					if comp.handle_loose_material_map.is_set:
-						current_impl.import_steps.add().configure_import_loose_material_map_from_local_path(comp.name)
-						
-
-					elif comp.handle_loose_environment_map.is_set:
-						
-						if comp.format.extension not in ['.exr','.hdr']:
-							raise Exception(f"The addon does not know how to handle HDRI environments with the extension '{comp.format.extension}'.")
-
-						if comp.handle_loose_environment_map.projection != "equirectangular":
-							raise Exception("The addon currently only supports HDRIs with equirectangular projection.")
-
-						current_impl.import_steps.add().configure_import_loose_environment_from_local_path(comp.name)
-
-					# Handle all other files
-					elif comp.handle_native.is_set:
-
-						# OBJ Model
-						if comp.format.extension == ".obj" or comp.format_obj.is_set:
-							current_impl.import_steps.add().configure_import_obj_from_local_path(comp.name)
-
-						# USD Files
-						elif comp.format.extension in [".usd", ".usda", ".usdc", ".usdz"]:
-							current_impl.import_steps.add().configure_import_usd_from_local_path(comp.name)
-
-						# TODO: More extensions to be added here in the future
-
-						else:
-							raise Exception(f"The addon does not know how to actively handle this '{comp.format.extension}'-file using the given metadata.")
-
-			except Exception as e:
-				current_impl.is_valid = False
-				current_impl.validation_messages.add().set("crit", str(e))
-				raise e
+		implementations = af.current_implementation_list.implementations
+		if 0 <= af.current_implementation_list_index < len(implementations):
+			ensure_import_plan(implementations[af.current_implementation_list_index])
 		return {'FINISHED'}
@@ -1,5 +1,5 @@
 import bpy, logging
-from ..util import http
+from ..util import http, pipeline
 from ..util.addon_constants import *
 
 LOGGER = logging.getLogger("af.ops.connection_status")
@@ -32,15 +32,31 @@ class AF_OP_ConnectionStatus(bpy.types.Operator):
 	def execute(self, context):
 		af = bpy.context.window_manager.af
 
+		# Contact the status endpoint in the background
+		LOGGER.info("Refreshing connection status.")
+		query: http.AF_HttpQuery = af.current_provider_initialization.provider_configuration.connection_status_query.to_http_query()
+		pipeline.pipeline.submit("connection_status", query.execute, on_success=AF_OP_ConnectionStatus.apply_response, on_error=AF_OP_ConnectionStatus.apply_error)
+
+		return {'FINISHED'}
+
+	@staticmethod
+	def apply_error(error: Exception):
+		af = bpy.context.window_manager.af
+		af.current_connection_state.state = "connection_error"
+		LOGGER.error(error)
+		pipeline.pipeline.fail("connection_status")
+
+	@staticmethod
+	def apply_response(response: http.AF_HttpResponse):
+		"""Applies the response of the status endpoint (on the main thread)."""
+		af = bpy.context.window_manager.af
+
 		try:
+			was_connected = af.current_connection_state.state == AF_ConnectionState.connected.value
+
 			# Start parsing with the assumption that the connection is OK
 			af.current_connection_state.state = AF_ConnectionState.connected.value
 
-			# Contact initialization endpoint and get the response from the provider
-			LOGGER.info("Refreshing connection status.")
-			query: http.AF_HttpQuery = af.current_provider_initialization.provider_configuration.connection_status_query.to_http_query()
-			response: http.AF_HttpResponse = query.execute()
-
 			# Set user data if available
 			if "user" in response.parsed['data']:
 				af.current_connection_state.user.configure(response.parsed['data']['user'])
@@ -55,8 +71,9 @@ class AF_OP_ConnectionStatus(bpy.types.Operator):
 
 			LOGGER.info("Refreshed connection status.")
 
-		except Exception as e:
-			af.current_connection_state.state = "connection_error"
-			LOGGER.error(e)
+			# The connection has just been established, so the assets can be loaded now (unless that is already happening)
+			if not was_connected and not pipeline.pipeline.is_in_progress("asset_list") and bpy.ops.af.update_asset_list.poll():
+				bpy.ops.af.update_asset_list()
 
-		return {'FINISHED'}
+		except Exception as e:
+			AF_OP_ConnectionStatus.apply_error(e)
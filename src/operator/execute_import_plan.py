@@ -1,19 +1,119 @@
+import concurrent.futures
 import logging
 import random
-from typing import Dict, List, Set
-import zipfile
+import threading
+import time
+from typing import Dict, List, Set, Tuple
 from bpy.types import Context, Event
 import bpy, bpy_extras, uuid, tempfile, os, shutil
 import bpy_extras.image_utils
 
 from ..property.core import *
 from ..util.addon_constants import *
-from ..util import http, material, af_constants, world
+from ..util import http, material, af_constants, world, archive, download, manifest, runtime, store
+from .build_import_plans import ensure_import_plan
 
 # Prepare logging
 LOGGER = logging.getLogger("af.execute_import_plan")
 LOGGER.setLevel(logging.DEBUG)
 
+# Steps which do their work on worker threads and are only started and polled by the operator
+BACKGROUND_ACTIONS = [AF_ImportAction.fetch_download.value, AF_ImportAction.fetch_from_zip_archive.value]
+
+
+def get_component_source(implementation: AF_PR_Implementation, component: AF_PR_Component) -> str:
+	"""Returns a string describing where the file of a component comes from, used to recognize files from earlier imports.
+	For downloads this is the download query, for extracted files it is the source of the archive plus the path inside it."""
+	if component.fetch_download.is_set:
+		return component.fetch_download.download_query.to_http_query().get_fingerprint()
+	if component.fetch_from_archive.is_set:
+		archive_component = implementation.get_component_by_id(component.fetch_from_archive.archive_component_id)
+		return f"{get_component_source(implementation, archive_component)}#{component.fetch_from_archive.component_sub_path}"
+	return ""
+
+
+def create_download_task(implementation: AF_PR_Implementation, component: AF_PR_Component, max_bytes_per_second: float | None = None) -> download.AF_DownloadTask:
+	"""Prepares the download of a component's file into the implementation directory, using the download settings from the preferences.
+	The task still needs to be started. Must be called from the main thread."""
+	query: AF_HttpQuery = component.fetch_download.download_query.to_http_query()
+	destination = os.path.join(implementation.local_directory, component.store.local_file_path)
+
+	# Check the global download store first, if it is enabled
+	prefs = AF_PR_Preferences.get_prefs()
+	download_store = None
+	if prefs.use_download_store:
+		download_store = store.AF_DownloadStore(prefs.download_store_directory)
+
+	return download.AF_DownloadTask(query=query,
+		destination_path=destination,
+		max_segments=prefs.download_segments,
+		min_segment_bytes=prefs.download_segment_min_size * 1024 * 1024,
+		compute_hash=prefs.incremental_import_verify_hash,
+		download_store=download_store,
+		store_key=store.get_store_key(query.get_fingerprint(), component.store.bytes),
+		store_bytes=component.store.bytes,
+		max_bytes_per_second=max_bytes_per_second)
+
+
+def start_speculative_downloads():
+	"""Starts downloading the files of the selected implementation in the background before the user has asked for the import,
+	if this is enabled in the preferences and the implementation is free and known to be small enough.
+	Downloads for implementations that are no longer selected are canceled."""
+	prefs = AF_PR_Preferences.get_prefs()
+	af = bpy.context.window_manager.af
+	implementation_list = af.current_implementation_list
+
+	# Downloads that have finished since the last call are recorded, so that they count as reusable below
+	download.speculative_downloads.record_completed()
+
+	def get_download_components(implementation: AF_PR_Implementation) -> List[AF_PR_Component]:
+		components = []
+		for step in implementation.import_steps:
+			if step.action == AF_ImportAction.fetch_download.value:
+				components.append(implementation.get_component_by_id(step.config['component_id'].value))
+		return components
+
+	# Step 1: Check whether the selected implementation qualifies
+	implementation: AF_PR_Implementation = None
+	if prefs.use_speculative_download and 0 <= af.current_implementation_list_index < len(implementation_list.implementations):
+		implementation = implementation_list.implementations[af.current_implementation_list_index]
+		if not implementation.is_valid or any(s.state == AF_ImportActionState.running.value for s in implementation.import_steps):
+			# Running imports handle their downloads themselves
+			implementation = None
+		elif implementation.get_expected_charges(include_already_paid=False) > 0 or implementation.get_download_size() > prefs.speculative_download_max_size * 1024 * 1024:
+			implementation = None
+		elif any(c.store.bytes <= 0 for c in get_download_components(implementation)):
+			# Files of unknown size could exceed the size limit by any amount
+			implementation = None
+		elif any(c.fetch_download.unlock_query_id != "" for c in get_download_components(implementation)):
+			# Downloads behind an unlocking query only work after the (possibly free) unlock has been performed by the real import
+			implementation = None
+
+	if implementation is None:
+		download.speculative_downloads.cancel_all()
+		return
+
+	# Step 2: Determine the files that aren't present yet
+	implementation_manifest = manifest.AF_ImplementationManifest(implementation.local_directory)
+	wanted_components: Dict[str, AF_PR_Component] = {}
+	for component in get_download_components(implementation):
+		if not implementation_manifest.is_reusable(component.store.local_file_path, get_component_source(implementation, component), component.store.bytes, False):
+			wanted_components[os.path.join(implementation.local_directory, component.store.local_file_path)] = component
+
+	download.speculative_downloads.retain(wanted_components.keys())
+
+	# Step 3: Start the downloads that aren't running yet, sharing the bandwidth limit between them
+	new_components = {path: component for path, component in wanted_components.items() if path not in download.speculative_downloads}
+	max_bytes_per_second = None
+	if prefs.speculative_download_bandwidth > 0 and len(wanted_components) > 0:
+		max_bytes_per_second = prefs.speculative_download_bandwidth * 1024 * 1024 / len(wanted_components)
+
+	for destination, component in new_components.items():
+		LOGGER.info(f"Speculatively downloading {component.name} of implementation {implementation.name}.")
+		os.makedirs(os.path.dirname(destination), exist_ok=True)
+		download.speculative_downloads.add(create_download_task(implementation, component, max_bytes_per_second).start(),
+			implementation.local_directory, component.store.local_file_path, get_component_source(implementation, component))
+
 
 class AF_OP_ExecuteImportPlan(bpy.types.Operator):
 	"""Executes the currently selected import plan which was constructured by the build_import_plans operator.
@@ -39,8 +139,27 @@ class AF_OP_ExecuteImportPlan(bpy.types.Operator):
 		# Calculate the path for the temp directory
 		self.temp_dir: str = os.path.join(tempfile.gettempdir(), "assetfetch-blender-temp-dl")
 
-		# Variable to keep track of ongoing downloads
-		self.ongoing_queries = {}
+		# Variable to keep track of ongoing downloads (component id -> download task running on a worker thread)
+		self.ongoing_downloads: Dict[str, download.AF_DownloadTask] = {}
+
+		# Extractions running in the background (component id -> the extraction of the files from its archive and its path in the archive)
+		# These are either futures on the extraction pool of the runtime or streaming extractions of archives that are still downloading.
+		# All files that are extracted from the same archive at the same time share one extraction.
+		self.ongoing_extractions: Dict[str, Tuple[concurrent.futures.Future | archive.AF_StreamingExtraction, str]] = {}
+
+		# Interrupts all extractions on the extraction pool once the import gets canceled
+		self.extraction_stop_event = threading.Event()
+
+		# Set once the user has asked to cancel the import, which stops running steps at the next opportunity
+		self.cancel_requested = False
+
+		# Record of the files that have been completely written into the implementation directory (loaded in execute())
+		self.manifest: manifest.AF_ImplementationManifest = None
+
+		# Check of the files from earlier imports running on a worker thread (if their hashes are verified) and the speculative downloads
+		# that have been taken over. Both are applied to the steps once the check has finished (see helper_finish_preparation()).
+		self.reuse_check: concurrent.futures.Future | None = None
+		self.adopted_downloads: Dict[str, download.AF_DownloadTask] = {}
 
 		# Lookup for functions to use
 		# This object associates every import action type to its dedicated function
@@ -66,6 +185,213 @@ class AF_OP_ExecuteImportPlan(bpy.types.Operator):
 				target_material = material.get_or_create_material(material_name=link_loose_material_block.material_name, af_namespace=af_namespace)
 				obj.data.materials.append(target_material)
 
+	def helper_get_component_source(self, component: AF_PR_Component) -> str:
+		"""Returns a string describing where the file of a component comes from, used to recognize files from earlier imports.
+		For downloads this is the download query, for extracted files it is the source of the archive plus the path inside it."""
+		return get_component_source(self.implementation, component)
+
+	def helper_get_reuse_candidates(self) -> Dict[str, Tuple[str, int]]:
+		"""Returns the source and expected size of every file that is downloaded or extracted by local path,
+		which is everything manifest.get_reusable_files() needs to check them without accessing Blender's data."""
+		candidates = {}
+		for step in self.implementation.import_steps:
+			if step.action in [AF_ImportAction.fetch_download.value, AF_ImportAction.fetch_from_zip_archive.value]:
+				component = self.implementation.get_component_by_id(step.config['component_id'].value)
+				candidates[component.store.local_file_path] = (self.helper_get_component_source(component), component.store.bytes)
+		return candidates
+
+	def helper_mark_reusable_steps_completed(self, reusable_files: Set[str]):
+		"""Marks all steps as completed whose results are still present in the implementation directory from an earlier import.
+		This covers downloads and extractions of the given reusable files (see helper_get_reuse_candidates()),
+		downloads of archives whose extracted files are all reusable and unlocking queries that are no longer needed."""
+
+		def complete(step: AF_PR_ImplementationImportStep):
+			step.state = AF_ImportActionState.completed.value
+			step.completion = 1.0
+
+		# Reuse files that are already present
+		for step in self.implementation.import_steps:
+			if step.action in [AF_ImportAction.fetch_download.value, AF_ImportAction.fetch_from_zip_archive.value]:
+				component = self.implementation.get_component_by_id(step.config['component_id'].value)
+				if component.store.local_file_path in reusable_files:
+					complete(step)
+
+		# Components that only serve as archives don't need to be fetched if everything that would be extracted from them is already there.
+		# This is repeated until nothing changes to account for nested archives.
+		imported_component_ids = set()
+		extraction_steps_by_archive_id: Dict[str, List[AF_PR_ImplementationImportStep]] = {}
+		for step in self.implementation.import_steps:
+			if step.action == AF_ImportAction.fetch_from_zip_archive.value:
+				component = self.implementation.get_component_by_id(step.config['component_id'].value)
+				extraction_steps_by_archive_id.setdefault(component.fetch_from_archive.archive_component_id, []).append(step)
+			elif "component_id" in step.config and step.action != AF_ImportAction.fetch_download.value:
+				imported_component_ids.add(step.config['component_id'].value)
+
+		found_reusable_archive = True
+		while found_reusable_archive:
+			found_reusable_archive = False
+			for step in self.implementation.import_steps:
+				if step.action not in [AF_ImportAction.fetch_download.value, AF_ImportAction.fetch_from_zip_archive.value]:
+					continue
+				if step.state == AF_ImportActionState.completed.value:
+					continue
+				component_id = step.config['component_id'].value
+				if component_id in imported_component_ids or component_id not in extraction_steps_by_archive_id:
+					continue
+				if all(s.state == AF_ImportActionState.completed.value for s in extraction_steps_by_archive_id[component_id]):
+					complete(step)
+					found_reusable_archive = True
+
+		# Unlocking is not required if all the downloads that depend on it have been skipped
+		for step in self.implementation.import_steps:
+			if step.action == AF_ImportAction.unlock.value:
+				dependent_download_steps = [
+					s for s in self.implementation.import_steps if s.action == AF_ImportAction.fetch_download.value and
+					self.implementation.get_component_by_id(s.config['component_id'].value).fetch_download.unlock_query_id == step.config['query_id'].value
+				]
+				if all(s.state == AF_ImportActionState.completed.value for s in dependent_download_steps):
+					complete(step)
+
+		LOGGER.info(f"Reusing results of {self.implementation.get_completed_step_count()} of {self.implementation.get_step_count()} steps from earlier imports.")
+
+	def helper_adopt_speculative_downloads(self) -> Dict[str, download.AF_DownloadTask]:
+		"""Takes over the downloads that have been started for this implementation before the import (see start_speculative_downloads()).
+		Returns the adopted tasks by component id."""
+		adopted_downloads = {}
+		for step in self.implementation.import_steps:
+			if step.action == AF_ImportAction.fetch_download.value:
+				component = self.implementation.get_component_by_id(step.config['component_id'].value)
+				destination = os.path.join(self.implementation.local_directory, component.store.local_file_path)
+				adopted_download = download.speculative_downloads.adopt(destination, component.fetch_download.download_query.to_http_query())
+				if adopted_download is not None:
+					adopted_downloads[component.name] = adopted_download
+		return adopted_downloads
+
+	def helper_apply_adopted_downloads(self, adopted_downloads: Dict[str, download.AF_DownloadTask]):
+		"""Marks the steps of finished adopted downloads as completed and lets the running ones continue as ongoing downloads."""
+		for step in self.implementation.import_steps:
+			if step.action != AF_ImportAction.fetch_download.value or step.config['component_id'].value not in adopted_downloads:
+				continue
+
+			component_id = step.config['component_id'].value
+			component = self.implementation.get_component_by_id(component_id)
+			adopted_download = adopted_downloads[component_id]
+
+			if step.state == AF_ImportActionState.completed.value:
+				# The file from an earlier import is reused instead
+				adopted_download.cancel()
+			elif adopted_download.is_finished():
+				if adopted_download.completed:
+					self.manifest.record(component.store.local_file_path, self.helper_get_component_source(component), adopted_download.file_hash)
+					step.state = AF_ImportActionState.completed.value
+					step.completion = 1.0
+			else:
+				self.manifest.forget(component.store.local_file_path)
+				self.ongoing_downloads[component_id] = adopted_download
+				step.state = AF_ImportActionState.running.value
+				step.completion = adopted_download.get_completeness()
+
+	def helper_finish_preparation(self, reusable_files: Set[str] | None):
+		"""Applies the results of preparing the import: Steps whose files can be reused (None if incremental import is disabled)
+		are marked as completed and the adopted speculative downloads take over their steps."""
+		if reusable_files is not None:
+			self.helper_mark_reusable_steps_completed(reusable_files)
+		self.helper_apply_adopted_downloads(self.adopted_downloads)
+
+	def helper_cancel_steps(self):
+		"""Stops all steps that are still running on worker threads, without waiting for them on the main thread.
+		Downloads and extractions stop writing to their files after their current chunk. If no step was running, the current step is marked as canceled instead, so that the cancellation is visible."""
+		for ongoing_download in self.ongoing_downloads.values():
+			ongoing_download.cancel()
+		self.ongoing_downloads.clear()
+
+		# The check of files from earlier imports only reads them, so it doesn't need to be waited for.
+		# The downloads adopted for this import haven't been handed to their steps yet.
+		if self.reuse_check is not None:
+			self.reuse_check.cancel()
+			self.reuse_check = None
+			for adopted_download in self.adopted_downloads.values():
+				adopted_download.cancel()
+
+		# Extractions that haven't started yet are dropped, running ones notice the stop event (or their own cancellation, if they are streaming)
+		self.extraction_stop_event.set()
+		for ongoing_extraction, sub_path in self.ongoing_extractions.values():
+			ongoing_extraction.cancel()
+		self.ongoing_extractions.clear()
+
+		for step in self.implementation.import_steps:
+			if step.state == AF_ImportActionState.running.value:
+				step.state = AF_ImportActionState.canceled.value
+
+		if not any(s.state in [AF_ImportActionState.failed.value, AF_ImportActionState.canceled.value] for s in self.implementation.import_steps):
+			current_step = self.implementation.get_current_step()
+			if current_step is not None:
+				current_step.state = AF_ImportActionState.canceled.value
+
+	def helper_run_step(self, step: AF_PR_ImplementationImportStep):
+		"""Runs (or checks on) one step and records its new state."""
+		step_parameters = step.get_config_as_function_parameters()
+		try:
+			step.state = self.step_functions[step.action](**step_parameters).value
+		except Exception as e:
+			step.state = AF_ImportActionState.failed.value
+			raise e
+
+		if step.state == AF_ImportActionState.completed.value:
+			step.completion = 1.0
+		elif step.action == AF_ImportAction.fetch_download.value and step_parameters['component_id'] in self.ongoing_downloads:
+			step.completion = self.ongoing_downloads[step_parameters['component_id']].get_completeness()
+
+		# Raise exception if an unexpected state has been reached.
+		if step.state not in [AF_ImportActionState.running.value, AF_ImportActionState.completed.value]:
+			raise Exception(f"Unexpected state during step {step.action}: {step.state}")
+
+	def helper_run_ready_steps(self) -> bool:
+		"""Advances every step that can make progress.
+		Downloads and extractions are started as soon as their inputs exist and then run on worker threads (downloads up to the parallelism
+		limit set in the preferences). Steps that have to run on the main thread, like importing a file, are run one per call.
+		Returns whether the state of any step has changed."""
+
+		max_parallel_downloads = AF_PR_Preferences.get_prefs().download_parallelism
+		previous_states = [step.state for step in self.implementation.import_steps]
+
+		# Step 1: Check on the steps that are running in the background
+		for step in self.implementation.import_steps:
+			if step.state == AF_ImportActionState.running.value:
+				self.helper_run_step(step)
+
+		# Step 2: Start background steps whose dependencies have been completed
+		# (All extractions that are ready are started together, so that each archive is only read once for all of them)
+		ready_steps = self.implementation.get_ready_steps()
+		ready_extraction_steps = [step for step in ready_steps if step.action == AF_ImportAction.fetch_from_zip_archive.value]
+		if len(ready_extraction_steps) > 0:
+			try:
+				self.helper_start_extractions([step.config['component_id'].value for step in ready_extraction_steps])
+			except Exception as e:
+				for step in ready_extraction_steps:
+					step.state = AF_ImportActionState.failed.value
+				raise e
+			for step in ready_extraction_steps:
+				step.state = AF_ImportActionState.running.value
+
+		for step in ready_steps:
+			if step.action not in BACKGROUND_ACTIONS or step.action == AF_ImportAction.fetch_from_zip_archive.value:
+				continue
+			if step.action == AF_ImportAction.fetch_download.value and len(self.ongoing_downloads) >= max_parallel_downloads:
+				continue
+			self.helper_run_step(step)
+
+		# Step 3: Start extracting files from archives that are still being downloaded
+		self.helper_start_streaming_extractions()
+
+		# Step 4: Run the next ready step that needs the main thread
+		for step in ready_steps:
+			if step.action not in BACKGROUND_ACTIONS:
+				self.helper_run_step(step)
+				break
+
+		return previous_states != [step.state for step in self.implementation.import_steps]
+
 	# STEP FUNCTIONS
 
 	def step_unlock(self, query_id: str) -> AF_ImportActionState:
@@ -74,6 +400,10 @@ class AF_OP_ExecuteImportPlan(bpy.types.Operator):
 		query: http.AF_HttpQuery = unlock_query.query.to_http_query()
 		response = query.execute(raise_for_status=True)
 		unlock_query.unlocked = True
+
+		# Cached implementation lists still show the asset as locked
+		from .update_implementations_list import forget_implementation_lists
+		forget_implementation_lists(self.asset_id)
 		return AF_ImportActionState.completed
 
 	def step_create_directory(self, directory: str) -> AF_ImportActionState:
@@ -81,72 +411,138 @@ class AF_OP_ExecuteImportPlan(bpy.types.Operator):
 		os.makedirs(directory, exist_ok=True)
 		return AF_ImportActionState.completed
 
-	def step_fetch_download(self, component_id: str, max_runtime: float = 2.0) -> AF_ImportActionState:
+	def step_fetch_download(self, component_id: str) -> AF_ImportActionState:
 		""" Download the asset file.
-		This code below downloads the asset and places it in its desired location
 		The operator can't run continuously for a long period, it has to "check in" with Blender to prevent the
-		application from timing out. Therefore the download is performed in chunks which is reflected in the
-		two scenarios outlined in the code. """
+		application from timing out. Therefore the download itself runs on a worker thread (see util/download.py)
+		and this function only starts it or reports on its progress, which is reflected in the two scenarios outlined in the code. """
 
 		component = self.implementation.get_component_by_id(component_id)
 
-		# Scenario 1: The download is ongoing and may or may not finish during this iteration
-		if (component_id in self.ongoing_queries):
-			current_query = self.ongoing_queries[component_id]
-			ongoing = current_query.execute_as_file_piecewise_next_chunk()
-			if ongoing:
-				self.implementation.get_current_step().completion = current_query.get_download_completeness()
+		# Scenario 1: The download is ongoing and may or may not have finished since the last check
+		if (component_id in self.ongoing_downloads):
+			current_download = self.ongoing_downloads[component_id]
+			current_download.raise_for_error()
+
+			if not current_download.is_finished():
 				return AF_ImportActionState.running
 			else:
-				current_query.execute_as_file_piecewise_finish()
+				del self.ongoing_downloads[component_id]
+
+				# A download that was canceled (or stopped for another reason) has left an incomplete file behind, which must not be recorded
+				if not current_download.completed:
+					raise Exception(f"Download of {component.store.local_file_path} ended before it was completed.")
+				self.manifest.record(component.store.local_file_path, self.helper_get_component_source(component), current_download.file_hash)
 				return AF_ImportActionState.completed
 
 		# Scenario 2: The download hasn't been started yet and must be started
 		else:
-			# Prepare query
-			query: AF_HttpQuery = component.fetch_download.download_query.to_http_query()
-
-			# Determine target path
-			destination = os.path.join(self.implementation.local_directory, component.store.local_file_path)
-
-			# Initialize the query
-			query.execute_as_file_piecewise_start(destination_path=destination)
+			# The file is about to be overwritten, so it can't be considered complete anymore
+			self.manifest.forget(component.store.local_file_path)
 
-			# Register the query as an ongoing query
-			self.ongoing_queries[component_id] = query
+			# Start the download and register it as an ongoing download
+			self.ongoing_downloads[component_id] = create_download_task(self.implementation, component).start()
 			return AF_ImportActionState.running
 
-	def step_fetch_from_zip_archive(self, component_id: str) -> AF_ImportActionState:
-		"""Fetches a component from the ZIP archive that it references in its file_fetch.from_archive datablock."""
-
-		# Find the participating components
-		file_component = self.implementation.get_component_by_id(component_id)
-		zip_component = self.implementation.get_component_by_id(file_component.fetch_from_archive.archive_component_id)
-
-		# Build the relevant paths
-		# Path to the source zip file. This is were the previous step has downloaded it to.
-		source_zip_file_path = os.path.join(self.implementation.local_directory, zip_component.store.local_file_path)
+	def helper_start_extractions(self, component_ids: List[str]):
+		"""Starts extracting the files of the given components in the background.
+		The files are grouped by their archive, which is then opened only once to extract all of them (see util/archive.py)."""
+		prefs = AF_PR_Preferences.get_prefs()
+
+		# Source zip file path -> (component id, path inside the archive, destination path)
+		extractions_by_archive: Dict[str, List[Tuple[str, str, str]]] = {}
+		for component_id in component_ids:
+			file_component = self.implementation.get_component_by_id(component_id)
+			zip_component = self.implementation.get_component_by_id(file_component.fetch_from_archive.archive_component_id)
+
+			# Path to the source zip file. This is were the previous step has downloaded it to.
+			source_zip_file_path = os.path.join(self.implementation.local_directory, zip_component.store.local_file_path)
+
+			# This is the final path where the file needs to end up
+			destination_file_path = os.path.join(self.implementation.local_directory, file_component.store.local_file_path)
+			self.manifest.forget(file_component.store.local_file_path)
+
+			extractions_by_archive.setdefault(source_zip_file_path, []).append((component_id, file_component.fetch_from_archive.component_sub_path, destination_file_path))
+
+		for source_zip_file_path, extractions in extractions_by_archive.items():
+			ongoing_extraction = runtime.runtime.get_executor("extraction").submit(archive.extract_members,
+				source_zip_file_path, [(sub_path, destination_file_path) for component_id, sub_path, destination_file_path in extractions],
+				max_workers=prefs.extraction_parallelism,
+				compute_hash=prefs.incremental_import_verify_hash,
+				stop_event=self.extraction_stop_event)
+			for component_id, sub_path, destination_file_path in extractions:
+				self.ongoing_extractions[component_id] = (ongoing_extraction, sub_path)
+
+	def helper_start_streaming_extractions(self):
+		"""Starts extracting files from archives while they are still being downloaded, if this is enabled in the preferences.
+		This applies to all pending extractions whose only unfinished dependency is the download of their archive.
+		Every file is handed to the steps depending on it as soon as it has been extracted (see archive.AF_StreamingExtraction)."""
+		prefs = AF_PR_Preferences.get_prefs()
+		if not prefs.use_streaming_extraction or len(self.ongoing_downloads) == 0:
+			return
+
+		steps = self.implementation.import_steps
+		download_step_indices = {step.config['component_id'].value: index for index, step in enumerate(steps) if step.action == AF_ImportAction.fetch_download.value}
+
+		# Archive component id -> extraction steps waiting for its download
+		extraction_steps_by_archive_id: Dict[str, List[AF_PR_ImplementationImportStep]] = {}
+		for step in steps:
+			if step.action != AF_ImportAction.fetch_from_zip_archive.value or step.state != AF_ImportActionState.pending.value:
+				continue
+			file_component = self.implementation.get_component_by_id(step.config['component_id'].value)
+			archive_component_id = file_component.fetch_from_archive.archive_component_id
+			if archive_component_id not in self.ongoing_downloads:
+				continue
+			if all(steps[i].state == AF_ImportActionState.completed.value or i == download_step_indices[archive_component_id] for i in step.get_dependency_indices()):
+				extraction_steps_by_archive_id.setdefault(archive_component_id, []).append(step)
+
+		for archive_component_id, extraction_steps in extraction_steps_by_archive_id.items():
+			archive_download = self.ongoing_downloads[archive_component_id]
+
+			extraction_requests = []
+			for step in extraction_steps:
+				file_component = self.implementation.get_component_by_id(step.config['component_id'].value)
+				self.manifest.forget(file_component.store.local_file_path)
+				extraction_requests.append((file_component.fetch_from_archive.component_sub_path, os.path.join(self.implementation.local_directory, file_component.store.local_file_path)))
+
+			streaming_extraction = archive.AF_StreamingExtraction(archive_download.destination_path,
+				extraction_requests,
+				get_available_bytes=archive_download.get_contiguous_bytes,
+				is_download_finished=archive_download.is_finished,
+				is_download_completed=lambda archive_download=archive_download: archive_download.completed,
+				max_workers=prefs.extraction_parallelism,
+				compute_hash=prefs.incremental_import_verify_hash).start()
+
+			for step, (sub_path, destination_file_path) in zip(extraction_steps, extraction_requests):
+				self.ongoing_extractions[step.config['component_id'].value] = (streaming_extraction, sub_path)
+				step.state = AF_ImportActionState.running.value
 
-		# This is the path of the target file inside its parent zip
-		source_zip_sub_path = file_component.fetch_from_archive.component_sub_path
-
-		# This is the final path where the file needs to end up
-		destination_file_path = os.path.join(self.implementation.local_directory, file_component.store.local_file_path)
-
-		with zipfile.ZipFile(source_zip_file_path, 'r') as zip_ref:
-			# Check if the specified file exists in the zip archive
-			if source_zip_sub_path not in zip_ref.namelist():
-				raise Exception(f"File '{source_zip_sub_path}' not found in the zip archive.")
-
-			# Actually run the extraction
-			with zip_ref.open(source_zip_sub_path) as source_file:
-				# Write the content to the new location with a new name
-				with open(destination_file_path, 'wb') as destination_file:
-					shutil.copyfileobj(source_file, destination_file)
+	def step_fetch_from_zip_archive(self, component_id: str) -> AF_ImportActionState:
+		"""Fetches a component from the ZIP archive that it references in its file_fetch.from_archive datablock.
+		Like downloads, the extraction runs on a worker thread and this function only starts it or checks whether it has finished."""
+
+		# Scenario 1: The extraction is ongoing and may or may not have finished since the last check
+		if component_id in self.ongoing_extractions:
+			ongoing_extraction, sub_path = self.ongoing_extractions[component_id]
+			if isinstance(ongoing_extraction, archive.AF_StreamingExtraction):
+				# The file may be ready long before the rest of the archive
+				ongoing_extraction.raise_for_error()
+				file_hashes = ongoing_extraction.get_completed_members()
+				if sub_path not in file_hashes:
+					return AF_ImportActionState.running
+			elif ongoing_extraction.done():
+				file_hashes = ongoing_extraction.result()
+			else:
+				return AF_ImportActionState.running
 
-			LOGGER.info(f"File '{source_zip_sub_path}' extracted successfully to '{destination_file_path}'.")
+			del self.ongoing_extractions[component_id]
+			file_component = self.implementation.get_component_by_id(component_id)
+			self.manifest.record(file_component.store.local_file_path, self.helper_get_component_source(file_component), file_hashes[sub_path])
+			return AF_ImportActionState.completed
 
-		return AF_ImportActionState.completed
+		# Scenario 2: The extraction must be started
+		self.helper_start_extractions([component_id])
+		return AF_ImportActionState.running
 
 	def step_import_usd_from_local_path(self, component_id: str) -> AF_ImportActionState:
 		"""Imports a USD file."""
@@ -222,62 +618,91 @@ class AF_OP_ExecuteImportPlan(bpy.types.Operator):
 		for a in context.screen.areas:
 			a.tag_redraw()
 
-		# Find the next step that needs work
-		current_step: AF_PR_ImplementationImportStep = self.implementation.get_current_step()
+		# Nothing left to do. Finish.
+		if self.implementation.all_steps_completed():
+			if bpy.ops.af.connection_status.poll():
+				bpy.ops.af.connection_status()
+			return {'FINISHED'}
 
-		if current_step is not None:
+		# Cancel the ongoing import process if ESC is pressed
+		if event.type in {'ESC'}:
+			self.cancel_requested = True
+		if self.cancel_requested:
+			self.helper_cancel_steps()
+			print("USER_CANCEL")
+			return {'CANCELLED'}
 
-			# Cancel the ongoing import process if ESC is pressed
-			if event.type in {'ESC'}:
-				current_step.state = AF_ImportActionState.canceled.value
-				print("USER_CANCEL")
-				return {'CANCELLED'}
+		# Steps are only run on timer events, other events (like mouse movement) must not use up the time budget again
+		if event.type != 'TIMER':
+			return {'RUNNING_MODAL'}
 
-			# Cancel the ongoing import if the current step is already marked as canceled or failed
-			# This mostly exists as a fallback because ideally the error would already be detected during execution and
-			# then canceled immediately.
-			if current_step.state in [AF_ImportActionState.failed.value, AF_ImportActionState.canceled.value]:
-				print(f"AUTO_CANCEL because {current_step.state}")
+		# Cancel the ongoing import if a step is already marked as canceled or failed
+		# This mostly exists as a fallback because ideally the error would already be detected during execution and
+		# then canceled immediately.
+		for step in self.implementation.import_steps:
+			if step.state in [AF_ImportActionState.failed.value, AF_ImportActionState.canceled.value]:
+				print(f"AUTO_CANCEL because {step.state}")
+				self.helper_cancel_steps()
 				return {'CANCELLED'}
 
-			# Actually run the function for the current step
+		# Wait for the check of the files from earlier imports (see execute())
+		if self.reuse_check is not None:
+			if not self.reuse_check.done():
+				return {'RUNNING_MODAL'}
 			try:
-				current_step.state = (self.step_functions[current_step.action](**current_step.get_config_as_function_parameters())).value
+				reusable_files = self.reuse_check.result()
 			except Exception as e:
-				current_step.state = AF_ImportActionState.failed.value
-
-				# Cancel ongoing queries in case of failure to avoid orphaned file locks.
-				for q in self.ongoing_queries.values():
-					q.execute_as_file_piecewise_finish()
+				LOGGER.warning(f"Could not check the files from earlier imports, none of them will be reused: {e}")
+				reusable_files = set()
+			self.reuse_check = None
+			self.helper_finish_preparation(reusable_files)
+
+		# Actually run all steps that can make progress.
+		# This is repeated until nothing changes anymore, the time budget for this tick has been used up or the import has been canceled,
+		# at which point control is given back to Blender to keep the UI responsive and to receive ESC.
+		tick_deadline = time.perf_counter() + AF_PR_Preferences.get_prefs().import_tick_budget / 1000
+		try:
+			while self.helper_run_ready_steps() and time.perf_counter() < tick_deadline and not self.cancel_requested and not self.implementation.all_steps_completed():
+				pass
+		except Exception as e:
+			# Cancel ongoing downloads and extractions in case of failure to avoid orphaned file locks.
+			self.helper_cancel_steps()
+			raise e
 
-				raise e
+		return {'RUNNING_MODAL'}
 
-			# Raise exception if an unexpected state has been reached.
-			if current_step.state not in [
-				AF_ImportActionState.running.value, AF_ImportActionState.completed.value, AF_ImportActionState.failed.value, AF_ImportActionState.canceled.value
-			]:
-				raise Exception(f"Unexpected state during current step: {current_step.state}")
+	def execute(self, context):
 
-			return {'RUNNING_MODAL'}
+		prefs = AF_PR_Preferences.get_prefs()
+		incremental_import = prefs.incremental_import
 
-		else:
-			# Nothing left to do. Finish.
-			if bpy.ops.af.connection_status.poll():
-				bpy.ops.af.connection_status()
-			return {'FINISHED'}
+		# The plan is normally built when the implementation gets selected
+		ensure_import_plan(self.implementation)
 
-	def execute(self, context):
+		# Files that have already been downloaded (or are still being downloaded) speculatively are taken over
+		adopted_downloads = self.helper_adopt_speculative_downloads()
+		self.adopted_downloads = adopted_downloads
 
-		# Clear the local implementation_directory
+		# Clear the local implementation_directory, unless files from earlier imports should be reused.
+		# Partial downloads from earlier attempts are kept in any case so that they can be resumed.
 		try:
-			if os.path.exists(self.implementation.local_directory):
-				shutil.rmtree(self.implementation.local_directory)
+			if os.path.exists(self.implementation.local_directory) and not incremental_import:
+				download.clear_directory_except_partial_downloads(self.implementation.local_directory, keep_paths=[d.destination_path for d in adopted_downloads.values()])
 			os.makedirs(self.implementation.local_directory, exist_ok=True)
 		except Exception as e:
 			LOGGER.error(f"Error while clearing local implementation directory: {e}")
 
-		# Reset the state of the implementation
+		self.manifest = manifest.AF_ImplementationManifest(self.implementation.local_directory)
+
+		# Reset the state of the implementation and find the files that can be reused.
+		# Verifying their hashes means reading all of them, which happens on a worker thread while the modal operator is already running.
 		self.implementation.reset_state()
+		if incremental_import and prefs.incremental_import_verify_hash:
+			self.reuse_check = runtime.runtime.get_executor("extraction").submit(self.manifest.get_reusable_files, self.helper_get_reuse_candidates(), True)
+		elif incremental_import:
+			self.helper_finish_preparation(self.manifest.get_reusable_files(self.helper_get_reuse_candidates(), False))
+		else:
+			self.helper_finish_preparation(None)
 
 		# Set up modal operation
 		self._timer = context.window_manager.event_timer_add(0.125, window=context.window)
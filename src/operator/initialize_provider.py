@@ -2,9 +2,11 @@ import logging
 import bpy
 
 from ..property.templates import AF_VariableQueryUpdateTarget
-from ..util import http
+from ..util import http, pipeline, runtime, scheduler, validation
 from ..property.preferences import *
 from ..property.core import *
+from .update_asset_list import AF_OP_UpdateAssetList
+from .update_implementations_list import implementation_list_cache, implementation_list_prefetcher
 
 LOGGER = logging.getLogger("af.ops.initialize_provider")
 LOGGER.setLevel(logging.DEBUG)
@@ -41,11 +43,44 @@ class AF_OP_InitializeProvider(bpy.types.Operator):
 		if 'current_implementation_list_index' in af:
 			af['current_implementation_list_index'] = 0
 
-		try:
-			# Contact initialization endpoint and get the response
-			query = http.AF_HttpQuery(uri=af.current_init_url, method="get")
-			response: http.AF_HttpResponse = query.execute()
+		# The provider's headers are about to be replaced
+		http.invalidate_provider_session_headers()
+
+		# Responses from this provider have not been validated yet
+		validation.registry.reset_validated_kinds()
+
+		# Results of queries to the previous provider must not be applied anymore
+		for key in ["connection_status", "asset_list", "implementation_list"]:
+			runtime.runtime.invalidate(key)
+		pipeline.pipeline.begin()
+
+		# Cached implementation lists belong to the previous provider (or its credentials)
+		implementation_list_cache.clear()
+		implementation_list_prefetcher.cancel_all()
 
+		# Contact initialization endpoint in the background
+		query = http.AF_HttpQuery(uri=af.current_init_url, method="get")
+		query.enable_response_cache()
+		af.current_provider_initialization.is_loading = True
+		pipeline.pipeline.submit("initialization", query.execute, on_success=AF_OP_InitializeProvider.apply_response, on_error=AF_OP_InitializeProvider.apply_error)
+
+		return {'FINISHED'}
+
+	@staticmethod
+	def apply_error(error: Exception):
+		af: AF_PR_AssetFetch = bpy.context.window_manager.af
+		af.current_provider_initialization.is_loading = False
+		af.current_connection_state.state = "connection_error"
+		LOGGER.error(f"Initialization failed: {error}")
+		pipeline.pipeline.fail("initialization")
+
+	@staticmethod
+	def apply_response(response: http.AF_HttpResponse):
+		"""Applies the response of the initialization endpoint (on the main thread)."""
+		af: AF_PR_AssetFetch = bpy.context.window_manager.af
+		af.current_provider_initialization.is_loading = False
+
+		try:
 			# Set the provider id
 			if "id" in response.parsed:
 				af.current_provider_initialization.name = response.parsed['id']
@@ -79,6 +114,9 @@ class AF_OP_InitializeProvider(bpy.types.Operator):
 							target_header = af.current_provider_initialization.provider_configuration.headers.get(pref_header.name)
 							if target_header is not None:
 								target_header.value = pref_header.value
+
+						# The status check below already uses these values, so the debounced update triggered by setting them is not needed
+						scheduler.scheduler.cancel("provider_header")
 				else:
 					# If no headers are required, assume that the connection exists now.
 					af.current_connection_state.state = "connected"
@@ -98,12 +136,16 @@ class AF_OP_InitializeProvider(bpy.types.Operator):
 				raise Exception("No Asset List Query!")
 
 			# Perform a connection status check, if the provider has offered an endpoint for it.
-			if bpy.ops.af.connection_status.poll():
+			can_check_connection_status = bpy.ops.af.connection_status.poll()
+			if can_check_connection_status:
 				LOGGER.debug("Getting connection status...")
 				bpy.ops.af.connection_status()
 
-		except Exception as e:
-			af.current_connection_state.state = "connection_error"
-			raise e
+			# The asset list is queried at the same time, unless the provider is still waiting for the user to fill in headers.
+			# If the headers have been filled in from a bookmark the connection is not confirmed yet,
+			# but the refresh pipeline holds the asset list back until the status check has succeeded.
+			if af.current_connection_state.state == "connected" or can_check_connection_status:
+				AF_OP_UpdateAssetList.start_query()
 
-		return {'FINISHED'}
+		except Exception as e:
+			AF_OP_InitializeProvider.apply_error(e)
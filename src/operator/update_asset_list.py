@@ -1,7 +1,7 @@
 import logging
 import bpy, os, shutil, tempfile, uuid
 
-from ..util import http
+from ..util import http, pipeline
 from ..ui import AF_PT_AssetPanel
 
 LOGGER = logging.getLogger("af.ops.update_asset_list")
@@ -21,12 +21,52 @@ class AF_OP_UpdateAssetList(bpy.types.Operator):
 		return af.current_connection_state.state == "connected"
 
 	def execute(self, context):
+		AF_OP_UpdateAssetList.start_query()
+		return {'FINISHED'}
+
+	@staticmethod
+	def start_query():
+		"""Sends the asset list query in the background.
+		This does not check whether the provider is connected, so that the query can already be sent while the connection status is still being checked.
+		The refresh pipeline only applies the result once that check has succeeded."""
 		af = bpy.context.window_manager.af
 
-		# Contact asset list endpoint
-		response = af.current_provider_initialization.asset_list_query.to_http_query().execute()
+		# An implementation list that is still being loaded belongs to the old list and becomes irrelevant
+		pipeline.pipeline.supersede("implementation_list")
+		af.current_implementation_list.is_loading = False
+
+		# Contact asset list endpoint in the background
+		query = af.current_provider_initialization.asset_list_query.to_http_query()
+		query.enable_response_cache()
+		af.current_asset_list.is_loading = True
+		pipeline.pipeline.submit("asset_list",
+			query.execute,
+			on_success=AF_OP_UpdateAssetList.apply_response,
+			on_error=AF_OP_UpdateAssetList.apply_error,
+			on_discard=AF_OP_UpdateAssetList.discard_response)
+
+	@staticmethod
+	def apply_error(error: Exception):
+		af = bpy.context.window_manager.af
+		af.current_asset_list.is_loading = False
+		LOGGER.error(f"Could not load the asset list: {error}")
+		pipeline.pipeline.fail("asset_list")
 
-		# Save assets in blender properties
+	@staticmethod
+	def discard_response():
+		af = bpy.context.window_manager.af
+		af.current_asset_list.is_loading = False
+
+	@staticmethod
+	def apply_response(response: http.AF_HttpResponse):
+		"""Saves the assets in blender properties (on the main thread) and loads the implementations of the first asset."""
+		af = bpy.context.window_manager.af
+		af.current_asset_list.is_loading = False
 		af.current_asset_list.configure(response.parsed)
 
-		return {'FINISHED'}
+		# configure() has selected the first asset without triggering the update for the selection, so its implementations are loaded here.
+		# The index is reset without triggering its update, which would plan (and speculatively download) the previous asset's implementations.
+		# Planning happens once the new implementation list has been applied.
+		af['current_implementation_list_index'] = 0
+		if bpy.ops.af.update_implementations_list.poll():
+			bpy.ops.af.update_implementations_list()
@@ -1,6 +1,80 @@
+import json
+import logging
+from typing import Dict
 import bpy
 from bpy.types import Context
 
+from ..property.preferences import AF_PR_Preferences
+from ..util import http, pipeline
+from ..util.cache import AF_LruCache
+from ..util.prefetch import AF_Prefetcher
+from .execute_import_plan import start_speculative_downloads
+
+LOGGER = logging.getLogger("af.ops.update_implementations_list")
+LOGGER.setLevel(logging.DEBUG)
+
+# Parsed implementation lists of recently selected assets (the size is taken from the preferences before every use)
+implementation_list_cache = AF_LruCache(max_entries=64)
+
+# Fetches the implementation lists of neighbouring assets into the cache (the budget is taken from the preferences before every use)
+implementation_list_prefetcher = AF_Prefetcher()
+
+
+def get_implementation_list_cache_key(asset_id: str, query: http.AF_HttpQuery) -> str:
+	"""Identifies an implementation list by the asset it belongs to and the query (including all parameter values) used to fetch it."""
+	return json.dumps([asset_id, query.get_fingerprint()])
+
+
+def forget_implementation_lists(asset_id: str):
+	"""Drops all cached (and prefetched) implementation lists of an asset, for example after one of its implementations has been unlocked.
+	Otherwise the cached lists would show the asset as locked again."""
+	implementation_list_cache.remove_matching(lambda cache_key: json.loads(cache_key)[0] == asset_id)
+
+	# Prefetches that are still running may have been sent before the unlock
+	implementation_list_prefetcher.cancel_all()
+
+	af = bpy.context.window_manager.af
+	for asset in af.current_asset_list.assets:
+		if asset.name == asset_id:
+			query = asset.implementation_list_query.to_http_query()
+			query.enable_response_cache()
+			query.forget_cached_response()
+
+
+def prefetch_neighbouring_implementation_lists():
+	"""Fetches the implementation lists of the assets around the selected one in the background, nearest first.
+	This way the next asset in the list can usually be shown without waiting for the provider."""
+	prefs = AF_PR_Preferences.get_prefs()
+	if not prefs.use_implementation_list_prefetch:
+		return
+
+	af = bpy.context.window_manager.af
+	assets = af.current_asset_list.assets
+	selected_index = af.current_asset_list_index
+	implementation_list_prefetcher.budget.configure(prefs.implementation_list_prefetch_rate, burst=2 * prefs.implementation_list_prefetch_count)
+
+	# Step 1: Determine the neighbours whose lists are not cached (or outdated)
+	wanted_queries: Dict[str, http.AF_HttpQuery] = {}
+	for distance in range(1, prefs.implementation_list_prefetch_count + 1):
+		for neighbour_index in [selected_index + distance, selected_index - distance]:
+			if neighbour_index < 0 or neighbour_index >= len(assets):
+				continue
+			neighbour = assets[neighbour_index]
+			query = neighbour.implementation_list_query.to_http_query()
+			cache_key = get_implementation_list_cache_key(neighbour.name, query)
+			cache_entry = implementation_list_cache.peek(cache_key)
+			if cache_entry is None or cache_entry.get_age() >= prefs.implementation_list_cache_ttl:
+				wanted_queries[cache_key] = query
+
+	# Step 2: Drop queued prefetches for assets that are no longer close to the selection
+	implementation_list_prefetcher.retain(wanted_queries.keys())
+
+	# Step 3: Prefetch as many lists as the request budget allows
+	for cache_key, query in wanted_queries.items():
+		query.enable_response_cache()
+		if not implementation_list_prefetcher.prefetch(cache_key, query.execute, lambda response, cache_key=cache_key: implementation_list_cache.put(cache_key, response.parsed)):
+			break
+
 
 class AF_OP_UpdateImplementationsList(bpy.types.Operator):
 	"""Updates the list of implementations for the currently selected asset. Also invokes import plan building."""
@@ -24,18 +98,91 @@ class AF_OP_UpdateImplementationsList(bpy.types.Operator):
 	def execute(self, context):
 		af = bpy.context.window_manager.af
 		current_asset = af.current_asset_list.assets[af.current_asset_list_index]
+		query = current_asset.implementation_list_query.to_http_query()
+		cache_key = get_implementation_list_cache_key(current_asset.name, query)
+
+		# A query for a previously selected asset must not overwrite the list anymore
+		pipeline.pipeline.supersede("implementation_list")
 
-		# Contact implementations endpoint
-		response = current_asset.implementation_list_query.to_http_query().execute()
+		# Serve the list from the cache if possible and refresh it in the background if it is older than the configured TTL
+		prefs = AF_PR_Preferences.get_prefs()
+		implementation_list_cache.set_max_entries(prefs.implementation_list_cache_size)
+		cache_entry = implementation_list_cache.get(cache_key)
+		if cache_entry is not None:
+			LOGGER.debug(f"Using cached implementation list for {current_asset.name}.")
+			if cache_entry.get_age() < prefs.implementation_list_cache_ttl:
+				pipeline.pipeline.run("implementation_list", lambda: AF_OP_UpdateImplementationsList.apply_implementation_list(cache_entry.value))
+				prefetch_neighbouring_implementation_lists()
+				return {'FINISHED'}
+
+			# The outdated list is applied right away, because starting the revalidation below restarts the stage and would drop a deferred apply
+			AF_OP_UpdateImplementationsList.apply_implementation_list(cache_entry.value)
+			is_revalidation = True
+		else:
+			af.current_implementation_list.is_loading = True
+			is_revalidation = False
+
+		on_success = lambda response: AF_OP_UpdateImplementationsList.apply_response(response, cache_key, is_revalidation)
+
+		# Use the result of a prefetch for this list that is already running, instead of sending the same query again
+		if implementation_list_prefetcher.is_pending(cache_key):
+			complete, fail = pipeline.pipeline.track("implementation_list", on_success, AF_OP_UpdateImplementationsList.apply_error, AF_OP_UpdateImplementationsList.discard_response)
+			if implementation_list_prefetcher.take_over(cache_key, complete, fail):
+				LOGGER.debug(f"Using the running prefetch of the implementation list for {current_asset.name}.")
+				prefetch_neighbouring_implementation_lists()
+				return {'FINISHED'}
+
+		# Contact implementations endpoint in the background
+		query.enable_response_cache()
+		pipeline.pipeline.submit("implementation_list",
+			query.execute,
+			on_success=on_success,
+			on_error=AF_OP_UpdateImplementationsList.apply_error,
+			on_discard=AF_OP_UpdateImplementationsList.discard_response)
+
+		prefetch_neighbouring_implementation_lists()
+
+		return {'FINISHED'}
+
+	@staticmethod
+	def apply_error(error: Exception):
+		af = bpy.context.window_manager.af
+		af.current_implementation_list.is_loading = False
+		LOGGER.error(f"Could not load the implementation list: {error}")
+		pipeline.pipeline.fail("implementation_list")
+
+	@staticmethod
+	def discard_response():
+		af = bpy.context.window_manager.af
+		af.current_implementation_list.is_loading = False
+
+	@staticmethod
+	def apply_response(response: http.AF_HttpResponse, cache_key: str, is_revalidation: bool):
+		"""Stores the response in the cache and loads it into the implementation list (on the main thread).
+		If the response only refreshes a cached list that is already displayed and nothing has changed, the list is left alone."""
+		previous_entry = implementation_list_cache.peek(cache_key)
+		implementation_list_cache.put(cache_key, response.parsed)
+
+		if is_revalidation and previous_entry is not None and previous_entry.value == response.parsed:
+			LOGGER.debug("Cached implementation list is still up to date.")
+			return
+
+		AF_OP_UpdateImplementationsList.apply_implementation_list(response.parsed)
+
+	@staticmethod
+	def apply_implementation_list(implementation_list: Dict):
+		"""Loads the parsed implementation list into blender properties and builds the import plans."""
+		af = bpy.context.window_manager.af
 
 		# Converting the json response into blender bpy data
 		if "current_implementation_list" in af:
 			af['current_implementation_list'].clear()
 
 		# Load the data into the implementation_list
-		af.current_implementation_list.configure(response.parsed)
+		af.current_implementation_list.configure(implementation_list)
 
 		# Update import plans
-		bpy.ops.af.build_import_plans()
+		pipeline.pipeline.run("import_plans", lambda: bpy.ops.af.build_import_plans())
 
-		return {'FINISHED'}
+		# Start downloading the selected implementation early, if that is enabled
+		start_speculative_downloads()
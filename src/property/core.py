@@ -1,4 +1,7 @@
+import hashlib
+import json
 import logging
+from typing import List
 import bpy, os
 
 from .updates import *
@@ -18,6 +21,9 @@ class AF_PR_ProviderInitialization(bpy.types.PropertyGroup):
 	provider_configuration: bpy.props.PointerProperty(type=AF_PR_ProviderConfigurationBlock)
 	#user: bpy.props.PointerProperty(type=AF_PR_UserBlock)
 
+	# Whether the initialization query is currently running in the background
+	is_loading: bpy.props.BoolProperty(default=False)
+
 
 class AF_PR_ConnectionStatus(bpy.types.PropertyGroup):
 	"""Stores data about the current connection status."""
@@ -37,6 +43,12 @@ class AF_PR_Asset(bpy.types.PropertyGroup):
 			return self.text.title
 		return self.name
 
+	def get_thumbnail_uri(self, target_resolution: int) -> str | None:
+		"""Returns the URI of the thumbnail closest to the target resolution, if the asset has a thumbnail."""
+		if self.preview_image_thumbnail.is_set and len(self.preview_image_thumbnail.uris) > 0:
+			return self.preview_image_thumbnail.get_optimal_resolution_uri(target_resolution)
+		return None
+
 
 class AF_PR_AssetList(bpy.types.PropertyGroup):
 	"""Stores data about a list of assets (AF_PR_Asset)."""
@@ -46,6 +58,9 @@ class AF_PR_AssetList(bpy.types.PropertyGroup):
 	# or because it simply hasn't been queried yet (False)
 	already_queried: bpy.props.BoolProperty(default=False)
 
+	# Whether the list is currently being (re-)loaded in the background
+	is_loading: bpy.props.BoolProperty(default=False)
+
 	def configure(self, asset_list):
 		af = bpy.context.window_manager.af
 
@@ -68,7 +83,9 @@ class AF_PR_AssetList(bpy.types.PropertyGroup):
 			if "preview_image_thumbnail" in asset['data']:
 				asset_entry.preview_image_thumbnail.configure(asset['data']['preview_image_thumbnail'])
 
-		af.current_asset_list_index = 0
+		# The index is set directly to avoid triggering update_asset_list_index.
+		# The implementations of the first asset are loaded by the operator that applies the asset list instead.
+		af['current_asset_list_index'] = 0
 
 		# Indicate that the asset list has already been fetched
 		# (This becomes important if it happens to contain 0 elements)
@@ -124,6 +141,9 @@ class AF_PR_ImplementationImportStep(bpy.types.PropertyGroup):
 	state: bpy.props.EnumProperty(items=AF_ImportActionState.property_items())
 	completion: bpy.props.FloatProperty(default=0.0, max=1.0, min=0.0)
 
+	# Indices of the steps (in the implementation's import_steps) which must be completed before this step can run
+	dependencies: bpy.props.CollectionProperty(type=AF_PR_GenericString)
+
 	# Helper methods
 	# These methods are used by the configuration methods further below.
 
@@ -139,6 +159,13 @@ class AF_PR_ImplementationImportStep(bpy.types.PropertyGroup):
 			out[c.name] = str(c.value)
 		return out
 
+	def add_dependency(self, step_index: int):
+		self.dependencies.add().value = str(step_index)
+		return self
+
+	def get_dependency_indices(self) -> List[int]:
+		return [int(d.value) for d in self.dependencies]
+
 	# File Actions
 
 	def configure_fetch_download(self, component_id):
@@ -217,6 +244,14 @@ class AF_PR_Implementation(bpy.types.PropertyGroup):
 	local_directory: bpy.props.StringProperty()
 	text: bpy.props.PointerProperty(type=AF_PR_TextBlock)
 
+	# Import plans are built lazily (see build_import_plans.py).
+	# is_checked indicates that is_valid and the validation messages are known, is_planned that the import steps have been created, too.
+	is_checked: bpy.props.BoolProperty(default=False)
+	is_planned: bpy.props.BoolProperty(default=False)
+
+	# Hash of the data sent by the provider, used to recognize implementations whose plans have been built before
+	payload_hash: bpy.props.StringProperty()
+
 	def get_expected_charges(self, include_already_paid: bool) -> float:
 		"""This method returns the charges if all unlocking queries for this asset would get called."""
 		charges = 0
@@ -248,6 +283,33 @@ class AF_PR_Implementation(bpy.types.PropertyGroup):
 			return 0
 		return float(self.get_completed_step_count()) / float(self.get_step_count())
 
+	def get_download_completion_ratio(self) -> float:
+		"""Returns a number between 0 and 1 to indicate the combined progress of all downloads in this implementation.
+		Every download is weighted by its size if the sizes of all files are known, otherwise all downloads are weighted equally."""
+		download_steps = [s for s in self.import_steps if s.action == AF_ImportAction.fetch_download.value]
+		if len(download_steps) < 1:
+			return 0
+
+		weights = [self.get_component_by_id(s.config['component_id'].value).store.bytes for s in download_steps]
+		if min(weights) <= 0:
+			weights = [1] * len(download_steps)
+
+		progress = 0.0
+		for step, weight in zip(download_steps, weights):
+			if step.state == AF_ImportActionState.completed.value:
+				progress += weight
+			else:
+				progress += step.completion * weight
+		return progress / float(sum(weights))
+
+	def get_running_download_count(self) -> int:
+		"""Returns the number of downloads that are currently in progress."""
+		running_downloads = 0
+		for s in self.import_steps:
+			if s.action == AF_ImportAction.fetch_download.value and s.state == AF_ImportActionState.running.value:
+				running_downloads += 1
+		return running_downloads
+
 	def get_current_step(self) -> AF_PR_ImplementationImportStep | None:
 		"""Finds the first non-completed step in the implementation and returns it."""
 		for s in self.import_steps:
@@ -255,18 +317,27 @@ class AF_PR_Implementation(bpy.types.PropertyGroup):
 				return s
 		return None
 
+	def get_ready_steps(self) -> List[AF_PR_ImplementationImportStep]:
+		"""Returns all pending steps whose dependencies have been completed, in the order of the plan."""
+		is_completed = [s.state == AF_ImportActionState.completed.value for s in self.import_steps]
+		return [s for s in self.import_steps if s.state == AF_ImportActionState.pending.value and all(is_completed[i] for i in s.get_dependency_indices())]
+
 	def get_current_state(self) -> AF_ImportActionState:
-		"""Gets the import state of the entire implementation. This is either the state of the current step
-		or 'pending' if there is no current step."""
+		"""Gets the import state of the entire implementation. This is 'running' if any step is running (since steps can run in parallel),
+		otherwise the state of the current step or 'pending' if there is no current step."""
+		for s in self.import_steps:
+			if s.state == AF_ImportActionState.running.value:
+				return AF_ImportActionState.running
 		current_step = self.get_current_step()
 		if current_step is not None:
-			return current_step.state
+			return AF_ImportActionState(current_step.state)
 		return AF_ImportActionState.pending
 
 	def reset_state(self):
-		"""Resets all steps back to 'pending'."""
+		"""Resets all steps back to 'pending' and clears their progress."""
 		for s in self.import_steps:
 			s.state = AF_ImportActionState.pending.value
+			s.completion = 0.0
 
 	def get_step_count(self) -> int:
 		"""Returns number of steps."""
@@ -298,6 +369,7 @@ class AF_PR_Implementation(bpy.types.PropertyGroup):
 		if "id" not in incoming_impl:
 			raise Exception("Implementation is missing and id.")
 		self.name = incoming_impl['id']
+		self.payload_hash = hashlib.sha256(json.dumps(incoming_impl, sort_keys=True).encode("utf-8")).hexdigest()
 
 		# Text datablock for this implementation
 		if "data" in incoming_impl:
@@ -366,6 +438,9 @@ class AF_PR_ImplementationList(bpy.types.PropertyGroup):
 	# or because it simply hasn't been queried yet (False)
 	already_queried: bpy.props.BoolProperty(default=False)
 
+	# Whether the list is currently being (re-)loaded in the background
+	is_loading: bpy.props.BoolProperty(default=False)
+
 	def get_unlock_query_by_id(self, query_id: str) -> AF_PR_UnlockQuery:
 		for q in self.unlock_queries.items:
 			if str(q.name) == str(query_id):
@@ -404,12 +479,16 @@ class AF_PR_AssetFetch(bpy.types.PropertyGroup):
 	current_provider_initialization: bpy.props.PointerProperty(type=AF_PR_ProviderInitialization)
 	current_asset_list: bpy.props.PointerProperty(type=AF_PR_AssetList)
 	current_asset_list_index: bpy.props.IntProperty(update=update_asset_list_index)
+	asset_list_view_mode: bpy.props.EnumProperty(name="View",
+		items=[("list", "List", "Show the assets as a list of titles", "LONGDISPLAY", 0), ("grid", "Grid", "Show the assets as a grid of thumbnails", "IMGDISPLAY", 1)],
+		default="list")
 
 	current_implementation_list: bpy.props.PointerProperty(type=AF_PR_ImplementationList)
 	current_implementation_list_index: bpy.props.IntProperty(update=update_implementation_list_index)
 
 	#download_directory: bpy.props.StringProperty(default=os.path.join(os.path.expanduser('~'), "AssetFetch"))
 	ui_image_directory: bpy.props.StringProperty(default=os.path.join(tempfile.gettempdir(), "af-ui-img"))
+	response_cache_directory: bpy.props.StringProperty(default=os.path.join(tempfile.gettempdir(), "af-response-cache"))
 
 	def get_current_asset(self) -> AF_PR_Asset | None:
 		"""Returns the currently selected asset, if available."""
@@ -2,6 +2,7 @@
 
 import bpy
 from .. import ADDON_NAME
+from ..util.addon_constants import AF_ValidationMode
 from .templates import *
 from .updates import *
 
@@ -22,7 +23,8 @@ class AF_PR_Preferences(bpy.types.AddonPreferences):
 	display_mode: bpy.props.EnumProperty(
 		items=[
 		("directory", "Download Directory", "Download Directory"),  # Download directory
-		("bookmarks", "Provider Bookmarks", "Provider Bookmarks")  # Bookmarks
+		("bookmarks", "Provider Bookmarks", "Provider Bookmarks"),  # Bookmarks
+		("performance", "Performance", "Performance")  # Performance settings
 		],
 		default="directory")
 
@@ -40,6 +42,110 @@ class AF_PR_Preferences(bpy.types.AddonPreferences):
 	relative_directory: bpy.props.StringProperty(default="AssetFetch",update=update_download_directory_relative)
 	default_directory: bpy.props.StringProperty(default=os.path.join(os.path.expanduser('~'), "AssetFetch"),update=update_download_directory_default)
 
+	# Downloads
+	download_parallelism: bpy.props.IntProperty(default=4,
+		min=1,
+		max=16,
+		name="Parallel Downloads",
+		description="How many files of one implementation are downloaded at the same time.")
+	download_segments: bpy.props.IntProperty(default=4,
+		min=1,
+		max=16,
+		name="Connections Per File",
+		description="How many connections may be used to download different parts of one large file, if the provider supports it.")
+	download_segment_min_size: bpy.props.IntProperty(default=16,
+		min=1,
+		name="Minimum Segment Size (MB)",
+		description="Files are only split into multiple segments if every segment is at least this large.")
+
+	use_download_store: bpy.props.BoolProperty(default=False,
+		name="Use Shared Download Store",
+		description="Keep a copy of every downloaded file in a shared store and link it into other projects or implementations instead of downloading it again.")
+	download_store_directory: bpy.props.StringProperty(default=os.path.join(os.path.expanduser('~'), "AssetFetch", ".store"),
+		name="Download Store Directory",
+		subtype="DIR_PATH",
+		description="Directory of the shared download store. Files are hardlinked from here if it is on the same drive as the download directory.")
+
+	use_speculative_download: bpy.props.BoolProperty(default=False,
+		update=update_speculative_download,
+		name="Download Free Implementations Early",
+		description="Start downloading the selected implementation in the background if it is free, so that most of the files are already there once the import is started.")
+	speculative_download_max_size: bpy.props.IntProperty(default=100,
+		min=1,
+		name="Early Download Size Limit (MB)",
+		description="Implementations that are larger than this are only downloaded once the import is started.")
+	speculative_download_bandwidth: bpy.props.IntProperty(default=4,
+		min=0,
+		name="Early Download Bandwidth (MB/s)",
+		description="How fast early downloads may be. Once the import is started the download continues at full speed. 0 means unlimited.")
+
+	# Thumbnails
+	thumbnail_cache_size: bpy.props.IntProperty(default=256,
+		min=16,
+		name="Thumbnail Cache Size (MB)",
+		description="How much disk space downloaded thumbnails may take up. The least recently used thumbnails are removed first.")
+
+	# Imports
+	extraction_parallelism: bpy.props.IntProperty(default=2,
+		min=1,
+		max=16,
+		name="Extraction Threads",
+		description="How many files may be extracted from one archive at the same time.")
+	use_streaming_extraction: bpy.props.BoolProperty(default=True,
+		name="Extract While Downloading",
+		description="Extract files from ZIP and TAR archives while the archive is still being downloaded, so that they can be imported sooner. Archives that can't be read this way are extracted after their download.")
+	import_tick_budget: bpy.props.IntProperty(default=50,
+		min=1,
+		max=1000,
+		name="Time Per Update (ms)",
+		description="How long the import may keep working on ready steps before the UI gets updated. Higher values make imports with many small steps faster but Blender less responsive.")
+	incremental_import: bpy.props.BoolProperty(default=True,
+		name="Reuse Existing Files",
+		description="Skip downloads and extractions of files that are still present from an earlier import of the same implementation.")
+	incremental_import_verify_hash: bpy.props.BoolProperty(default=False,
+		name="Verify File Hashes",
+		description="Hash every downloaded or extracted file and check the hash before reusing it. This is more reliable but slower.")
+
+	# Requests
+	query_debounce_delay: bpy.props.IntProperty(default=300,
+		min=0,
+		max=5000,
+		name="Input Delay (ms)",
+		description="How long to wait after a search parameter or header has been edited before querying the provider, so that quick successive edits only cause one query.")
+	use_response_cache: bpy.props.BoolProperty(default=True,
+		name="Cache Responses",
+		description="Keep responses from the provider on disk and only download them again if the provider indicates that they have changed. Responses to requests with sensitive headers (like API keys) are never kept.")
+	response_cache_size: bpy.props.IntProperty(default=64,
+		min=1,
+		name="Response Cache Size (MB)",
+		description="How much disk space cached responses may take up. The least recently used responses are removed first.")
+
+	implementation_list_cache_size: bpy.props.IntProperty(default=64,
+		min=1,
+		name="Cached Implementation Lists",
+		description="How many implementation lists of recently selected assets are kept in memory.")
+	implementation_list_cache_ttl: bpy.props.IntProperty(default=60,
+		min=0,
+		name="Implementation List TTL (s)",
+		description="Cached implementation lists older than this are still shown immediately, but refreshed in the background.")
+	use_implementation_list_prefetch: bpy.props.BoolProperty(default=False,
+		name="Prefetch Implementation Lists",
+		description="Load the implementation lists of the assets next to the selected one in the background, so that they can be shown without waiting.")
+	implementation_list_prefetch_count: bpy.props.IntProperty(default=2,
+		min=1,
+		max=16,
+		name="Prefetched Neighbours",
+		description="How many assets above and below the selected one get their implementation lists prefetched.")
+	implementation_list_prefetch_rate: bpy.props.IntProperty(default=30,
+		min=1,
+		name="Prefetch Budget (per minute)",
+		description="How many prefetch requests may be sent to the provider per minute at most.")
+
+	validation_mode: bpy.props.EnumProperty(items=AF_ValidationMode.property_items(),
+		default="full",
+		name="Response Validation",
+		description="How thoroughly the responses from the provider are checked against the AssetFetch specification.")
+
 	def get_current_download_directory(self):
 		if bpy.data.filepath != '' and self.use_relative:
 			return os.path.join(os.path.dirname(bpy.data.filepath),self.relative_directory)
@@ -4,6 +4,7 @@ from enum import Enum
 import logging
 import os
 import bpy
+from ..util import http, pipeline, scheduler
 
 LOGGER = logging.getLogger("af.property.updates")
 LOGGER.setLevel(logging.DEBUG)
@@ -37,38 +38,70 @@ def update_download_directory_default(property,context):
 	if bpy.ops.af.update_implementations_list.poll():
 		bpy.ops.af.update_implementations_list()
 
-def update_init_url(property, context):
-	"""Function to run if the provider initialization url has changed."""
-	LOGGER.debug("update_init_url")
-	bpy.ops.af.initialize_provider()
+def get_debounce_delay() -> float:
+	"""Returns how long (in seconds) to wait for further edits before sending the queries that depend on them."""
+	from .preferences import AF_PR_Preferences
+	return AF_PR_Preferences.get_prefs().query_debounce_delay / 1000.0
 
-	if bpy.ops.af.update_asset_list.poll():
-		bpy.ops.af.update_asset_list()
 
-	if bpy.ops.af.update_implementations_list.poll():
-		bpy.ops.af.update_implementations_list()
+def supersede_queries(*keys: str):
+	"""Discards the results of running queries because the values they were based on have changed.
+	The debounced update which replaces them sets the loading state again once it actually sends its query."""
+	af = bpy.context.window_manager.af
+	loading_state_holders = {
+		"initialization": af.current_provider_initialization,
+		"asset_list": af.current_asset_list,
+		"implementation_list": af.current_implementation_list
+	}
+	for key in keys:
+		pipeline.pipeline.supersede(key)
+		if key in loading_state_holders:
+			loading_state_holders[key].is_loading = False
+
+
+def update_init_url(property, context):
+	"""Function to run if the provider initialization url has changed.
+	The initialization runs in the background and loads the asset list on its own once it has finished."""
+	LOGGER.debug("update_init_url")
+	supersede_queries("initialization")
+	scheduler.scheduler.schedule("initialization", lambda: bpy.ops.af.initialize_provider(), get_debounce_delay())
 
 
 def update_provider_header(property, context):
-	"""Function to run if a provider header has changed."""
+	"""Function to run if a provider header has changed.
+	The connection status and asset list are only refreshed once the user has stopped editing the headers."""
+	from ..operator.update_implementations_list import implementation_list_cache, implementation_list_prefetcher
 	LOGGER.debug("update_provider_header")
+	http.invalidate_provider_session_headers()
+
+	# Cached implementation lists may depend on the user's credentials
+	implementation_list_cache.clear()
+	implementation_list_prefetcher.cancel_all()
+
+	supersede_queries("connection_status", "asset_list")
+	scheduler.scheduler.schedule("provider_header", apply_provider_header_change, get_debounce_delay())
+
+
+def apply_provider_header_change():
+	"""Refreshes the connection after the provider headers have changed.
+	If the provider is not connected yet, the connection status check loads the asset list once it succeeds."""
 	if bpy.ops.af.connection_status.poll():
 		LOGGER.debug("Getting connection status...")
 		bpy.ops.af.connection_status()
 
+	# Loading the asset list also reloads the implementations for the selected asset
 	if bpy.ops.af.update_asset_list.poll():
 		LOGGER.debug("Updating Asset List...")
 		bpy.ops.af.update_asset_list()
 
-	if bpy.ops.af.update_implementations_list.poll():
-		LOGGER.debug("Updating Implementation List...")
-		bpy.ops.af.update_implementations_list()
-
 
 def update_asset_list_index(property, context):
 	"""Function to run if a new asset has been selected aka the index in the asset list has changed."""
 	LOGGER.debug("update_asset_list_index")
-	bpy.context.window_manager.af.current_implementation_list_index = 0
+
+	# The index is reset without triggering update_implementation_list_index(), because the previous asset's implementations are still loaded.
+	# Plans are built once the new implementation list has been applied (see update_implementations_list.py).
+	bpy.context.window_manager.af['current_implementation_list_index'] = 0
 	if bpy.ops.af.update_implementations_list.poll():
 		bpy.ops.af.update_implementations_list()
 
@@ -76,21 +109,46 @@ def update_asset_list_index(property, context):
 def update_implementation_list_index(property, context):
 	LOGGER.debug("update_implementation_list_index")
 
+	# Import plans are only built for the selected implementation
+	if bpy.ops.af.build_import_plans.poll():
+		bpy.ops.af.build_import_plans()
+
+	# Speculative downloads are only started when a freshly loaded implementation list is applied, the ones for the previous selection are stopped
+	from ..util import download
+	download.speculative_downloads.cancel_all()
+
+
+def update_speculative_download(property, context):
+	"""Function to run if speculative downloads have been enabled or disabled.
+	Disabling them stops the running ones, enabling them takes effect once the next implementation list has been applied."""
+	LOGGER.debug("update_speculative_download")
+	if not property.use_speculative_download:
+		from ..util import download
+		download.speculative_downloads.cancel_all()
+
 # Update functions for variable query parameters
 
 def update_asset_list_parameter(property, context):
 	LOGGER.debug("update_asset_list_parameter")
-	if bpy.ops.af.update_asset_list.poll():
-		bpy.ops.af.update_asset_list()
+	supersede_queries("asset_list", "implementation_list")
 
-	if bpy.ops.af.update_implementations_list.poll():
-		bpy.ops.af.update_implementations_list()
+	# Loading the asset list also reloads the implementations for the selected asset
+	def update_asset_list():
+		if bpy.ops.af.update_asset_list.poll():
+			bpy.ops.af.update_asset_list()
+
+	scheduler.scheduler.schedule("asset_list", update_asset_list, get_debounce_delay())
 
 
 def update_implementation_list_parameter(property, context):
 	LOGGER.debug("update_implementation_list_parameter")
-	if bpy.ops.af.update_implementations_list.poll():
-		bpy.ops.af.update_implementations_list()
+	supersede_queries("implementation_list")
+
+	def update_implementations_list():
+		if bpy.ops.af.update_implementations_list.poll():
+			bpy.ops.af.update_implementations_list()
+
+	scheduler.scheduler.schedule("implementation_list", update_implementations_list, get_debounce_delay())
 
 
 def update_variable_query_parameter(property, context):
@@ -111,3 +169,6 @@ def update_bookmarks(property, context):
 	selection = str(property.provider_bookmark_selection)
 	if selection != "none":
 		bpy.context.window_manager.af.current_init_url = prefs.provider_bookmarks[selection].init_url
+
+		# Selecting a bookmark is a single deliberate action, so there is no need to wait for further edits
+		scheduler.scheduler.flush("initialization")
@@ -9,14 +9,33 @@ from ..util import http, ui_images
 LOGGER = logging.getLogger("af.ui.asset_panel")
 LOGGER.setLevel(logging.DEBUG)
 
+# Thumbnail resolutions for the selected asset and for the cells of the grid view
+SELECTED_THUMBNAIL_RESOLUTION = 256
+GRID_THUMBNAIL_RESOLUTION = 128
+
+GRID_COLUMNS = 4
+GRID_ROWS = 4
+
 
 class AF_UL_AssetsItems(bpy.types.UIList):
 	"""Class for rendering the asset list."""
 
 	def draw_item(self, context, layout: bpy.types.UILayout, data, item: AF_PR_Asset, icon, active_data, active_propname, index):
 
-		row = layout.row()
-		row.label(text=item.get_display_title())
+		# Grid cells show the thumbnail, which only gets loaded once the cell becomes visible
+		if self.layout_type == "GRID":
+			ui_images.mark_visible(index)
+			thumbnail_uri = item.get_thumbnail_uri(GRID_THUMBNAIL_RESOLUTION)
+			if thumbnail_uri is not None:
+				thumbnail_icon_id = ui_images.get_ui_image_icon_id(thumbnail_uri)
+			else:
+				thumbnail_icon_id = ui_images.PLACEHOLDER_ICON_ID
+			column = layout.column(align=True)
+			column.template_icon(icon_value=thumbnail_icon_id, scale=4.0)
+			column.label(text=item.get_display_title())
+		else:
+			row = layout.row()
+			row.label(text=item.get_display_title())
 
 
 class AF_PT_AssetPanel(bpy.types.Panel):
@@ -42,31 +61,52 @@ class AF_PT_AssetPanel(bpy.types.Panel):
 		# Draw the form for the asset list query
 		af.current_provider_initialization.asset_list_query.draw_ui(layout)
 
+		# Indicate that the list is being (re-)loaded in the background
+		if af.current_asset_list.is_loading:
+			layout.label(text="Loading assets...", icon="SORTTIME")
+
 		# Test if there are assets to list
 		if len(af.current_asset_list.assets) > 0:
 			layout.separator()
+			layout.prop(af, "asset_list_view_mode", expand=True)
+
+			if af.asset_list_view_mode == "grid":
+				# Draw the asset grid.
+				# Only the thumbnails of the visible cells (and a margin around them) get loaded.
+				ui_images.begin_visible_pass()
+				layout.template_list(listtype_name="AF_UL_AssetsItems",
+					list_id="asset_grid",
+					dataptr=af.current_asset_list,
+					propname="assets",
+					active_dataptr=af,
+					active_propname="current_asset_list_index",
+					type="GRID",
+					columns=GRID_COLUMNS,
+					rows=GRID_ROWS)
+				ui_images.end_visible_pass(lambda index: af.current_asset_list.assets[index].get_thumbnail_uri(GRID_THUMBNAIL_RESOLUTION),
+					len(af.current_asset_list.assets))
+				asset_box = layout.box()
+			else:
+				# Draw the scrollable asset list.
+				row = layout.row()
+				row.template_list(listtype_name="AF_UL_AssetsItems",
+					list_id="asset_list",
+					dataptr=af.current_asset_list,
+					propname="assets",
+					active_dataptr=af,
+					active_propname="current_asset_list_index",
+					maxrows=9)
+				asset_box = row.box()
 
-			# Draw the scrollable asset list.
-			row = layout.row()
-			row.template_list(listtype_name="AF_UL_AssetsItems",
-				list_id="asset_list",
-				dataptr=af.current_asset_list,
-				propname="assets",
-				active_dataptr=af,
-				active_propname="current_asset_list_index",
-				maxrows=9)
-			
 			# Draw the asset name and thumbnail
 			current_asset = af.current_asset_list.assets[af.current_asset_list_index]
-			asset_box = row.box()
 			asset_box.label(text=current_asset.get_display_title(), icon="ASSET_MANAGER")
 
-			thumbnail_uri = current_asset.preview_image_thumbnail.get_optimal_resolution_uri(256)
-			thumbnail_icon_id = ui_images.get_ui_image_icon_id(thumbnail_uri)
-
-			asset_box.template_icon(icon_value=thumbnail_icon_id, scale=8.0)
+			thumbnail_uri = current_asset.get_thumbnail_uri(SELECTED_THUMBNAIL_RESOLUTION)
+			if thumbnail_uri is not None:
+				asset_box.template_icon(icon_value=ui_images.get_ui_image_icon_id(thumbnail_uri), scale=8.0)
 
 		# Display a message if a query returned no results
-		elif af.current_asset_list.already_queried:
+		elif af.current_asset_list.already_queried and not af.current_asset_list.is_loading:
 			no_results_box = layout.box()
 			no_results_box.label(text="No assets found for this query.", icon="ORPHAN_DATA")
@@ -9,7 +9,12 @@ class AF_UL_ImplementationsItems(bpy.types.UIList):
 	def draw_item(self, context, layout: bpy.types.UILayout, data, item: AF_PR_Implementation, icon, active_data, active_propname, index):
 
 		# Add colored icon to quickly indicate if an implementation is readable
-		if item.is_valid:
+		# (Implementations are only checked once they are shown)
+		if not item.is_checked:
+			from ..operator.build_import_plans import request_import_plan_check
+			request_import_plan_check(item.name)
+			icon = "SEQUENCE_COLOR_09"
+		elif item.is_valid:
 			icon = "SEQUENCE_COLOR_04"
 		else:
 			icon = "SEQUENCE_COLOR_01"
@@ -53,6 +58,10 @@ class AF_PT_ImplementationsPanel(bpy.types.Panel):
 		# Draw the form for querying implementations
 		current_asset.implementation_list_query.draw_ui(layout)
 
+		# Indicate that the list is being (re-)loaded in the background
+		if af.current_implementation_list.is_loading:
+			layout.label(text="Loading implementations...", icon="SORTTIME")
+
 		# We have results to display...
 		if len(af.current_implementation_list.implementations) > 0:
 
@@ -121,6 +130,14 @@ class AF_PT_ImplementationsPanel(bpy.types.Panel):
 				import_button_row.enabled = False
 			import_button_row.operator("af.execute_import_plan", text=import_button_label)
 
+			# Render the combined progress of all downloads that are currently running
+			running_download_count = current_impl.get_running_download_count()
+			if running_download_count > 0:
+				download_progress = current_impl.get_download_completion_ratio()
+				layout.progress(text=f"Downloading {running_download_count} file(s) - {download_progress:.0%} of {self.format_bytes(current_impl.get_download_size())}",
+					factor=download_progress,
+					type="BAR")
+
 			layout.separator()
 
 			if current_impl.is_valid and len(current_impl.import_steps) > 0:
@@ -198,6 +215,6 @@ class AF_PT_ImplementationsPanel(bpy.types.Panel):
 					previous_step_action = step.action
 
 		# We have already queried and found that there are no results...
-		elif af.current_implementation_list.already_queried:
+		elif af.current_implementation_list.already_queried and not af.current_implementation_list.is_loading:
 			no_results_box = layout.box()
 			no_results_box.label(text="No implementations found for this query.", icon="ORPHAN_DATA")
@@ -93,6 +93,82 @@ def draw_preferences(prefs, layout: bpy.types.UILayout, context,inside_blender_p
 			else:
 				directories.prop(prefs, "default_directory", text="Download Directory")
 
+	# Performance Configuration
+
+	if prefs.display_mode == "performance":
+
+		downloads = layout.column()
+		downloads.label(text="Downloads", icon="IMPORT")
+		downloads.prop(prefs, "download_parallelism")
+		downloads.prop(prefs, "download_segments")
+		downloads.prop(prefs, "download_segment_min_size")
+		downloads.prop(prefs, "use_download_store")
+		row = downloads.row()
+		row.enabled = prefs.use_download_store
+		row.prop(prefs, "download_store_directory")
+		downloads.prop(prefs, "use_speculative_download")
+		row = downloads.row()
+		row.enabled = prefs.use_speculative_download
+		row.prop(prefs, "speculative_download_max_size")
+		row = downloads.row()
+		row.enabled = prefs.use_speculative_download
+		row.prop(prefs, "speculative_download_bandwidth")
+
+		thumbnails = layout.column()
+		thumbnails.label(text="Thumbnails", icon="IMAGE_DATA")
+		thumbnails.prop(prefs, "thumbnail_cache_size")
+
+		imports = layout.column()
+		imports.label(text="Imports", icon="FILE_REFRESH")
+		imports.prop(prefs, "import_tick_budget")
+		imports.prop(prefs, "extraction_parallelism")
+		imports.prop(prefs, "use_streaming_extraction")
+		imports.prop(prefs, "incremental_import")
+		row = imports.row()
+		row.enabled = prefs.incremental_import
+		row.prop(prefs, "incremental_import_verify_hash")
+
+		validation_column = layout.column()
+		validation_column.label(text="Requests", icon="CHECKMARK")
+		validation_column.prop(prefs, "query_debounce_delay")
+		validation_column.prop(prefs, "use_response_cache")
+		row = validation_column.row()
+		row.enabled = prefs.use_response_cache
+		row.prop(prefs, "response_cache_size")
+		validation_column.prop(prefs, "implementation_list_cache_size")
+		validation_column.prop(prefs, "implementation_list_cache_ttl")
+		validation_column.prop(prefs, "use_implementation_list_prefetch")
+		row = validation_column.row()
+		row.enabled = prefs.use_implementation_list_prefetch
+		row.prop(prefs, "implementation_list_prefetch_count")
+		row = validation_column.row()
+		row.enabled = prefs.use_implementation_list_prefetch
+		row.prop(prefs, "implementation_list_prefetch_rate")
+		validation_column.prop(prefs, "validation_mode")
+
+		# Time spent on validation so far, per mode and kind
+		from ..util import validation
+		validation_statistics = validation.statistics.get_entries()
+		if len(validation_statistics) > 0:
+			statistics_box = validation_column.box()
+			for mode, kind, count, seconds in validation_statistics:
+				statistics_row = statistics_box.row()
+				statistics_row.label(text=f"{kind} ({mode})")
+				statistics_row.label(text=f"{count}x, {seconds * 1000 / count:.2f} ms avg, {seconds * 1000:.0f} ms total")
+
+		# Timings of the stages of the most recent refresh
+		from ..util import pipeline
+		pipeline_report = pipeline.pipeline.get_report()
+		if len(pipeline_report) > 0:
+			refresh_column = layout.column()
+			refresh_column.label(text="Last Refresh", icon="TIME")
+			report_box = refresh_column.box()
+			for stage_name, query_time, wait_time, apply_time, time_since_begin in pipeline_report:
+				report_row = report_box.row()
+				report_row.label(text=stage_name)
+				report_row.label(text=f"query {query_time * 1000:.0f} ms, waited {wait_time * 1000:.0f} ms, applied in {apply_time * 1000:.0f} ms")
+				report_row.label(text=f"done after {time_since_begin * 1000:.0f} ms")
+
 
 class AF_PT_Preferences(bpy.types.Panel):
 	"""Class for rendering the preferences in the main GUI, instead of only in blender's prefs menu."""
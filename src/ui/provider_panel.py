@@ -41,8 +41,11 @@ class AF_PT_ProviderPanel(bpy.types.Panel):
 		# Connection state
 		connection_state_icons = {"pending": "SEQUENCE_COLOR_09", "awaiting_input": "SEQUENCE_COLOR_03", "connection_error": "SEQUENCE_COLOR_01", "connected": "SEQUENCE_COLOR_04"}
 
-		layout.label(text=af.current_connection_state.bl_rna.properties['state'].enum_items[af.current_connection_state.state].description,
-			icon=connection_state_icons[af.current_connection_state.state])
+		if af.current_provider_initialization.is_loading:
+			layout.label(text="Contacting provider...", icon="SORTTIME")
+		else:
+			layout.label(text=af.current_connection_state.bl_rna.properties['state'].enum_items[af.current_connection_state.state].description,
+				icon=connection_state_icons[af.current_connection_state.state])
 
 		# Title
 		provider_row = layout.row()
@@ -106,6 +106,22 @@ class AF_ImportAction(Enum):
 		]
 
 
+class AF_ValidationMode(Enum):
+	full = "full"
+	first_per_kind = "first_per_kind"
+	structural = "structural"
+	off = "off"
+
+	@staticmethod
+	def property_items():
+		return [
+			("full", "Full", "Validate every response against the complete AssetFetch json-schema."),
+			("first_per_kind", "First Per Kind", "Fully validate only the first response of every kind from a provider, later ones are accepted as-is."),
+			("structural", "Structural", "Only check the fields that the addon actually reads, without using the json-schema."),
+			("off", "Off", "Do not validate responses at all.")
+		]
+
+
 class AF_BlenderDataTypes(Enum):
 	actions = "actions"
 	armatures = "armatures"
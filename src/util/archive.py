@@ -0,0 +1,514 @@
+"""This module contains the extraction of files from ZIP (and TAR) archives.
+Every archive is opened once, its members are indexed by name and all requested files are extracted in a single pass,
+instead of parsing the archive's central directory again for every file.
+Archives that are still being downloaded can also be extracted while they arrive (see AF_StreamingExtraction),
+by reading the local headers that precede every member instead of the central directory at the end of the file."""
+
+import concurrent.futures
+import logging
+import shutil
+import struct
+import tarfile
+import threading
+import zipfile
+import zlib
+from typing import Callable, Dict, List, Tuple
+
+from . import manifest, store
+
+LOGGER = logging.getLogger("af.util.archive")
+LOGGER.setLevel(logging.DEBUG)
+
+# Buffer size used when copying extracted data into the destination file
+COPY_BUFFER_SIZE = 1024 * 1024
+
+# How long (in seconds) a streaming extraction waits before checking again whether more of the archive has arrived
+STREAM_WAIT_INTERVAL = 0.05
+
+# File extensions of archives that are read as TAR archives. Everything else is treated as a ZIP archive.
+TAR_EXTENSIONS = (".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tbz2", ".tar.xz", ".txz")
+
+# Signatures and layouts of the ZIP records that are read while streaming
+ZIP_LOCAL_HEADER_SIGNATURE = 0x04034b50
+ZIP_CENTRAL_DIRECTORY_SIGNATURE = 0x02014b50
+ZIP_END_OF_CENTRAL_DIRECTORY_SIGNATURE = 0x06054b50
+ZIP_DATA_DESCRIPTOR_SIGNATURE = 0x08074b50
+ZIP_LOCAL_HEADER_STRUCT = struct.Struct("<HHHHHIIIHH")
+ZIP64_EXTRA_FIELD_ID = 0x0001
+ZIP_FLAG_ENCRYPTED = 0x1
+ZIP_FLAG_DATA_DESCRIPTOR = 0x8
+ZIP_FLAG_UTF8 = 0x800
+
+
+class AF_StreamingNotSupportedException(Exception):
+	"""Raised if an archive can't be extracted while it is being downloaded (for example because its members are encrypted),
+	meaning that the extraction has to wait for the complete archive instead."""
+	pass
+
+
+class AF_ExtractionCanceledException(Exception):
+	"""Raised on the worker thread of an extraction once it has noticed that it was canceled."""
+	pass
+
+
+def copy_file_data(source_file, destination_file, stop_event: threading.Event | None = None):
+	"""Copies the rest of the source file into the destination file, checking for cancellation after every chunk."""
+	for chunk in iter(lambda: source_file.read(COPY_BUFFER_SIZE), b""):
+		if stop_event is not None and stop_event.is_set():
+			raise AF_ExtractionCanceledException("The extraction has been canceled.")
+		destination_file.write(chunk)
+
+
+def get_archive_kind(path: str) -> str:
+	"""Returns "tar" or "zip", depending on the file extension of the archive."""
+	if path.lower().endswith(TAR_EXTENSIONS):
+		return "tar"
+	return "zip"
+
+
+def get_tar_member_name(member: tarfile.TarInfo) -> str:
+	"""Returns the path of a TAR member without the leading "./" that some tools add."""
+	return member.name[2:] if member.name.startswith("./") else member.name
+
+
+class AF_ZipArchive:
+	"""An opened ZIP archive along with an index of its members by their path inside the archive.
+	Members can be extracted from multiple threads at the same time, as long as they are written to different files."""
+
+	supports_parallel_extraction = True
+
+	def __init__(self, path: str):
+		self.path = path
+		self.zip_file = zipfile.ZipFile(path, 'r')
+		self.members: Dict[str, zipfile.ZipInfo] = {info.filename: info for info in self.zip_file.infolist()}
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.close()
+
+	def close(self):
+		self.zip_file.close()
+
+	def extract(self, sub_path: str, destination_path: str, stop_event: threading.Event | None = None):
+		"""Writes the member at sub_path into the destination file. Setting the stop event interrupts the extraction."""
+		member = self.members.get(sub_path)
+		if member is None:
+			raise Exception(f"File '{sub_path}' not found in the zip archive.")
+		store.unlink_before_writing(destination_path)
+		with self.zip_file.open(member) as source_file:
+			with open(destination_path, 'wb') as destination_file:
+				copy_file_data(source_file, destination_file, stop_event)
+
+
+class AF_TarArchive:
+	"""An opened (optionally compressed) TAR archive along with an index of its members by their path inside the archive.
+	All members are read from the same file handle, so they must be extracted one after another."""
+
+	supports_parallel_extraction = False
+
+	def __init__(self, path: str):
+		self.path = path
+		self.tar_file = tarfile.open(path, 'r:*')
+		self.members: Dict[str, tarfile.TarInfo] = {get_tar_member_name(member): member for member in self.tar_file.getmembers() if member.isfile()}
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.close()
+
+	def close(self):
+		self.tar_file.close()
+
+	def extract(self, sub_path: str, destination_path: str, stop_event: threading.Event | None = None):
+		"""Writes the member at sub_path into the destination file. Setting the stop event interrupts the extraction."""
+		member = self.members.get(sub_path)
+		if member is None:
+			raise Exception(f"File '{sub_path}' not found in the tar archive.")
+		store.unlink_before_writing(destination_path)
+		with self.tar_file.extractfile(member) as source_file:
+			with open(destination_path, 'wb') as destination_file:
+				copy_file_data(source_file, destination_file, stop_event)
+
+
+def open_archive(path: str) -> AF_ZipArchive | AF_TarArchive:
+	if get_archive_kind(path) == "tar":
+		return AF_TarArchive(path)
+	return AF_ZipArchive(path)
+
+
+def extract_members(archive_path: str,
+	extraction_requests: List[Tuple[str, str]],
+	max_workers: int = 1,
+	compute_hash: bool = False,
+	stop_event: threading.Event | None = None) -> Dict[str, str | None]:
+	"""Extracts the requested files (pairs of the path inside the archive and the destination path) from one archive.
+	With max_workers above 1 the files are extracted by multiple threads. This runs on worker threads and must not access Blender's data.
+	Setting the stop event makes the extraction raise an AF_ExtractionCanceledException after the chunk it is currently writing.
+	Returns the hash of every extracted file (or None if compute_hash is not set) by its path inside the archive."""
+
+	with open_archive(archive_path) as archive:
+
+		# Check all requests up front, so that nothing is extracted from an archive that doesn't match the implementation
+		missing_sub_paths = [sub_path for sub_path, destination_path in extraction_requests if sub_path not in archive.members]
+		if len(missing_sub_paths) > 0:
+			raise Exception(f"Files {', '.join(missing_sub_paths)} not found in the archive {archive_path}.")
+
+		def extract(extraction_request: Tuple[str, str]) -> Tuple[str, str | None]:
+			sub_path, destination_path = extraction_request
+			if stop_event is not None and stop_event.is_set():
+				raise AF_ExtractionCanceledException("The extraction has been canceled.")
+			archive.extract(sub_path, destination_path, stop_event)
+			LOGGER.info(f"File '{sub_path}' extracted successfully to '{destination_path}'.")
+			return sub_path, manifest.get_file_hash(destination_path) if compute_hash else None
+
+		if max_workers > 1 and len(extraction_requests) > 1 and archive.supports_parallel_extraction:
+			with concurrent.futures.ThreadPoolExecutor(max_workers=min(max_workers, len(extraction_requests)), thread_name_prefix="af-extract") as executor:
+				results = list(executor.map(extract, extraction_requests))
+		else:
+			results = [extract(extraction_request) for extraction_request in extraction_requests]
+
+	return dict(results)
+
+
+class AF_GrowingFileReader:
+	"""Reads a file from the start while it is still being written, for example by an AF_DownloadTask.
+	Reads wait until the requested bytes have arrived, which is determined by get_available_bytes (the length of the file's prefix that is complete).
+	Once is_finished returns True, reads beyond the available bytes report the end of the file."""
+
+	def __init__(self, path: str, get_available_bytes: Callable[[], int], is_finished: Callable[[], bool], stop_event: threading.Event):
+		self.path = path
+		self.get_available_bytes = get_available_bytes
+		self.is_finished = is_finished
+		self.stop_event = stop_event
+		self.file_handle = None
+		self.position = 0
+
+		# Bytes that have been read but handed back with unread()
+		self.pushed_back = b""
+
+		# Highest number of available bytes seen so far, to notice if the file is being written from the start again
+		self.highest_available_bytes = 0
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.close()
+
+	def close(self):
+		if self.file_handle is not None:
+			self.file_handle.close()
+			self.file_handle = None
+
+	def wait_for_bytes(self, count: int) -> int:
+		"""Waits until at least count bytes after the current position are available (or the file has ended) and returns how many are."""
+		while True:
+			# Check whether the writer is done before looking at the available bytes, so that no bytes written in between are missed
+			finished = self.is_finished()
+			available_bytes = self.get_available_bytes()
+			if available_bytes < self.highest_available_bytes:
+				raise AF_StreamingNotSupportedException(f"{self.path} is being written from the start again.")
+			self.highest_available_bytes = available_bytes
+
+			if available_bytes - self.position >= count or finished:
+				return max(0, available_bytes - self.position)
+			if self.stop_event.wait(STREAM_WAIT_INTERVAL):
+				raise Exception(f"Reading {self.path} has been canceled.")
+
+	def read_available(self, size: int) -> bytes:
+		"""Returns up to size bytes (at least one unless the file has ended), without waiting for more than the first byte."""
+		if len(self.pushed_back) > 0:
+			data = self.pushed_back[:size]
+			self.pushed_back = self.pushed_back[len(data):]
+			return data
+
+		count = min(self.wait_for_bytes(1), size)
+		if count == 0:
+			return b""
+
+		# The file may not exist before the writer has started
+		if self.file_handle is None:
+			self.file_handle = open(self.path, 'rb')
+		self.file_handle.seek(self.position)
+		data = self.file_handle.read(count)
+		if len(data) < count:
+			raise AF_StreamingNotSupportedException(f"{self.path} has been truncated while it was being read.")
+		self.position += len(data)
+		return data
+
+	def read(self, size: int = -1) -> bytes:
+		"""Returns size bytes (or everything up to the end of the file if size is negative), waiting for them to arrive.
+		Like for regular files, fewer bytes are only returned at the end of the file."""
+		chunks = []
+		remaining = size if size >= 0 else None
+		while remaining is None or remaining > 0:
+			chunk = self.read_available(COPY_BUFFER_SIZE if remaining is None else remaining)
+			if len(chunk) == 0:
+				break
+			chunks.append(chunk)
+			if remaining is not None:
+				remaining -= len(chunk)
+		return b"".join(chunks)
+
+	def read_exactly(self, size: int) -> bytes:
+		"""Returns exactly size bytes or raises an exception if the file ends before that."""
+		data = self.read(size)
+		if len(data) < size:
+			raise Exception(f"{self.path} ended unexpectedly.")
+		return data
+
+	def skip(self, size: int):
+		"""Moves past size bytes without reading them."""
+		pushed_back_count = min(size, len(self.pushed_back))
+		self.pushed_back = self.pushed_back[pushed_back_count:]
+		size -= pushed_back_count
+		if size > 0:
+			if self.wait_for_bytes(size) < size:
+				raise Exception(f"{self.path} ended unexpectedly.")
+			self.position += size
+
+	def unread(self, data: bytes):
+		"""Hands back bytes that have been read too early, so that the next read returns them again."""
+		self.pushed_back = data + self.pushed_back
+
+
+class AF_StreamingExtraction:
+	"""Extracts files from an archive while it is still being downloaded, on a dedicated worker thread.
+	ZIP archives are read member by member using their local headers, TAR archives are read as a stream.
+	Every file can be used as soon as it has been extracted (see get_completed_members()), long before the download has finished.
+	If the archive can't be streamed, the extraction waits for the download to finish and then extracts the files as usual.
+	All methods are safe to call from the main thread while the extraction is running."""
+
+	def __init__(self,
+		archive_path: str,
+		extraction_requests: List[Tuple[str, str]],
+		get_available_bytes: Callable[[], int],
+		is_download_finished: Callable[[], bool],
+		is_download_completed: Callable[[], bool],
+		max_workers: int = 1,
+		compute_hash: bool = False):
+		self.archive_path = archive_path
+		self.max_workers = max_workers
+		self.compute_hash = compute_hash
+		self.get_available_bytes = get_available_bytes
+		self.is_download_finished = is_download_finished
+		self.is_download_completed = is_download_completed
+
+		# Path inside the archive -> destination paths (a file may be requested by more than one component)
+		self.destinations: Dict[str, List[str]] = {}
+		for sub_path, destination_path in extraction_requests:
+			self.destinations.setdefault(sub_path, []).append(destination_path)
+
+		# Path inside the archive -> hash of the extracted file (or None), for all files that have been extracted completely
+		self.completed_members: Dict[str, str | None] = {}
+		self.lock = threading.Lock()
+
+		self.stop_event = threading.Event()
+		self.error: Exception | None = None
+		self.finished = False
+		self.thread = threading.Thread(target=self._run, name=f"af-stream-extract-{archive_path}", daemon=True)
+
+	def start(self):
+		"""Starts the extraction on the worker thread."""
+		LOGGER.info(f"Starting streaming extraction of {len(self.destinations)} files from {self.archive_path}")
+		self.thread.start()
+		return self
+
+	def _run(self):
+		"""Body of the worker thread."""
+		try:
+			try:
+				with AF_GrowingFileReader(self.archive_path, self.get_available_bytes, self._is_archive_finished, self.stop_event) as reader:
+					if get_archive_kind(self.archive_path) == "tar":
+						self._stream_tar(reader)
+					else:
+						self._stream_zip(reader)
+			except AF_StreamingNotSupportedException as e:
+				LOGGER.warning(f"Can't extract {self.archive_path} while it is downloading, waiting for the download to finish: {e}")
+				self._extract_after_download()
+				return
+
+			missing_sub_paths = [sub_path for sub_path in self.destinations.keys() if sub_path not in self.completed_members]
+			if len(missing_sub_paths) > 0:
+				raise Exception(f"Files {', '.join(missing_sub_paths)} not found in the archive {self.archive_path}.")
+		except Exception as e:
+			if not self.stop_event.is_set():
+				LOGGER.error(f"Streaming extraction of {self.archive_path} failed: {e}")
+				self.error = e
+		finally:
+			self.finished = True
+
+	def _is_archive_finished(self) -> bool:
+		if not self.is_download_finished():
+			return False
+		if not self.is_download_completed():
+			raise Exception(f"The download of {self.archive_path} has not been completed.")
+		return True
+
+	def _extract_after_download(self):
+		"""Fallback for archives that can't be streamed: Waits for the complete archive and extracts the remaining files from it."""
+		while not self._is_archive_finished():
+			if self.stop_event.wait(STREAM_WAIT_INTERVAL):
+				return
+
+		remaining_requests = []
+		for sub_path, destination_paths in self.destinations.items():
+			if sub_path not in self.completed_members:
+				remaining_requests += [(sub_path, destination_path) for destination_path in destination_paths]
+
+		file_hashes = extract_members(self.archive_path, remaining_requests, max_workers=self.max_workers, compute_hash=self.compute_hash, stop_event=self.stop_event)
+		with self.lock:
+			self.completed_members.update(file_hashes)
+
+	def _complete_member(self, sub_path: str):
+		"""Copies an extracted file to its other destinations (if there are any) and makes it available."""
+		destination_paths = self.destinations[sub_path]
+		for destination_path in destination_paths[1:]:
+			store.unlink_before_writing(destination_path)
+			shutil.copyfile(destination_paths[0], destination_path)
+
+		file_hash = manifest.get_file_hash(destination_paths[0]) if self.compute_hash else None
+		with self.lock:
+			self.completed_members[sub_path] = file_hash
+		LOGGER.info(f"File '{sub_path}' extracted successfully to '{destination_paths[0]}' while the archive is downloading.")
+
+	def _has_remaining_members(self) -> bool:
+		with self.lock:
+			return len(self.completed_members) < len(self.destinations)
+
+	def _stream_tar(self, reader: AF_GrowingFileReader):
+		with tarfile.open(fileobj=reader, mode='r|*') as tar_file:
+			for member in tar_file:
+				sub_path = get_tar_member_name(member)
+				if member.isfile() and sub_path in self.destinations and sub_path not in self.completed_members:
+					store.unlink_before_writing(self.destinations[sub_path][0])
+					with tar_file.extractfile(member) as source_file:
+						with open(self.destinations[sub_path][0], 'wb') as destination_file:
+							copy_file_data(source_file, destination_file, self.stop_event)
+					self._complete_member(sub_path)
+				if not self._has_remaining_members():
+					return
+
+	def _stream_zip(self, reader: AF_GrowingFileReader):
+		while self._has_remaining_members():
+
+			# Step 1: Read the local header of the next member. The central directory follows after the last member.
+			signature, = struct.unpack("<I", reader.read_exactly(4))
+			if signature in [ZIP_CENTRAL_DIRECTORY_SIGNATURE, ZIP_END_OF_CENTRAL_DIRECTORY_SIGNATURE]:
+				return
+			if signature != ZIP_LOCAL_HEADER_SIGNATURE:
+				raise AF_StreamingNotSupportedException(f"Unexpected record {signature:#010x} at offset {reader.position - 4}.")
+
+			version, flags, method, modification_time, modification_date, crc, compressed_size, uncompressed_size, name_length, extra_length = \
+				ZIP_LOCAL_HEADER_STRUCT.unpack(reader.read_exactly(ZIP_LOCAL_HEADER_STRUCT.size))
+			raw_name = reader.read_exactly(name_length)
+			sub_path = raw_name.decode('utf-8') if flags & ZIP_FLAG_UTF8 else raw_name.decode('cp437')
+			extra = reader.read_exactly(extra_length)
+
+			# Step 2: Use the 64 bit sizes from the ZIP64 extra field, if the header has one
+			is_zip64 = False
+			extra_offset = 0
+			while extra_offset + 4 <= len(extra):
+				field_id, field_length = struct.unpack_from("<HH", extra, extra_offset)
+				if field_id == ZIP64_EXTRA_FIELD_ID:
+					is_zip64 = True
+					field_data = extra[extra_offset + 4:extra_offset + 4 + field_length]
+					if uncompressed_size == 0xFFFFFFFF and len(field_data) >= 8:
+						uncompressed_size, = struct.unpack_from("<Q", field_data, 0)
+						field_data = field_data[8:]
+					if compressed_size == 0xFFFFFFFF and len(field_data) >= 8:
+						compressed_size, = struct.unpack_from("<Q", field_data, 0)
+				extra_offset += 4 + field_length
+
+			has_data_descriptor = bool(flags & ZIP_FLAG_DATA_DESCRIPTOR)
+			if flags & ZIP_FLAG_ENCRYPTED:
+				raise AF_StreamingNotSupportedException(f"Member '{sub_path}' is encrypted.")
+			if method not in [zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED]:
+				raise AF_StreamingNotSupportedException(f"Member '{sub_path}' uses compression method {method}.")
+			if method == zipfile.ZIP_STORED and has_data_descriptor and not sub_path.endswith("/"):
+				# Without a compressed stream there is no way to tell where the member ends
+				raise AF_StreamingNotSupportedException(f"Member '{sub_path}' is stored without its size.")
+
+			# Step 3: Extract the member's data, or move past it if it wasn't requested
+			is_requested = sub_path in self.destinations and sub_path not in self.completed_members
+			if not is_requested and not has_data_descriptor:
+				reader.skip(compressed_size)
+			else:
+				destination_file = None
+				if is_requested:
+					store.unlink_before_writing(self.destinations[sub_path][0])
+					destination_file = open(self.destinations[sub_path][0], 'wb')
+				try:
+					actual_crc = self._stream_zip_member_data(reader, method, compressed_size, has_data_descriptor, destination_file)
+				finally:
+					if destination_file is not None:
+						destination_file.close()
+
+				# Step 4: Skip the data descriptor that follows the data (its signature is optional)
+				if has_data_descriptor:
+					descriptor_signature = reader.read_exactly(4)
+					if struct.unpack("<I", descriptor_signature)[0] != ZIP_DATA_DESCRIPTOR_SIGNATURE:
+						reader.unread(descriptor_signature)
+					crc, = struct.unpack("<I", reader.read_exactly(4))
+					reader.skip(16 if is_zip64 else 8)
+
+				if actual_crc != crc:
+					raise Exception(f"File '{sub_path}' in {self.archive_path} is corrupt (CRC mismatch).")
+
+				if is_requested:
+					self._complete_member(sub_path)
+
+	def _stream_zip_member_data(self, reader: AF_GrowingFileReader, method: int, compressed_size: int, has_data_descriptor: bool, destination_file) -> int:
+		"""Decompresses the data of one ZIP member into the destination file (if there is one) and returns its CRC-32.
+		Members with a data descriptor are read until their compressed stream ends, since their size is only known afterwards."""
+		crc = 0
+		decompressor = zlib.decompressobj(-zlib.MAX_WBITS) if method == zipfile.ZIP_DEFLATED else None
+		remaining = compressed_size
+		while (decompressor is not None and has_data_descriptor and not decompressor.eof) or (not has_data_descriptor and remaining > 0):
+			if self.stop_event.is_set():
+				raise AF_ExtractionCanceledException("The extraction has been canceled.")
+			chunk = reader.read_available(COPY_BUFFER_SIZE) if has_data_descriptor else reader.read(min(remaining, COPY_BUFFER_SIZE))
+			if len(chunk) == 0:
+				raise Exception(f"{self.archive_path} ended unexpectedly.")
+			remaining -= len(chunk)
+
+			data = chunk if decompressor is None else decompressor.decompress(chunk)
+			crc = zlib.crc32(data, crc)
+			if destination_file is not None:
+				destination_file.write(data)
+
+			# Hand back whatever follows the end of the compressed stream
+			if decompressor is not None and decompressor.eof and len(decompressor.unused_data) > 0:
+				reader.unread(decompressor.unused_data)
+
+		if decompressor is not None and not has_data_descriptor:
+			data = decompressor.flush()
+			crc = zlib.crc32(data, crc)
+			if destination_file is not None:
+				destination_file.write(data)
+		if decompressor is not None and not decompressor.eof:
+			raise Exception(f"{self.archive_path} contains an incomplete compressed stream.")
+		return crc
+
+	def get_completed_members(self) -> Dict[str, str | None]:
+		"""Returns the hash (or None) of every file that has been extracted so far by its path inside the archive."""
+		with self.lock:
+			return dict(self.completed_members)
+
+	def cancel(self, wait: bool = False):
+		"""Asks the worker thread to stop and optionally waits for it to close its files.
+		The thread notices the cancellation after the chunk it is currently writing, so the main thread doesn't need to wait for it."""
+		self.stop_event.set()
+		if wait and self.thread.is_alive():
+			self.thread.join()
+
+	def is_finished(self) -> bool:
+		return self.finished
+
+	def raise_for_error(self):
+		"""Re-raises the exception that stopped the worker thread, if there was one."""
+		if self.error is not None:
+			raise self.error
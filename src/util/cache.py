@@ -0,0 +1,73 @@
+"""This module contains a generic in-memory cache with least-recently-used eviction."""
+
+import collections
+import threading
+import time
+from typing import Any, Callable, Hashable
+
+
+class AF_CacheEntry:
+	"""A value in the cache along with the time at which it was stored."""
+
+	def __init__(self, value: Any):
+		self.value = value
+		self.stored_at = time.monotonic()
+
+	def get_age(self) -> float:
+		"""Returns how many seconds ago the value was stored."""
+		return time.monotonic() - self.stored_at
+
+
+class AF_LruCache:
+	"""A thread-safe cache holding up to max_entries values. Once it is full, the least recently used value is removed.
+	Entries remember when they were stored, which allows callers to decide whether a value needs to be refreshed."""
+
+	def __init__(self, max_entries: int):
+		self.max_entries = max_entries
+		self.entries: collections.OrderedDict[Hashable, AF_CacheEntry] = collections.OrderedDict()
+		self.lock = threading.Lock()
+
+	def get(self, key: Hashable) -> AF_CacheEntry | None:
+		"""Returns the entry for the key (if there is one) and marks it as recently used."""
+		with self.lock:
+			entry = self.entries.get(key)
+			if entry is not None:
+				self.entries.move_to_end(key)
+			return entry
+
+	def peek(self, key: Hashable) -> AF_CacheEntry | None:
+		"""Returns the entry for the key without marking it as recently used."""
+		with self.lock:
+			return self.entries.get(key)
+
+	def put(self, key: Hashable, value: Any):
+		with self.lock:
+			self.entries[key] = AF_CacheEntry(value)
+			self.entries.move_to_end(key)
+			self.evict()
+
+	def set_max_entries(self, max_entries: int):
+		with self.lock:
+			self.max_entries = max_entries
+			self.evict()
+
+	def evict(self):
+		# Must be called while holding the lock
+		while len(self.entries) > self.max_entries:
+			self.entries.popitem(last=False)
+
+	def remove_matching(self, predicate: Callable[[Hashable], bool]) -> int:
+		"""Removes all entries whose key matches the predicate. Returns how many entries were removed."""
+		with self.lock:
+			matching_keys = [key for key in self.entries.keys() if predicate(key)]
+			for key in matching_keys:
+				del self.entries[key]
+			return len(matching_keys)
+
+	def clear(self):
+		with self.lock:
+			self.entries.clear()
+
+	def __contains__(self, key: Hashable) -> bool:
+		with self.lock:
+			return key in self.entries
@@ -0,0 +1,549 @@
+"""This module contains the download engine which streams files to disk on background threads.
+The modal import operator only starts downloads and polls their progress, meaning that the transfer itself
+is not limited by how often Blender calls the operator."""
+
+import json
+import logging
+import math
+import os
+import threading
+import time
+from typing import Dict, Iterable, List, Tuple
+import requests
+from . import http, manifest, store
+
+LOGGER = logging.getLogger("af.util.download")
+LOGGER.setLevel(logging.DEBUG)
+
+# Suffix of the sidecar file that stores the resume state next to a partial download
+PARTIAL_DOWNLOAD_SUFFIX = ".afpart"
+
+# How often (in seconds) the resume state of a running download is written to disk
+RESUME_STATE_SAVE_INTERVAL = 1.0
+
+# How long (in seconds) a throttled download sleeps at most before checking whether it was canceled or its limit was lifted
+THROTTLE_CHECK_INTERVAL = 0.1
+
+
+# Canceled tasks whose worker threads may still be writing to their files (see AF_DownloadTask.cancel())
+stopping_tasks: List["AF_DownloadTask"] = []
+stopping_tasks_lock = threading.Lock()
+
+
+def get_stopping_tasks(destination_path: str | None = None) -> List["AF_DownloadTask"]:
+	"""Returns the canceled tasks whose threads are still running (optionally only those for one destination) and forgets about all others."""
+	with stopping_tasks_lock:
+		stopping_tasks[:] = [t for t in stopping_tasks if t.thread.is_alive()]
+		return [t for t in stopping_tasks if destination_path is None or os.path.normpath(t.destination_path) == os.path.normpath(destination_path)]
+
+
+class AF_RangeNotSupportedException(Exception):
+	"""Raised if a provider does not honor a ranged request, either because it does not support them
+	or because the file has changed since a partial download was started."""
+	pass
+
+
+class AF_DownloadSegment:
+	"""A contiguous part of a file that is written by one connection."""
+
+	def __init__(self, start: int, end: int | None, written: int = 0):
+		# First and last byte of the segment (both inclusive). The end is None if the total size is unknown.
+		self.start = start
+		self.end = end
+		self.written = written
+
+	def get_length(self) -> int | None:
+		if self.end is None:
+			return None
+		return self.end - self.start + 1
+
+	def is_complete(self) -> bool:
+		return self.end is not None and self.written >= self.get_length()
+
+
+class AF_DownloadResumeState:
+	"""The sidecar record that is stored next to a partially downloaded file.
+	It remembers which query the file belongs to, which version of the file was being downloaded (using its ETag or Last-Modified date)
+	and how far every segment has progressed, which allows a later attempt to continue with ranged requests.
+	Since the record lives on disk this works across canceled imports and Blender restarts."""
+
+	def __init__(self, destination_path: str, query: http.AF_HttpQuery, expected_bytes: int, validator: str, segments: List[AF_DownloadSegment]):
+		self.destination_path = destination_path
+		self.query = query
+		self.expected_bytes = expected_bytes
+		self.validator = validator
+		self.segments = segments
+
+	@staticmethod
+	def get_state_path(destination_path: str) -> str:
+		return destination_path + PARTIAL_DOWNLOAD_SUFFIX
+
+	@staticmethod
+	def load(destination_path: str, query: http.AF_HttpQuery):
+		"""Loads the resume state for a destination, if there is one that belongs to the same query and a matching partial file."""
+		state_path = AF_DownloadResumeState.get_state_path(destination_path)
+		if not os.path.exists(state_path) or not os.path.exists(destination_path):
+			return None
+
+		try:
+			with open(state_path, 'r') as state_file:
+				data = json.load(state_file)
+
+			if data['uri'] != query.uri or data['method'] != query.method or data['parameters'] != (query.parameters or {}):
+				LOGGER.info(f"Ignoring partial download of {destination_path} because it belongs to a different query.")
+				return None
+
+			segments = [AF_DownloadSegment(start, end, written) for start, end, written in data['segments']]
+			if os.path.getsize(destination_path) < max(s.start + s.written for s in segments):
+				LOGGER.info(f"Ignoring partial download of {destination_path} because the file is shorter than recorded.")
+				return None
+
+			return AF_DownloadResumeState(destination_path, query, data['expected_bytes'], data['validator'], segments)
+		except Exception as e:
+			LOGGER.warning(f"Could not read resume state {state_path}: {e}")
+			return None
+
+	def save(self):
+		"""Writes the state to disk. The file is replaced atomically so that an interruption never leaves a broken record behind."""
+		state_path = AF_DownloadResumeState.get_state_path(self.destination_path)
+		data = {
+			"uri": self.query.uri,
+			"method": self.query.method,
+			"parameters": self.query.parameters or {},
+			"expected_bytes": self.expected_bytes,
+			"validator": self.validator,
+			"segments": [[s.start, s.end, s.written] for s in self.segments]
+		}
+		with open(state_path + ".tmp", 'w') as state_file:
+			json.dump(data, state_file)
+		os.replace(state_path + ".tmp", state_path)
+
+	def discard(self):
+		"""Removes the state from disk, for example after the download has been completed."""
+		state_path = AF_DownloadResumeState.get_state_path(self.destination_path)
+		if os.path.exists(state_path):
+			os.remove(state_path)
+
+
+def clear_directory_except_partial_downloads(directory: str, keep_paths: Iterable[str] = ()):
+	"""Deletes all contents of a directory, except for partially downloaded files (and their resume states) which can still be resumed.
+	Files in keep_paths (for example downloads that are still running) and files of canceled downloads that haven't stopped yet are kept, too."""
+	keep_paths = {os.path.normpath(p) for p in keep_paths}
+	keep_paths.update(os.path.normpath(t.destination_path) for t in get_stopping_tasks())
+	for root, dirs, files in os.walk(directory, topdown=False):
+		for file_name in files:
+			file_path = os.path.join(root, file_name)
+			if file_name.endswith(PARTIAL_DOWNLOAD_SUFFIX) or os.path.normpath(file_path) in keep_paths:
+				continue
+			if os.path.exists(AF_DownloadResumeState.get_state_path(file_path)):
+				continue
+			os.remove(file_path)
+		for dir_name in dirs:
+			dir_path = os.path.join(root, dir_name)
+			if len(os.listdir(dir_path)) == 0:
+				os.rmdir(dir_path)
+
+
+class AF_DownloadTask:
+	"""Downloads one file on a dedicated worker thread.
+	If the provider supports ranged requests and the file is large enough, the file is split into multiple
+	segments which are downloaded over parallel connections and written in place into a preallocated file.
+	Interrupted downloads leave their partial file and an AF_DownloadResumeState behind, which the next task for the same file picks up.
+	The query must have been created on Blender's main thread (see AF_HttpQuery).
+	All methods of the task are safe to call from the main thread while the download is running."""
+
+	def __init__(self,
+		query: http.AF_HttpQuery,
+		destination_path: str,
+		max_segments: int = 1,
+		min_segment_bytes: int = 16 * 1024 * 1024,
+		compute_hash: bool = False,
+		download_store: store.AF_DownloadStore | None = None,
+		store_key: str = "",
+		store_bytes: int = 0,
+		max_bytes_per_second: float | None = None):
+		self.query = query
+		self.destination_path = destination_path
+		self.max_segments = max(1, max_segments)
+		self.min_segment_bytes = max(1, min_segment_bytes)
+
+		# Optionally hash the finished file on the worker thread (see util/manifest.py)
+		self.compute_hash = compute_hash
+		self.file_hash: str | None = None
+
+		# Optional global download store (see util/store.py) which is checked before downloading and receives the finished file
+		self.download_store = download_store
+		self.store_key = store_key
+		self.store_bytes = store_bytes
+
+		# Progress information, shared between all segment threads
+		self.segments: List[AF_DownloadSegment] = []
+		self.expected_bytes = 0
+		self.progress_lock = threading.Lock()
+
+		# Optional bandwidth limit (see set_bandwidth_limit())
+		self.set_bandwidth_limit(max_bytes_per_second)
+
+		# Resume information which is periodically written to disk
+		self.resume_state: AF_DownloadResumeState | None = None
+		self.last_resume_state_save = 0.0
+
+		# cancel_event is set when the download is canceled from the outside,
+		# abort_event is used internally to stop all segments once one of them has failed.
+		self.cancel_event = threading.Event()
+		self.abort_event = threading.Event()
+		self.error: Exception | None = None
+		self.completed = False
+		self.finished = False
+		self.thread = threading.Thread(target=self._run, name=f"af-download-{destination_path}", daemon=True)
+
+	def start(self):
+		"""Starts the download on the worker thread."""
+		LOGGER.info(f"Starting download of {self.query.uri} into {self.destination_path}")
+		self.thread.start()
+		return self
+
+	def _run(self):
+		"""Body of the worker thread."""
+		try:
+			# Canceled tasks for the same file may still be writing to it (or its resume state), so they have to stop first
+			for stopping_task in get_stopping_tasks(self.destination_path):
+				if stopping_task is not self:
+					stopping_task.thread.join()
+
+			# Use the file from the download store, if it has one
+			if self.download_store is not None and self.download_store.materialize(self.store_key, self.store_bytes, self.destination_path):
+				self.expected_bytes = self.store_bytes
+				self.segments = [AF_DownloadSegment(0, self.store_bytes - 1, self.store_bytes)]
+				self.completed = True
+				if os.path.exists(AF_DownloadResumeState.get_state_path(self.destination_path)):
+					os.remove(AF_DownloadResumeState.get_state_path(self.destination_path))
+
+			# Try to continue an earlier attempt
+			previous_state = None
+			if not self.completed:
+				previous_state = AF_DownloadResumeState.load(self.destination_path, self.query)
+			if previous_state is not None:
+				try:
+					self._resume(previous_state)
+				except AF_RangeNotSupportedException as e:
+					LOGGER.warning(f"Could not resume {self.destination_path}, starting over: {e}")
+					previous_state.discard()
+					self.resume_state = None
+
+			if not self.completed and not self.cancel_event.is_set():
+				try:
+					self._download(allow_segments=True)
+				except AF_RangeNotSupportedException as e:
+					LOGGER.warning(f"Falling back to a single connection for {self.query.uri}: {e}")
+					self._download(allow_segments=False)
+
+			if self.completed and self.download_store is not None:
+				self.download_store.insert(self.store_key, self.store_bytes, self.destination_path)
+
+			if self.completed and self.compute_hash:
+				self.file_hash = manifest.get_file_hash(self.destination_path)
+		except Exception as e:
+			LOGGER.error(f"Download of {self.query.uri} failed: {e}")
+			self.error = e
+		finally:
+			# Either clean up the resume state or make sure that its final version is on disk
+			if self.resume_state is not None:
+				try:
+					if self.completed:
+						self.resume_state.discard()
+					else:
+						with self.progress_lock:
+							self.resume_state.save()
+				except Exception as e:
+					LOGGER.error(f"Could not update resume state for {self.destination_path}: {e}")
+			self.finished = True
+
+	def _resume(self, state: AF_DownloadResumeState):
+		"""Continues a partial download by requesting the remainder of every incomplete segment."""
+		LOGGER.info(f"Resuming download of {self.destination_path} at {sum(s.written for s in state.segments)} bytes.")
+		self.resume_state = state
+		self.expected_bytes = state.expected_bytes
+		self.segments = state.segments
+		self._run_segments(self.segments, first_response=None)
+		self.completed = not self.cancel_event.is_set()
+
+	def _download(self, allow_segments: bool):
+		"""Performs the actual download, either over one connection or split into multiple ranged segments."""
+
+		response = self.query.open_stream()
+		try:
+			response.raise_for_status()
+			self.expected_bytes = int(response.headers.get('Content-Length', 0))
+
+			# The Content-Length of an encoded body is its compressed size, so the length of the file is unknown and the stream is read until it ends
+			if http.AF_HttpQuery.is_content_encoded(response):
+				LOGGER.warning(f"{self.query.uri} was sent with Content-Encoding '{response.headers.get('Content-Encoding')}', its size is unknown.")
+				self.expected_bytes = 0
+
+			# Decide how many segments to use
+			segment_count = 1
+			if allow_segments and self.expected_bytes > 0 and self.query.supports_ranges(response):
+				segment_count = max(1, min(self.max_segments, self.expected_bytes // self.min_segment_bytes))
+
+			if segment_count < 2:
+				self.segments = [AF_DownloadSegment(0, self.expected_bytes - 1 if self.expected_bytes > 0 else None)]
+			else:
+				segment_size = math.ceil(self.expected_bytes / segment_count)
+				self.segments = [
+					AF_DownloadSegment(start, min(start + segment_size, self.expected_bytes) - 1) for start in range(0, self.expected_bytes, segment_size)
+				]
+				LOGGER.info(f"Splitting {self.query.uri} into {len(self.segments)} segments of up to {segment_size} bytes.")
+
+			# Preallocate the file so that every segment can write into its own region.
+			# A new file is created instead of truncating the old one, which may be a hardlink into the download store.
+			store.unlink_before_writing(self.destination_path)
+			with open(self.destination_path, 'wb') as file_handle:
+				if self.expected_bytes > 0:
+					file_handle.truncate(self.expected_bytes)
+
+			# Record the resume state, if the provider has identified the version of the file in a way that can be used to resume it later.
+			validator = http.AF_HttpQuery.get_resume_validator(response)
+			if validator is not None and self.query.supports_ranges(response):
+				self.resume_state = AF_DownloadResumeState(self.destination_path, self.query, self.expected_bytes, validator, self.segments)
+				self.resume_state.save()
+
+			# The response that has already been opened is reused for the first segment.
+			self._run_segments(self.segments, first_response=response)
+			self.completed = not self.cancel_event.is_set()
+		finally:
+			response.close()
+
+	def _run_segments(self, segments: List[AF_DownloadSegment], first_response: requests.Response | None):
+		"""Downloads all incomplete segments in parallel.
+		The first segment can optionally be read from an already opened response, all others use ranged requests."""
+
+		self.abort_event.clear()
+		segment_errors: List[Exception] = []
+		segment_threads = []
+
+		pending_segments = [s for s in segments if not s.is_complete()]
+		if first_response is not None and len(pending_segments) > 0:
+			pending_segments = pending_segments[1:]
+
+		for segment in pending_segments:
+			segment_thread = threading.Thread(target=self._run_ranged_segment, args=(segment, segment_errors), daemon=True)
+			segment_thread.start()
+			segment_threads.append(segment_thread)
+
+		if first_response is not None:
+			try:
+				with open(self.destination_path, 'r+b', buffering=0) as file_handle:
+					self._write_segment(first_response, segments[0], file_handle)
+			except Exception as e:
+				segment_errors.append(e)
+				self.abort_event.set()
+
+		for segment_thread in segment_threads:
+			segment_thread.join()
+
+		# Report range errors first since they are the reason to fall back to a single connection or a fresh start
+		for e in segment_errors:
+			if isinstance(e, AF_RangeNotSupportedException):
+				raise e
+		if len(segment_errors) > 0:
+			raise segment_errors[0]
+
+	def _run_ranged_segment(self, segment: AF_DownloadSegment, segment_errors: List[Exception]):
+		"""Downloads (the rest of) one segment using a ranged request. Runs on its own thread."""
+		try:
+			range_start = segment.start + segment.written
+			validator = self.resume_state.validator if self.resume_state is not None else None
+			response = self.query.open_stream(byte_range=(range_start, segment.end), if_range=validator)
+			try:
+				response.raise_for_status()
+				if response.status_code != 206:
+					raise AF_RangeNotSupportedException(f"Ranged request was answered with status {response.status_code}.")
+				if http.AF_HttpQuery.is_content_encoded(response):
+					raise AF_RangeNotSupportedException(f"Ranged request was answered with Content-Encoding '{response.headers.get('Content-Encoding')}'.")
+				if not response.headers.get('Content-Range', "").startswith(f"bytes {range_start}-"):
+					raise AF_RangeNotSupportedException(f"Ranged request was answered with unexpected range '{response.headers.get('Content-Range')}'.")
+				with open(self.destination_path, 'r+b', buffering=0) as file_handle:
+					file_handle.seek(range_start)
+					self._write_segment(response, segment, file_handle)
+			finally:
+				response.close()
+		except Exception as e:
+			segment_errors.append(e)
+
+			# One failed segment means that the entire file can't be completed, so all other segments are stopped.
+			self.abort_event.set()
+
+	def _write_segment(self, response: requests.Response, segment: AF_DownloadSegment, file_handle):
+		"""Writes the body of a response into the file until the segment is complete (or the response ends).
+		The file handle must be unbuffered, so that the progress recorded in the resume state never runs ahead of the data on disk."""
+		for chunk in response.iter_content(chunk_size=self.query.chunk_size):
+			if self.cancel_event.is_set() or self.abort_event.is_set():
+				return
+
+			# A response may contain more data than the segment needs, if it was opened for the entire file.
+			segment_length = segment.get_length()
+			if segment_length is not None:
+				chunk = chunk[:segment_length - segment.written]
+
+			# Unbuffered writes may be partial, so the rest of the chunk is written until nothing is left
+			chunk_view = memoryview(chunk)
+			while len(chunk_view) > 0:
+				bytes_written = file_handle.write(chunk_view)
+				if bytes_written is None:
+					raise Exception(f"Could not write to {self.destination_path}.")
+				chunk_view = chunk_view[bytes_written:]
+
+			with self.progress_lock:
+				segment.written += len(chunk)
+
+				# Persist the progress from time to time
+				if self.resume_state is not None and time.monotonic() - self.last_resume_state_save > RESUME_STATE_SAVE_INTERVAL:
+					self.resume_state.save()
+					self.last_resume_state_save = time.monotonic()
+
+			self._throttle(len(chunk))
+
+			if segment.is_complete():
+				return
+
+		if segment.end is not None and not segment.is_complete() and not self.cancel_event.is_set() and not self.abort_event.is_set():
+			raise Exception(f"Connection closed after {segment.written} of {segment.get_length()} bytes.")
+
+	def _throttle(self, byte_count: int):
+		"""Waits for as long as the download is ahead of its bandwidth limit."""
+		with self.progress_lock:
+			self.throttled_bytes += byte_count
+
+		while not self.cancel_event.is_set() and not self.abort_event.is_set():
+			with self.progress_lock:
+				if self.max_bytes_per_second is None:
+					return
+				delay = self.throttled_bytes / self.max_bytes_per_second - (time.monotonic() - self.throttle_started_at)
+			if delay <= 0:
+				return
+			self.cancel_event.wait(min(delay, THROTTLE_CHECK_INTERVAL))
+
+	def set_bandwidth_limit(self, max_bytes_per_second: float | None):
+		"""Limits how many bytes per second are downloaded (across all segments). None removes the limit.
+		This can also be called while the download is running."""
+		with self.progress_lock:
+			self.max_bytes_per_second = max_bytes_per_second
+			self.throttle_started_at = time.monotonic()
+			self.throttled_bytes = 0
+
+	def cancel(self, wait: bool = False):
+		"""Asks the worker thread to stop and optionally waits for it to close its file handles.
+		The main thread should never wait, since a stalled connection is only noticed once its read timeout has passed.
+		Instead, the next task for the same file waits for this one on its own worker thread (see get_stopping_tasks())."""
+		self.cancel_event.set()
+		if wait and self.thread.is_alive():
+			self.thread.join()
+		elif self.thread.is_alive():
+			with stopping_tasks_lock:
+				if self not in stopping_tasks:
+					stopping_tasks.append(self)
+
+	def is_finished(self) -> bool:
+		"""Returns whether the worker thread has stopped, either because the download is complete or because of an error/cancellation."""
+		return self.finished
+
+	def is_canceled(self) -> bool:
+		return self.cancel_event.is_set()
+
+	def raise_for_error(self):
+		"""Re-raises the exception that stopped the worker thread, if there was one."""
+		if self.error is not None:
+			raise self.error
+
+	def get_downloaded_bytes(self) -> int:
+		with self.progress_lock:
+			return sum(s.written for s in self.segments)
+
+	def get_contiguous_bytes(self) -> int:
+		"""Returns how many bytes at the start of the file have been written without a gap, meaning that they can already be read."""
+		with self.progress_lock:
+			contiguous_bytes = 0
+			for segment in sorted(self.segments, key=lambda s: s.start):
+				if segment.start != contiguous_bytes:
+					break
+				contiguous_bytes += segment.written
+				if not segment.is_complete():
+					break
+			return contiguous_bytes
+
+	def get_completeness(self) -> float:
+		if self.expected_bytes <= 0:
+			return 0.0
+		return min(1.0, float(self.get_downloaded_bytes()) / float(self.expected_bytes))
+
+
+class AF_SpeculativeDownloads:
+	"""Keeps track of downloads that have been started before the user has asked for an import (see execute_import_plan.py).
+	Tasks are identified by their destination path, which is where the real import would put the file, too.
+	The import adopts these tasks instead of starting its own downloads. Must only be used from the main thread."""
+
+	def __init__(self):
+		self.tasks: Dict[str, AF_DownloadTask] = {}
+
+		# Where every finished download gets recorded (destination path -> implementation directory, local path inside it and source)
+		self.manifest_records: Dict[str, Tuple[str, str, str]] = {}
+
+	def __contains__(self, destination_path: str) -> bool:
+		return destination_path in self.tasks
+
+	def add(self, task: AF_DownloadTask, directory: str, local_file_path: str, source: str):
+		"""Adds a started task. Once it has finished, its file is recorded in the manifest of the implementation directory (see record_completed())."""
+		self.tasks[task.destination_path] = task
+		self.manifest_records[task.destination_path] = (directory, local_file_path, source)
+
+	def record_completed(self):
+		"""Records the files of all completed downloads in the manifests of their implementation directories and forgets about the tasks.
+		This way the files are reused by the import even if the implementation has been deselected in the meantime."""
+		for destination_path, task in list(self.tasks.items()):
+			if not task.is_finished() or not task.completed:
+				continue
+			del self.tasks[destination_path]
+			directory, local_file_path, source = self.manifest_records.pop(destination_path)
+			try:
+				manifest.AF_ImplementationManifest(directory).record(local_file_path, source, task.file_hash)
+				LOGGER.info(f"Recorded speculative download of {destination_path} in the manifest.")
+			except Exception as e:
+				LOGGER.warning(f"Could not record speculative download of {destination_path}: {e}")
+
+	def get_downloaded_bytes(self) -> int:
+		return sum(task.get_downloaded_bytes() for task in self.tasks.values())
+
+	def adopt(self, destination_path: str, query: http.AF_HttpQuery) -> AF_DownloadTask | None:
+		"""Hands over the task for the destination if it downloads the same query and hasn't failed, with its bandwidth limit removed.
+		Tasks that are not adopted are canceled, a new task for the destination waits for them to stop before writing to the file."""
+		task = self.tasks.pop(destination_path, None)
+		self.manifest_records.pop(destination_path, None)
+		if task is None:
+			return None
+
+		if task.query.get_fingerprint() != query.get_fingerprint() or task.error is not None or task.is_canceled():
+			task.cancel()
+			return None
+
+		task.set_bandwidth_limit(None)
+		LOGGER.info(f"Adopting speculative download of {destination_path} at {task.get_downloaded_bytes()} bytes.")
+		return task
+
+	def retain(self, destination_paths: Iterable[str]):
+		"""Cancels all speculative downloads except those for the given destinations.
+		Their partial files (and resume states) remain, so a later download of the same file can still continue them.
+		Downloads that have already been completed are recorded in their manifests instead."""
+		self.record_completed()
+		destination_paths = set(destination_paths)
+		for destination_path in list(self.tasks.keys()):
+			if destination_path not in destination_paths:
+				self.tasks.pop(destination_path).cancel()
+				self.manifest_records.pop(destination_path)
+
+	def cancel_all(self):
+		self.retain([])
+
+
+# The downloads that have been started speculatively for the selected implementation
+speculative_downloads = AF_SpeculativeDownloads()
@@ -1,31 +1,36 @@
 import datetime
-import json, requests, tempfile, os
+import json, requests, requests.adapters, tempfile, os
 import time
 import random
 import logging
 import pathlib
 from enum import Enum
-from typing import List, Dict
+from typing import List, Dict, Tuple
 import bpy
-import jsonschema
 
 from functools import partial
 
-from .. import SCHEMA_PATH
+from . import response_cache, validation
 
 LOGGER = logging.getLogger("af.util.http")
 LOGGER.setLevel(logging.INFO)
 
+# Timeouts (in seconds) for establishing a connection and for waiting on the next bytes of a response.
+# Without them, a provider that stops responding would block a worker thread (and anything waiting for it) forever.
+CONNECT_TIMEOUT = 10
+READ_TIMEOUT = 60
+
 
 class AF_HttpResponse:
 	"""Represents a response received from a provider."""
 
-	def __init__(self, raw_response: requests.Response):
-		"""Creates a new HttpResponse based on the 'raw' response object from the requests module. """
+	def __init__(self, content: str, response_code: int, validation_mode: str = "full"):
+		"""Creates a new HttpResponse based on the body and status code of a response (which may have been taken from the response cache).
+		The validation mode is one of the values of AF_ValidationMode."""
 
 		# Take response and parse it as JSON
-		self.content = raw_response.text
-		self.response_code = raw_response.status_code
+		self.content = content
+		self.response_code = response_code
 		try:
 			self.parsed = json.loads(self.content)
 		except Exception as e:
@@ -38,23 +43,64 @@ class AF_HttpResponse:
 			raise Exception("Could not resolve meta.kind for this request.")
 
 		# Validate the data structure based on the "kind" of the request
-		target_schema_path = (SCHEMA_PATH + f"/endpoint/{kind}.json").replace("\\", "/")
-		target_base_path = SCHEMA_PATH.replace("\\", "/")
+		LOGGER.info(f"Validating response of kind {kind} (mode: {validation_mode})")
+		validation.validate_response(kind, self.parsed, validation_mode)
+
+
+# Pooled sessions, one per provider (identified by its initialization URL).
+# Reusing a session keeps connections to the provider alive instead of performing a new TCP/TLS handshake for every request.
+provider_sessions: Dict[str, requests.Session] = {}
+
+# Initialization URLs of the providers whose session headers need to be rebuilt before the next request
+outdated_provider_session_headers = set()
+
+
+def get_provider_session() -> requests.Session:
+	"""Returns the pooled session for the current provider, with the provider's headers already applied.
+	This accesses Blender's data and must therefore be called from the main thread."""
+
+	provider_key = bpy.context.window_manager.af.current_init_url
+
+	session = provider_sessions.get(provider_key)
+	if session is None:
+		session = requests.Session()
+
+		# Allow enough connections for parallel (and segmented) downloads to the same host
+		adapter = requests.adapters.HTTPAdapter(pool_connections=8, pool_maxsize=64)
+		session.mount("http://", adapter)
+		session.mount("https://", adapter)
+
+		provider_sessions[provider_key] = session
+		outdated_provider_session_headers.add(provider_key)
+
+	# The merged headers are cached on the session and only rebuilt after they have been invalidated
+	if provider_key in outdated_provider_session_headers:
+		headers = requests.utils.default_headers()
+		headers.update(AF_HttpQuery.get_request_headers())
+		session.headers = headers
+		outdated_provider_session_headers.discard(provider_key)
+
+	return session
 
-		if not os.path.exists(target_schema_path):
-			raise Exception(f"Kind {kind} is not recognized as an endpoint kind because file {target_schema_path} could not be found.")
 
-		LOGGER.info(f"Validating against {target_schema_path} with base path {target_base_path}")
+def invalidate_provider_session_headers():
+	"""Marks the headers of all sessions as outdated, for example because the user has changed a header value.
+	The connections themselves stay open."""
+	outdated_provider_session_headers.update(provider_sessions.keys())
 
-		with open(target_schema_path, 'r') as schema_file:
-			schema = json.load(schema_file)
-			jsonschema.validate(instance=self.parsed,
-				schema=schema,
-				resolver=jsonschema.RefResolver(referrer=f"file:///{target_schema_path}", base_uri=f"file:///{target_schema_path}"))
+
+def close_provider_sessions():
+	"""Closes all pooled sessions along with their connections."""
+	for session in provider_sessions.values():
+		session.close()
+	provider_sessions.clear()
+	outdated_provider_session_headers.clear()
 
 
 class AF_HttpQuery:
-	"""Represents a query that the client sends to the provider"""
+	"""Represents a query that the client sends to the provider.
+	The query picks up the current provider's pooled session when it is created (on the main thread),
+	so that it can afterwards also be executed on a worker thread."""
 
 	# The standard headers that get sent with every request (along with any auth headers)
 	default_headers = {"User-Agent": f"blender/{bpy.app.version_string} assetfetch-blender/0.3"}
@@ -66,6 +112,14 @@ class AF_HttpQuery:
 		else:
 			LOGGER.exception("unsupported HTTP method detected.")
 		self.parameters = parameters
+		self.session = get_provider_session()
+
+		# The validation mode is taken from the preferences now, since they can't be read if the query is executed on a worker thread
+		from ..property.preferences import AF_PR_Preferences
+		self.validation_mode = AF_PR_Preferences.get_prefs().validation_mode
+
+		# Only set for queries whose responses may be cached (see enable_response_cache())
+		self.response_cache: response_cache.AF_ResponseCache | None = None
 
 		# Variables for modal operation
 		self.stream_handle = None
@@ -86,32 +140,130 @@ class AF_HttpQuery:
 
 		return progress
 
-	def execute(self, raise_for_status: bool = False) -> AF_HttpResponse:
-		"""Executes an API query (in one go) and generates a response object."""
+	def get_fingerprint(self) -> str:
+		"""Returns a string that identifies what this query requests (its method, URI and parameters)."""
+		return json.dumps([self.method, self.uri, self.parameters or {}], sort_keys=True)
 
+	@staticmethod
+	def get_request_headers() -> Dict[str, str]:
+		"""Builds the headers for a request to the current provider (default headers plus the provider's configured headers).
+		This accesses Blender's data and must therefore be called from the main thread.
+		Queries don't call this directly, they use the cached headers of the provider session instead."""
 		af = bpy.context.window_manager.af
-		LOGGER.info(f"Sending http {self.method} to {self.uri} with payload {self.parameters}")
-
-		# Build the list of headers
 		headers = AF_HttpQuery.default_headers.copy()
 		for header_name in af.current_provider_initialization.provider_configuration.headers.keys():
 			headers[header_name] = af.current_provider_initialization.provider_configuration.headers[header_name].value
+		return headers
+
+	@staticmethod
+	def has_sensitive_headers() -> bool:
+		"""Checks whether requests to the current provider carry a header that the provider has marked as sensitive (like an API key).
+		This accesses Blender's data and must therefore be called from the main thread."""
+		headers = bpy.context.window_manager.af.current_provider_initialization.provider_configuration.headers
+		return any(header.is_sensitive and header.value != "" for header in headers.values())
+
+	def enable_response_cache(self):
+		"""Allows the response to this query to be taken from (and stored in) the on-disk response cache, if the user has enabled it.
+		Only GET queries are cached, and only if they don't carry sensitive headers, since the responses are stored in plain text.
+		This accesses Blender's data and must therefore be called from the main thread."""
+		from ..property.preferences import AF_PR_Preferences
+		prefs = AF_PR_Preferences.get_prefs()
+		if self.method == "get" and prefs.use_response_cache and not AF_HttpQuery.has_sensitive_headers():
+			self.response_cache = response_cache.AF_ResponseCache(bpy.context.window_manager.af.response_cache_directory, prefs.response_cache_size * 1024 * 1024)
+
+	def forget_cached_response(self):
+		"""Removes the stored response to this query from the response cache (if it is enabled), so that the next execution contacts the provider."""
+		if self.response_cache is not None:
+			self.response_cache.remove(self.response_cache.get_key(self.method, self.uri, self.parameters, self.session.headers))
+
+	def execute(self, raise_for_status: bool = False) -> AF_HttpResponse:
+		"""Executes an API query (in one go) and generates a response object."""
+
+		# Step 1: Check the response cache
+		cache_key = None
+		cache_entry = None
+		extra_headers = {}
+		if self.response_cache is not None:
+			cache_key = self.response_cache.get_key(self.method, self.uri, self.parameters, self.session.headers)
+			cache_entry = self.response_cache.load(cache_key)
+			if cache_entry is not None:
+				if self.response_cache.is_fresh(cache_entry):
+					LOGGER.info(f"Using cached response for {self.uri}")
+					return AF_HttpResponse(cache_entry['content'], 200, self.validation_mode)
+				extra_headers = response_cache.get_revalidation_headers(cache_entry)
 
-		# Make the request with the appropriate HTTP method
+		LOGGER.info(f"Sending http {self.method} to {self.uri} with payload {self.parameters}")
+
+		# Step 2: Make the request with the appropriate HTTP method
 		if self.method == "get":
-			response = requests.get(self.uri, params=self.parameters, headers=headers)
+			response = self.session.get(self.uri, params=self.parameters, headers=extra_headers, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT))
 		elif self.method == "post":
-			response = requests.post(self.uri, params=self.parameters, headers=headers)
+			response = self.session.post(self.uri, params=self.parameters, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT))
 		else:
 			raise ValueError(f"Unsupported HTTP method: {self.method}")
 
+		# Step 3: Reuse the cached body if the provider says it hasn't changed, or remember the new one
+		if cache_entry is not None and response.status_code == 304:
+			LOGGER.info(f"Cached response for {self.uri} is still valid.")
+			self.response_cache.refresh(cache_key, cache_entry, response.headers)
+			return AF_HttpResponse(cache_entry['content'], 200, self.validation_mode)
+
 		LOGGER.debug(f"Received http response: {response.content}")
 
 		if raise_for_status:
 			response.raise_for_status()
 
 		# Create and return AF_HttpResponse
-		return AF_HttpResponse(response)
+		http_response = AF_HttpResponse(response.text, response.status_code, self.validation_mode)
+
+		# Only responses that have passed validation get stored
+		if self.response_cache is not None and response.status_code == 200:
+			self.response_cache.store(cache_key, response.text, response.headers)
+
+		return http_response
+
+	def open_stream(self, byte_range: Tuple[int, int | None] = None, if_range: str = None, extra_headers: Dict[str, str] = None) -> requests.Response:
+		"""Sends the query and returns the response without reading its body.
+		If a byte range (first and last byte, both inclusive, the last one may be None) is given, only that part of the file is requested.
+		The optional if_range validator (ETag or Last-Modified) makes the provider send the full file instead if it has changed since.
+		Extra headers can be used for conditional requests (If-None-Match etc.).
+		The file is requested without content encoding, so that Content-Length and byte ranges refer to the bytes that end up on disk."""
+
+		# Prepare additional headers for this request (the session already contains all the regular ones)
+		headers = {'Accept-Encoding': "identity"}
+		headers.update(extra_headers or {})
+		if byte_range is not None:
+			range_end = "" if byte_range[1] is None else str(byte_range[1])
+			headers['Range'] = f"bytes={byte_range[0]}-{range_end}"
+			if if_range:
+				headers['If-Range'] = if_range
+
+		if self.method == "get":
+			return self.session.get(url=self.uri, data=self.parameters, headers=headers, stream=True, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT))
+		elif self.method == "post":
+			return self.session.post(url=self.uri, data=self.parameters, headers=headers, stream=True, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT))
+		else:
+			raise ValueError("Unsupported HTTP method.")
+
+	@staticmethod
+	def is_content_encoded(response: requests.Response) -> bool:
+		"""Checks whether the provider has compressed the body (despite being asked not to), in which case
+		the decoded file is larger than the Content-Length and byte ranges can't be mapped onto it."""
+		return response.headers.get('Content-Encoding', "identity").strip().lower() not in ["", "identity"]
+
+	def supports_ranges(self, response: requests.Response) -> bool:
+		"""Checks whether the provider has indicated (using the Accept-Ranges header) that it can serve parts of the file for this query.
+		Ranged requests are only used with GET since their meaning is not well-defined for other methods."""
+		return self.method == "get" and not AF_HttpQuery.is_content_encoded(response) and response.headers.get('Accept-Ranges', "").strip().lower() == "bytes"
+
+	@staticmethod
+	def get_resume_validator(response: requests.Response) -> str | None:
+		"""Returns the value that can be used in an If-Range header to resume the download of this response later.
+		Only strong ETags are allowed in If-Range, so weak ones are skipped in favor of the Last-Modified date."""
+		etag = response.headers.get('ETag')
+		if etag and not etag.startswith("W/"):
+			return etag
+		return response.headers.get('Last-Modified')
 
 	def execute_as_file_piecewise_start(self, destination_path: str):
 		"""Starts a chunked download."""
@@ -120,26 +272,17 @@ class AF_HttpQuery:
 		if self.stream_handle is not None or self.file_handle is not None:
 			raise Exception("Download has already been started.")
 
-		# Create helpful variables
-		af = bpy.context.window_manager.af
-
-		# Prepare headers for request
-		headers = AF_HttpQuery.default_headers.copy()
-		for header_name in af.current_provider_initialization.provider_configuration.headers.keys():
-			headers[header_name] = af.current_provider_initialization.provider_configuration.headers[header_name].value
-
-		# Open the file handle
-		self.file_handle = open(destination_path, 'wb')
-
 		# Open the http stream handle
-		if self.method == "get":
-			self.stream_handle = requests.get(url=self.uri, data=self.parameters, headers=headers, stream=True)
-		elif self.method == "post":
-			self.stream_handle = requests.post(url=self.uri, data=self.parameters, headers=headers, stream=True)
-		else:
-			raise ValueError("Unsupported HTTP method.")
+		stream_handle = self.open_stream()
 
-		self.stream_handle.raise_for_status()
+		# Only open the file once the provider has actually accepted the request
+		try:
+			stream_handle.raise_for_status()
+			self.file_handle = open(destination_path, 'wb')
+		except Exception as e:
+			stream_handle.close()
+			raise e
+		self.stream_handle = stream_handle
 
 		# Try to get the expected bytes
 		self.expected_bytes = int(self.stream_handle.headers.get('Content-Length', 0))
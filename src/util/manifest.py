@@ -0,0 +1,84 @@
+"""This module contains the manifest which keeps track of the files in an implementation directory.
+It is used to decide which files from a previous import can be reused instead of being downloaded or extracted again."""
+
+import hashlib
+import json
+import logging
+import os
+from typing import Dict, Set, Tuple
+
+LOGGER = logging.getLogger("af.util.manifest")
+LOGGER.setLevel(logging.DEBUG)
+
+# Name of the manifest file inside every implementation directory
+MANIFEST_FILE_NAME = ".af-manifest.json"
+
+
+def get_file_hash(file_path: str) -> str:
+	"""Returns the sha256 hash of a file's contents."""
+	file_hash = hashlib.sha256()
+	with open(file_path, 'rb') as file_handle:
+		for chunk in iter(lambda: file_handle.read(1024 * 1024), b""):
+			file_hash.update(chunk)
+	return file_hash.hexdigest()
+
+
+class AF_ImplementationManifest:
+	"""Records every file that has been fully written into an implementation directory, along with where it came from,
+	its size and (optionally) its hash. A file is only considered reusable if all of these still match."""
+
+	def __init__(self, directory: str):
+		self.directory = directory
+		self.entries: Dict[str, Dict] = {}
+
+		manifest_path = os.path.join(directory, MANIFEST_FILE_NAME)
+		if os.path.exists(manifest_path):
+			try:
+				with open(manifest_path, 'r') as manifest_file:
+					self.entries = json.load(manifest_file)
+			except Exception as e:
+				LOGGER.warning(f"Could not read manifest {manifest_path}, ignoring it: {e}")
+
+	def save(self):
+		manifest_path = os.path.join(self.directory, MANIFEST_FILE_NAME)
+		with open(manifest_path + ".tmp", 'w') as manifest_file:
+			json.dump(self.entries, manifest_file)
+		os.replace(manifest_path + ".tmp", manifest_path)
+
+	def record(self, local_file_path: str, source: str, file_hash: str | None = None):
+		"""Records that a file has been completely written. The source identifies where the content came from (e.g. the download query)."""
+		full_path = os.path.join(self.directory, local_file_path)
+		self.entries[local_file_path] = {"source": source, "bytes": os.path.getsize(full_path), "hash": file_hash}
+		self.save()
+
+	def forget(self, local_file_path: str):
+		"""Removes a file from the manifest, for example because it is about to be overwritten."""
+		if local_file_path in self.entries:
+			del self.entries[local_file_path]
+			self.save()
+
+	def is_reusable(self, local_file_path: str, source: str, expected_bytes: int, verify_hash: bool) -> bool:
+		"""Checks whether a file from a previous import can be used as-is."""
+		entry = self.entries.get(local_file_path)
+		if entry is None or entry['source'] != source:
+			return False
+
+		full_path = os.path.join(self.directory, local_file_path)
+		if not os.path.isfile(full_path):
+			return False
+
+		# The size must match both the manifest and the provider's metadata (if it has any)
+		actual_bytes = os.path.getsize(full_path)
+		if actual_bytes != entry['bytes'] or (expected_bytes > 0 and actual_bytes != expected_bytes):
+			return False
+
+		if verify_hash and entry['hash'] is not None and get_file_hash(full_path) != entry['hash']:
+			LOGGER.info(f"Hash of {full_path} does not match the manifest.")
+			return False
+
+		return True
+
+	def get_reusable_files(self, candidates: Dict[str, Tuple[str, int]], verify_hash: bool) -> Set[str]:
+		"""Checks multiple files (local path -> source and expected size) at once and returns the paths of those that are reusable.
+		With verify_hash every file is read completely, so this should run on a worker thread."""
+		return {local_file_path for local_file_path, (source, expected_bytes) in candidates.items() if self.is_reusable(local_file_path, source, expected_bytes, verify_hash)}
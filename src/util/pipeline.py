@@ -0,0 +1,204 @@
+"""This module contains the refresh pipeline which coordinates the queries that are needed after connecting to a provider.
+The queries for the different stages (initialization, connection status, asset list, implementation list and import plans) run concurrently
+wherever possible, but their results are applied in dependency order. For example, an asset list that arrives before the connection status
+check has confirmed the connection is held back until that check has been applied (and dropped if it failed).
+The pipeline also measures how long every stage took."""
+
+import logging
+import time
+from typing import Any, Callable, Dict, List, Tuple
+
+from . import runtime
+
+LOGGER = logging.getLogger("af.util.pipeline")
+LOGGER.setLevel(logging.DEBUG)
+
+
+class AF_PipelineStage:
+	"""State and timing of one stage of the refresh pipeline.
+	A stage is idle (not part of the current refresh), running (waiting for its query), waiting (result received, dependencies still in progress),
+	applying, applied or failed."""
+
+	def __init__(self, name: str, dependencies: List[str]):
+		self.name = name
+		self.dependencies = dependencies
+		self.reset()
+
+	def reset(self):
+		self.state = "idle"
+		self.started_at = None
+		self.received_at = None
+		self.apply_started_at = None
+		self.applied_at = None
+		self.deferred_apply: Callable[[], None] | None = None
+		self.deferred_discard: Callable[[], None] | None = None
+
+		# Identifies the current run of the stage, so that results handed over after a restart can be told apart
+		self.run_token: object | None = None
+
+	def get_timings(self) -> Tuple[float, float, float]:
+		"""Returns the time (in seconds) spent on the query, waiting for dependencies and applying the result."""
+		return (self.received_at - self.started_at, self.apply_started_at - self.received_at, self.applied_at - self.apply_started_at)
+
+
+class AF_RefreshPipeline:
+	"""Runs stages whose results must be applied in dependency order.
+	A stage's result is held back as long as any of its dependencies is still running or waiting itself.
+	Dependencies that are not part of the current refresh (idle) don't hold anything back."""
+
+	def __init__(self, dependencies: Dict[str, List[str]]):
+		self.stages = {name: AF_PipelineStage(name, stage_dependencies) for name, stage_dependencies in dependencies.items()}
+		self.began_at = None
+
+	def begin(self):
+		"""Starts a new refresh, forgetting about all stages of the previous one."""
+		for stage in self.stages.values():
+			stage.reset()
+		self.began_at = time.perf_counter()
+
+	def is_in_progress(self, name: str) -> bool:
+		return self.stages[name].state in ["running", "waiting", "applying"]
+
+	def start(self, name: str):
+		# A stage that starts while nothing else is going on begins a new refresh (e.g. after editing a search parameter)
+		if not any(self.is_in_progress(stage_name) for stage_name in self.stages.keys()):
+			self.began_at = time.perf_counter()
+
+		stage = self.stages[name]
+		stage.reset()
+		stage.state = "running"
+		stage.started_at = time.perf_counter()
+		stage.run_token = object()
+
+	def track(self,
+		name: str,
+		on_success: Callable[[Any], None],
+		on_error: Callable[[Exception], None],
+		on_discard: Callable[[], None] = None) -> Tuple[Callable[[Any], None], Callable[[Exception], None]]:
+		"""Starts a stage whose result is produced elsewhere (like by a prefetch that is already running).
+		Returns the functions for handing over the result (or error), which must be called on the main thread.
+		Anything handed over after the stage has been restarted or superseded is ignored."""
+		self.start(name)
+		stage = self.stages[name]
+		run_token = stage.run_token
+
+		def complete(result):
+			if stage.run_token is run_token:
+				self.complete(name, lambda: on_success(result), on_discard)
+
+		def fail(error: Exception):
+			if stage.run_token is run_token:
+				on_error(error)
+				self.fail(name)
+
+		return complete, fail
+
+	def submit(self,
+		name: str,
+		function: Callable[[], Any],
+		on_success: Callable[[Any], None],
+		on_error: Callable[[Exception], None],
+		on_discard: Callable[[], None] = None):
+		"""Runs the query of a stage on the query runtime (using the stage name as the key).
+		on_success is called with the result once all dependencies have been applied, on_discard if a dependency has failed instead."""
+		complete, fail = self.track(name, on_success, on_error, on_discard)
+		runtime.runtime.submit(function, on_success=complete, on_error=fail, key=name)
+
+	def run(self, name: str, function: Callable[[], None]):
+		"""Runs a stage that doesn't need a query (like building the import plans) right away, to include it in the timings."""
+		self.start(name)
+		self.complete(name, function)
+
+	def complete(self, name: str, apply: Callable[[], None], discard: Callable[[], None] = None):
+		"""Hands over the result of a stage, which gets applied as soon as its dependencies allow it."""
+		stage = self.stages[name]
+		if stage.started_at is None:
+			stage.started_at = time.perf_counter()
+		stage.received_at = time.perf_counter()
+		stage.deferred_apply = apply
+		stage.deferred_discard = discard
+		stage.state = "waiting"
+		self.process()
+
+	def fail(self, name: str):
+		"""Marks a stage as failed. Stages depending on it are discarded."""
+		self.stages[name].state = "failed"
+		self.process()
+
+	def cancel(self, name: str):
+		"""Removes a stage from the current refresh, for example because its query has been superseded."""
+		stage = self.stages[name]
+		if stage.state == "waiting" and stage.deferred_discard is not None:
+			stage.deferred_discard()
+		stage.reset()
+		self.process()
+
+	def supersede(self, name: str):
+		"""Discards the result of a stage's query, whether it is still running or already waiting to be applied."""
+		runtime.runtime.invalidate(name)
+		self.cancel(name)
+
+	def process(self):
+		"""Applies (or discards) all waiting stages whose dependencies have been settled."""
+		progress = True
+		while progress:
+			progress = False
+			for stage in self.stages.values():
+				if stage.state != "waiting":
+					continue
+
+				dependency_states = [self.stages[dependency].state for dependency in stage.dependencies]
+
+				if "failed" in dependency_states:
+					LOGGER.info(f"Discarding the result of stage {stage.name} because a dependency has failed.")
+					stage.state = "failed"
+					if stage.deferred_discard is not None:
+						stage.deferred_discard()
+					progress = True
+
+				elif all(state in ["idle", "applying", "applied"] for state in dependency_states):
+					stage.state = "applying"
+					stage.apply_started_at = time.perf_counter()
+					try:
+						stage.deferred_apply()
+					except Exception as e:
+						LOGGER.exception(f"Applying stage {stage.name} failed: {e}")
+						stage.state = "failed"
+					stage.applied_at = time.perf_counter()
+
+					# The stage may have failed or been restarted while it was applied
+					if stage.state == "applying":
+						stage.state = "applied"
+						self.log_timings(stage)
+					progress = True
+
+	def log_timings(self, stage: AF_PipelineStage):
+		query_time, wait_time, apply_time = stage.get_timings()
+		LOGGER.info(f"Stage {stage.name}: query {query_time * 1000:.0f} ms, waited {wait_time * 1000:.0f} ms, "
+			f"applied in {apply_time * 1000:.0f} ms ({self.get_time_since_begin(stage.name) * 1000:.0f} ms after the refresh began)")
+
+	def get_time_since_begin(self, name: str) -> float | None:
+		"""Returns how long after the start of the refresh the stage was applied (if it has been)."""
+		stage = self.stages[name]
+		if self.began_at is None or stage.state != "applied":
+			return None
+		return stage.applied_at - self.began_at
+
+	def get_report(self) -> List[Tuple[str, float, float, float, float | None]]:
+		"""Returns (stage, query time, wait time, apply time, time since the refresh began) for every stage that has been applied."""
+		report = []
+		for stage in self.stages.values():
+			if stage.state == "applied":
+				report.append((stage.name, *stage.get_timings(), self.get_time_since_begin(stage.name)))
+		return report
+
+
+# The pipeline for refreshing the provider connection, asset list and implementations.
+# The stage names are also used as the keys of their queries in the query runtime.
+pipeline = AF_RefreshPipeline({
+	"initialization": [],
+	"connection_status": ["initialization"],
+	"asset_list": ["initialization", "connection_status"],
+	"implementation_list": ["asset_list"],
+	"import_plans": ["implementation_list"]
+})
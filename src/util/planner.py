@@ -0,0 +1,114 @@
+"""This module contains the dependency graph used for planning imports.
+Nodes are ordered topologically (using Kahn's algorithm) in linear time, so that every node comes after all of its dependencies.
+Circular dependencies are reported with the chain of nodes that forms the cycle."""
+
+import collections
+from typing import Any, Dict, Iterable, List
+
+
+class AF_DependencyCycleException(Exception):
+	"""Raised if the nodes of a dependency graph depend on each other in a circle."""
+
+	def __init__(self, chain: List[str]):
+		self.chain = chain
+		super().__init__(f"Circular dependency: {' -> '.join(chain)}")
+
+
+class AF_PlanNode:
+	"""A node in a dependency graph along with arbitrary metadata (like the component it represents)."""
+
+	def __init__(self, node_id: str, dependencies: List[str], metadata: Dict[str, Any]):
+		self.node_id = node_id
+		self.dependencies = dependencies
+		self.metadata = metadata
+
+		# These are filled in by AF_DependencyGraph.get_order()
+		self.dependents: List[str] = []
+
+		# Length of the longest chain of dependencies inside the graph leading up to this node (0 if it has none)
+		self.depth = 0
+
+
+class AF_DependencyGraph:
+	"""A set of nodes which depend on each other.
+	Dependencies that are not nodes of the graph themselves are considered to be satisfied already."""
+
+	def __init__(self):
+		# Nodes in insertion order, which is also used to order nodes that don't depend on each other
+		self.nodes: Dict[str, AF_PlanNode] = {}
+
+	def __contains__(self, node_id: str) -> bool:
+		return node_id in self.nodes
+
+	def __len__(self) -> int:
+		return len(self.nodes)
+
+	def add_node(self, node_id: str, dependencies: Iterable[str] = (), **metadata) -> AF_PlanNode:
+		if node_id in self.nodes:
+			raise Exception(f"Node {node_id} has been added twice.")
+		node = AF_PlanNode(node_id, list(dependencies), metadata)
+		self.nodes[node_id] = node
+		return node
+
+	def get_order(self) -> List[AF_PlanNode]:
+		"""Returns all nodes such that every node comes after its dependencies.
+		Raises an AF_DependencyCycleException if that is impossible."""
+
+		# Step 1: Count the internal dependencies of every node and link the nodes to their dependents
+		remaining_dependencies: Dict[str, int] = {}
+		for node in self.nodes.values():
+			node.dependents = []
+			node.depth = 0
+		for node in self.nodes.values():
+			remaining_dependencies[node.node_id] = 0
+			for dependency_id in node.dependencies:
+				if dependency_id in self.nodes:
+					remaining_dependencies[node.node_id] += 1
+					self.nodes[dependency_id].dependents.append(node.node_id)
+
+		# Step 2: Repeatedly take a node without unresolved dependencies and resolve its dependents
+		ready_nodes = collections.deque(node for node in self.nodes.values() if remaining_dependencies[node.node_id] == 0)
+		order: List[AF_PlanNode] = []
+		while len(ready_nodes) > 0:
+			node = ready_nodes.popleft()
+			order.append(node)
+			for dependent_id in node.dependents:
+				dependent = self.nodes[dependent_id]
+				dependent.depth = max(dependent.depth, node.depth + 1)
+				remaining_dependencies[dependent_id] -= 1
+				if remaining_dependencies[dependent_id] == 0:
+					ready_nodes.append(dependent)
+
+		# Step 3: Nodes that were never resolved are part of (or depend on) a cycle
+		if len(order) < len(self.nodes):
+			unresolved_ids = {node_id for node_id, count in remaining_dependencies.items() if count > 0}
+			raise AF_DependencyCycleException(self.find_cycle(unresolved_ids))
+
+		return order
+
+	def find_cycle(self, node_ids: Iterable[str]) -> List[str]:
+		"""Finds one cycle among the given nodes and returns it as a chain of node ids that starts and ends with the same node."""
+		node_ids = set(node_ids)
+		visited = set()
+		for start_id in sorted(node_ids):
+			if start_id in visited:
+				continue
+
+			# Depth-first search using an explicit stack of (node id, iterator over its dependencies)
+			path: List[str] = [start_id]
+			path_positions = {start_id: 0}
+			stack = [iter(self.nodes[start_id].dependencies)]
+			visited.add(start_id)
+			while len(stack) > 0:
+				dependency_id = next(stack[-1], None)
+				if dependency_id is None:
+					path_positions.pop(path.pop())
+					stack.pop()
+				elif dependency_id in path_positions:
+					return path[path_positions[dependency_id]:] + [dependency_id]
+				elif dependency_id in node_ids and dependency_id not in visited:
+					visited.add(dependency_id)
+					path_positions[dependency_id] = len(path)
+					path.append(dependency_id)
+					stack.append(iter(self.nodes[dependency_id].dependencies))
+		return sorted(node_ids)
@@ -0,0 +1,124 @@
+"""This module contains the prefetcher which speculatively runs queries whose results are likely to be needed soon,
+for example the implementation lists of the assets next to the selected one.
+Prefetches run on their own low-priority pool, so they never delay queries the user is actually waiting for,
+and they are limited by a request budget so that providers don't receive a flood of requests while browsing."""
+
+import logging
+import time
+from typing import Any, Callable, Dict, Iterable
+
+from . import runtime
+
+LOGGER = logging.getLogger("af.util.prefetch")
+LOGGER.setLevel(logging.DEBUG)
+
+
+class AF_RequestBudget:
+	"""A token bucket which allows a certain number of requests per minute, while still permitting short bursts."""
+
+	def __init__(self, requests_per_minute: float, burst: int):
+		self.requests_per_minute = requests_per_minute
+		self.burst = burst
+		self.tokens = float(burst)
+		self.last_refill = time.monotonic()
+
+	def configure(self, requests_per_minute: float, burst: int):
+		self.refill()
+		self.requests_per_minute = requests_per_minute
+		self.burst = burst
+		self.tokens = min(self.tokens, float(burst))
+
+	def refill(self):
+		now = time.monotonic()
+		self.tokens = min(float(self.burst), self.tokens + (now - self.last_refill) * self.requests_per_minute / 60)
+		self.last_refill = now
+
+	def try_acquire(self) -> bool:
+		"""Takes one request from the budget, if there is one left."""
+		self.refill()
+		if self.tokens >= 1:
+			self.tokens -= 1
+			return True
+		return False
+
+
+class AF_PendingPrefetch:
+	"""The callbacks of a prefetch that has been submitted, which can be replaced as long as its result hasn't arrived."""
+
+	def __init__(self, on_success: Callable[[Any], None], on_error: Callable[[Exception], None]):
+		self.on_success = on_success
+		self.on_error = on_error
+
+
+class AF_Prefetcher:
+	"""Runs prefetch functions on a dedicated pool of the query runtime.
+	Every prefetch is identified by a key, so that the same result is never fetched twice at the same time.
+	Must only be used from the main thread."""
+
+	def __init__(self, requests_per_minute: float = 30, burst: int = 4, pool: str = "prefetch"):
+		self.budget = AF_RequestBudget(requests_per_minute, burst)
+		self.pool = pool
+		self.pending: Dict[str, AF_PendingPrefetch] = {}
+
+	def get_runtime_key(self, key: str) -> str:
+		return f"prefetch:{key}"
+
+	def is_pending(self, key: str) -> bool:
+		return key in self.pending
+
+	def prefetch(self, key: str, function: Callable[[], Any], on_success: Callable[[Any], None]) -> bool:
+		"""Runs the function in the background, unless it is already pending for the key.
+		Returns False if the request budget is exhausted."""
+		if key in self.pending:
+			return True
+
+		if not self.budget.try_acquire():
+			LOGGER.debug("Prefetch request budget exhausted.")
+			return False
+
+		def log_error(error: Exception):
+			LOGGER.debug(f"Prefetch for {key} failed: {error}")
+
+		pending_prefetch = AF_PendingPrefetch(on_success, log_error)
+
+		def complete(result):
+			if self.pending.get(key) is pending_prefetch:
+				del self.pending[key]
+			pending_prefetch.on_success(result)
+
+		def fail(error: Exception):
+			if self.pending.get(key) is pending_prefetch:
+				del self.pending[key]
+			pending_prefetch.on_error(error)
+
+		self.pending[key] = pending_prefetch
+		runtime.runtime.submit(function, on_success=complete, on_error=fail, pool=self.pool, key=self.get_runtime_key(key))
+		return True
+
+	def retain(self, keys: Iterable[str]):
+		"""Cancels all prefetches that haven't started yet and are not for one of the given keys."""
+		keys = set(keys)
+		for key in list(self.pending.keys()):
+			if key not in keys and runtime.runtime.cancel(self.get_runtime_key(key)):
+				del self.pending[key]
+
+	def take_over(self, key: str, on_success: Callable[[Any], None], on_error: Callable[[Exception], None]) -> bool:
+		"""Hands the result of a prefetch that is already running to the given callbacks instead, so that the query doesn't have to be sent again.
+		A prefetch that hasn't started yet is canceled instead, since sending the query directly is just as fast.
+		Returns whether the result will be passed to the callbacks. It is no longer considered a pending prefetch either way."""
+		if key not in self.pending:
+			return False
+
+		pending_prefetch = self.pending.pop(key)
+		if runtime.runtime.cancel(self.get_runtime_key(key)):
+			return False
+
+		pending_prefetch.on_success = on_success
+		pending_prefetch.on_error = on_error
+		return True
+
+	def cancel_all(self):
+		"""Discards all prefetches, including those that are already running (their results will be ignored)."""
+		for key in self.pending.keys():
+			runtime.runtime.invalidate(self.get_runtime_key(key))
+		self.pending.clear()
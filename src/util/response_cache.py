@@ -0,0 +1,178 @@
+"""This module contains the on-disk cache for responses from the provider's API endpoints (initialization, asset list and implementation list).
+Responses are stored along with their HTTP validators, so that an outdated response can be revalidated using If-None-Match or If-Modified-Since.
+If the provider answers with 304 the stored body is used again, which turns most navigation into a very small exchange.
+The cache is capped in size and evicts the least recently used responses first.
+Responses to requests carrying sensitive provider headers (like credentials) are never stored (see AF_HttpQuery.enable_response_cache())."""
+
+import email.utils
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from typing import Dict, Mapping
+
+LOGGER = logging.getLogger("af.util.response_cache")
+LOGGER.setLevel(logging.DEBUG)
+
+# Request headers that don't influence the content of a response and are therefore not part of the cache key
+IGNORED_REQUEST_HEADERS = {"user-agent", "accept", "accept-encoding", "connection"}
+
+
+# Names of the entry files (the cache key plus .json), so that other files in the directory are never touched
+ENTRY_FILE_NAME_PATTERN = re.compile(r"^[0-9a-f]{64}\.json$")
+
+# How often (in seconds) the directory is checked against the size limit at most
+EVICTION_INTERVAL = 60.0
+
+# When the cache directory was last checked against the size limit (shared by all cache instances)
+last_eviction = 0.0
+last_eviction_lock = threading.Lock()
+
+
+def get_cache_control_directives(headers: Mapping[str, str]) -> Dict[str, str]:
+	directives = {}
+	for directive in headers.get('Cache-Control', "").lower().split(","):
+		name, _, value = directive.strip().partition("=")
+		if name:
+			directives[name] = value.strip('"')
+	return directives
+
+
+def get_expiry_time(headers: Mapping[str, str], now: float, default_freshness: float = 0.0) -> float:
+	"""Determines until when a response may be used without revalidating it, based on its Cache-Control and Expires headers.
+	The default freshness (in seconds) is used if the provider didn't send either of them."""
+	directives = get_cache_control_directives(headers)
+
+	if "no-cache" in directives or "no-store" in directives:
+		return now
+
+	if "max-age" in directives:
+		try:
+			return now + int(directives['max-age'])
+		except ValueError:
+			return now
+
+	if "Expires" in headers:
+		try:
+			return email.utils.parsedate_to_datetime(headers['Expires']).timestamp()
+		except (TypeError, ValueError):
+			return now
+
+	return now + default_freshness
+
+
+def get_revalidation_headers(entry: Dict) -> Dict[str, str]:
+	"""Returns the conditional request headers for revalidating a cached response."""
+	headers = {}
+	if entry.get('etag'):
+		headers['If-None-Match'] = entry['etag']
+	if entry.get('last_modified'):
+		headers['If-Modified-Since'] = entry['last_modified']
+	return headers
+
+
+class AF_ResponseCache:
+	"""Stores response bodies in a directory, one file per request.
+	Every entry is written atomically into its own file, so the cache can be used from multiple worker threads at the same time.
+	The modification time of an entry's file records when it was last used, which is what eviction is based on."""
+
+	def __init__(self, directory: str, max_bytes: int = 64 * 1024 * 1024):
+		self.directory = directory
+		self.max_bytes = max_bytes
+
+	@staticmethod
+	def get_key(method: str, uri: str, parameters: Dict[str, str] | None, request_headers: Mapping[str, str]) -> str:
+		"""Calculates the cache key for a request from its method, URI, parameters and headers (which may include credentials)."""
+		relevant_headers = {name.lower(): value for name, value in request_headers.items() if name.lower() not in IGNORED_REQUEST_HEADERS}
+		key_data = json.dumps([method, uri, parameters or {}, relevant_headers], sort_keys=True)
+		return hashlib.sha256(key_data.encode("utf-8")).hexdigest()
+
+	def get_entry_path(self, key: str) -> str:
+		return os.path.join(self.directory, f"{key}.json")
+
+	def load(self, key: str) -> Dict | None:
+		entry_path = self.get_entry_path(key)
+		if not os.path.exists(entry_path):
+			return None
+		try:
+			with open(entry_path, 'r') as entry_file:
+				entry = json.load(entry_file)
+			os.utime(entry_path)
+			return entry
+		except Exception as e:
+			LOGGER.warning(f"Could not read cached response {entry_path}: {e}")
+			return None
+
+	def is_fresh(self, entry: Dict) -> bool:
+		return entry['expires'] > time.time()
+
+	def save(self, key: str, entry: Dict):
+		# The directory is only accessible to the current user if the cache creates it
+		os.makedirs(self.directory, mode=0o700, exist_ok=True)
+		temp_path = f"{self.get_entry_path(key)}.{uuid.uuid4().hex}.tmp"
+		with open(temp_path, 'w') as entry_file:
+			json.dump(entry, entry_file)
+		os.replace(temp_path, self.get_entry_path(key))
+		self.evict_if_due()
+
+	def evict_if_due(self):
+		"""Runs evict(), unless it has already run (in any instance) within the last EVICTION_INTERVAL seconds."""
+		global last_eviction
+		with last_eviction_lock:
+			if time.monotonic() - last_eviction < EVICTION_INTERVAL and last_eviction > 0:
+				return
+			last_eviction = time.monotonic()
+		self.evict()
+
+	def evict(self):
+		"""Removes the least recently used entries until the cache fits into max_bytes."""
+		entries = []
+		for file_name in os.listdir(self.directory):
+			if ENTRY_FILE_NAME_PATTERN.match(file_name):
+				try:
+					entry_stat = os.stat(os.path.join(self.directory, file_name))
+					entries.append((entry_stat.st_mtime, entry_stat.st_size, os.path.join(self.directory, file_name)))
+				except OSError:
+					# The entry has been removed by another thread in the meantime
+					pass
+
+		total_bytes = sum(entry_bytes for last_used, entry_bytes, entry_path in entries)
+		if total_bytes <= self.max_bytes:
+			return
+
+		for last_used, entry_bytes, entry_path in sorted(entries):
+			if total_bytes <= self.max_bytes:
+				break
+			try:
+				os.remove(entry_path)
+				total_bytes -= entry_bytes
+			except OSError as e:
+				LOGGER.warning(f"Could not evict {entry_path} from the response cache: {e}")
+		LOGGER.info(f"Evicted responses, the cache now holds {total_bytes} bytes.")
+
+	def remove(self, key: str):
+		entry_path = self.get_entry_path(key)
+		if os.path.exists(entry_path):
+			os.remove(entry_path)
+
+	def store(self, key: str, content: str, response_headers: Mapping[str, str]):
+		"""Stores a response body, unless the provider has forbidden it."""
+		if "no-store" in get_cache_control_directives(response_headers):
+			return
+		self.save(key, {
+			"content": content,
+			"expires": get_expiry_time(response_headers, time.time()),
+			"etag": response_headers.get('ETag'),
+			"last_modified": response_headers.get('Last-Modified')
+		})
+
+	def refresh(self, key: str, entry: Dict, response_headers: Mapping[str, str]):
+		"""Records that a cached response has been revalidated (the provider answered with 304)."""
+		entry['expires'] = get_expiry_time(response_headers, time.time())
+		entry['etag'] = response_headers.get('ETag', entry.get('etag'))
+		entry['last_modified'] = response_headers.get('Last-Modified', entry.get('last_modified'))
+		self.save(key, entry)
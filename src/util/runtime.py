@@ -0,0 +1,174 @@
+"""This module contains the runtime for running provider queries without blocking Blender's UI.
+Network I/O, JSON parsing and validation run on worker threads. The results are handed back to the main thread through a queue
+which gets drained by a bpy.app.timers function, because Blender's data may only be modified from the main thread."""
+
+import concurrent.futures
+import logging
+import queue
+import threading
+from typing import Any, Callable, Dict
+import bpy
+
+LOGGER = logging.getLogger("af.util.runtime")
+LOGGER.setLevel(logging.DEBUG)
+
+# How many worker threads every pool may use
+# (Prefetches only get a single thread so that they always stay in the background)
+POOL_SIZES = {"queries": 4, "thumbnails": 4, "prefetch": 1, "extraction": 2}
+
+# How often the result queue is checked while work is pending (in seconds)
+DISPATCH_INTERVAL = 0.05
+
+
+def tag_redraw_all():
+	"""Tags every area for redrawing so that panels pick up newly applied data."""
+	for window in bpy.context.window_manager.windows:
+		for area in window.screen.areas:
+			area.tag_redraw()
+
+
+class AF_QueryRuntime:
+	"""Runs functions on named thread pools and calls their callbacks on the main thread.
+	Work can be submitted under a key. Submitting new work under the same key supersedes the older work,
+	whose result (if it still arrives) is then discarded instead of being applied."""
+
+	def __init__(self):
+		self.executors: Dict[str, concurrent.futures.ThreadPoolExecutor] = {}
+
+		# Finished work waiting to be dispatched on the main thread: (key, generation, callback, result)
+		self.results = queue.SimpleQueue()
+
+		# The latest generation of every key and the futures belonging to it
+		self.generations: Dict[str, int] = {}
+		self.futures: Dict[str, concurrent.futures.Future] = {}
+
+		# Number of submitted jobs whose callbacks have not been dispatched yet
+		self.pending_count = 0
+		self.lock = threading.Lock()
+
+		self.timer_registered = False
+
+	def get_executor(self, pool: str) -> concurrent.futures.ThreadPoolExecutor:
+		if pool not in self.executors:
+			self.executors[pool] = concurrent.futures.ThreadPoolExecutor(max_workers=POOL_SIZES.get(pool, 1), thread_name_prefix=f"af-{pool}")
+		return self.executors[pool]
+
+	def submit(self,
+		function: Callable[[], Any],
+		on_success: Callable[[Any], None],
+		on_error: Callable[[Exception], None] = None,
+		pool: str = "queries",
+		key: str = None) -> concurrent.futures.Future:
+		"""Runs the function on the given pool. Its result (or the exception it raised) is passed to on_success (or on_error) on the main thread.
+		Must be called from the main thread."""
+
+		generation = None
+		if key is not None:
+			generation = self.invalidate(key)
+
+		def run():
+			try:
+				result = function()
+				self.results.put((key, generation, on_success, result))
+			except Exception as e:
+				LOGGER.error(f"Background work for {key} failed: {e}")
+				self.results.put((key, generation, on_error, e))
+
+		with self.lock:
+			self.pending_count += 1
+
+		future = self.get_executor(pool).submit(run)
+		if key is not None:
+			self.futures[key] = future
+
+		self.ensure_timer()
+		return future
+
+	def invalidate(self, key: str) -> int:
+		"""Supersedes all work that has been submitted under the key, so that its result will not be applied.
+		Work that hasn't started yet gets canceled. Returns the new generation of the key."""
+		self.generations[key] = self.generations.get(key, 0) + 1
+
+		previous_future = self.futures.pop(key, None)
+		if previous_future is not None and previous_future.cancel():
+			with self.lock:
+				self.pending_count -= 1
+
+		return self.generations[key]
+
+	def cancel(self, key: str) -> bool:
+		"""Cancels the work submitted under the key, if it hasn't started yet. Returns whether it was canceled."""
+		future = self.futures.get(key)
+		if future is not None and future.cancel():
+			del self.futures[key]
+			with self.lock:
+				self.pending_count -= 1
+			return True
+		return False
+
+	def is_pending(self, key: str) -> bool:
+		future = self.futures.get(key)
+		return future is not None and not future.done()
+
+	def ensure_timer(self):
+		if not self.timer_registered:
+			bpy.app.timers.register(dispatch_results, first_interval=0.0)
+			self.timer_registered = True
+
+	def dispatch(self) -> float | None:
+		"""Applies all results that have arrived since the last call. Returns when the timer should run next (None to stop it)."""
+		dispatched_any = False
+		while True:
+			try:
+				key, generation, callback, result = self.results.get_nowait()
+			except queue.Empty:
+				break
+
+			with self.lock:
+				self.pending_count -= 1
+
+			# Skip results that have been superseded in the meantime
+			if key is not None and self.generations.get(key) != generation:
+				LOGGER.debug(f"Discarding superseded result for {key}.")
+				continue
+
+			if key is not None and self.futures.get(key) is not None and self.futures[key].done():
+				del self.futures[key]
+
+			if callback is not None:
+				try:
+					callback(result)
+				except Exception as e:
+					LOGGER.exception(f"Applying the result for {key} failed: {e}")
+			dispatched_any = True
+
+		if dispatched_any:
+			tag_redraw_all()
+
+		with self.lock:
+			if self.pending_count > 0:
+				return DISPATCH_INTERVAL
+			self.timer_registered = False
+			return None
+
+	def shutdown(self):
+		"""Discards all pending work and stops the worker threads."""
+		for key in list(self.generations.keys()):
+			self.invalidate(key)
+		for executor in self.executors.values():
+			executor.shutdown(wait=False, cancel_futures=True)
+		self.executors.clear()
+		if bpy.app.timers.is_registered(dispatch_results):
+			bpy.app.timers.unregister(dispatch_results)
+		self.timer_registered = False
+		with self.lock:
+			self.pending_count = 0
+
+
+# The runtime used for all provider queries
+runtime = AF_QueryRuntime()
+
+
+def dispatch_results():
+	# bpy.app.timers needs a plain function (bound methods can't be unregistered reliably)
+	return runtime.dispatch()
@@ -0,0 +1,75 @@
+"""This module contains the scheduler which debounces actions that are triggered by property updates.
+Editing a search term or a header can trigger the same queries many times in a row. The scheduler coalesces these triggers
+and only runs the action once no new trigger has arrived for a short quiet window."""
+
+import logging
+import time
+from typing import Callable, Dict, Tuple
+import bpy
+
+LOGGER = logging.getLogger("af.util.scheduler")
+LOGGER.setLevel(logging.DEBUG)
+
+
+class AF_DebounceScheduler:
+	"""Runs actions on the main thread (using bpy.app.timers) after a delay.
+	Scheduling an action under a key that already has a scheduled action replaces it and restarts the delay."""
+
+	def __init__(self):
+		# key -> (time at which the action is due, action)
+		self.scheduled: Dict[str, Tuple[float, Callable[[], None]]] = {}
+		self.timer_registered = False
+
+	def schedule(self, key: str, action: Callable[[], None], delay: float):
+		"""Runs the action after delay seconds, unless the key gets scheduled again in the meantime."""
+		self.scheduled[key] = (time.monotonic() + delay, action)
+		if not self.timer_registered:
+			bpy.app.timers.register(run_scheduled_actions, first_interval=delay)
+			self.timer_registered = True
+
+	def cancel(self, key: str):
+		"""Drops the scheduled action for the key, if there is one."""
+		self.scheduled.pop(key, None)
+
+	def flush(self, key: str):
+		"""Runs the scheduled action for the key right away, if there is one."""
+		scheduled_action = self.scheduled.pop(key, None)
+		if scheduled_action is not None:
+			self.run_action(key, scheduled_action[1])
+
+	def run_action(self, key: str, action: Callable[[], None]):
+		LOGGER.debug(f"Running scheduled action {key}")
+		try:
+			action()
+		except Exception as e:
+			LOGGER.exception(f"Scheduled action {key} failed: {e}")
+
+	def tick(self) -> float | None:
+		"""Runs all actions that are due. Returns when the timer should run next (None to stop it)."""
+		now = time.monotonic()
+		for key, (due_time, action) in list(self.scheduled.items()):
+			# The action may have been rescheduled or flushed by another action in the meantime
+			if due_time <= now and self.scheduled.get(key, (None, None))[1] is action:
+				del self.scheduled[key]
+				self.run_action(key, action)
+
+		if len(self.scheduled) > 0:
+			return max(0.0, min(due_time for due_time, action in self.scheduled.values()) - time.monotonic())
+
+		self.timer_registered = False
+		return None
+
+	def shutdown(self):
+		self.scheduled.clear()
+		if bpy.app.timers.is_registered(run_scheduled_actions):
+			bpy.app.timers.unregister(run_scheduled_actions)
+		self.timer_registered = False
+
+
+# The scheduler used for all debounced property updates
+scheduler = AF_DebounceScheduler()
+
+
+def run_scheduled_actions():
+	# bpy.app.timers needs a plain function (bound methods can't be unregistered reliably)
+	return scheduler.tick()
@@ -0,0 +1,105 @@
+"""This module contains the global download store.
+The store is a content-addressed directory of downloaded files that is shared between all projects and implementations.
+Files are identified by the query that was used to download them and their size, which allows a download to be replaced
+by a hardlink (or a reflink/copy, if hardlinks are not possible) to a file that has been downloaded before.
+Since materialized files may share their data with the stored object, files in an implementation directory must never be written in place.
+They are unlinked first (see unlink_before_writing()) and files are only ever copied (or reflinked) into the store, never hardlinked."""
+
+import hashlib
+import logging
+import os
+import shutil
+import sys
+import uuid
+
+LOGGER = logging.getLogger("af.util.store")
+LOGGER.setLevel(logging.DEBUG)
+
+# ioctl request code for cloning a file on Linux file systems with copy-on-write support (btrfs, xfs, ...)
+FICLONE = 0x40049409
+
+
+def get_store_key(source: str, expected_bytes: int) -> str:
+	"""Calculates the key under which a file is kept in the store."""
+	return hashlib.sha256(f"{source}|{expected_bytes}".encode("utf-8")).hexdigest()
+
+
+def unlink_before_writing(path: str):
+	"""Removes the file at path (if there is one) before it gets written again.
+	The file may be a hardlink to an object in the store, which would be changed along with every other copy of it if it was written in place."""
+	if os.path.lexists(path):
+		os.remove(path)
+
+
+def link_or_copy_file(source_path: str, destination_path: str, allow_hardlink: bool = True) -> str:
+	"""Makes the content of source_path available at destination_path as cheaply as possible.
+	Without allow_hardlink, the destination never shares its data with the source in a way that writing to one would change the other.
+	The destination is replaced atomically. Returns the method that was used ("hardlink", "reflink" or "copy")."""
+
+	temp_path = f"{destination_path}.{uuid.uuid4().hex}.tmp"
+	try:
+		method = None
+		if allow_hardlink:
+			try:
+				os.link(source_path, temp_path)
+				method = "hardlink"
+			except OSError:
+				method = None
+
+		if method is None and sys.platform.startswith("linux"):
+			try:
+				import fcntl
+				with open(source_path, 'rb') as source_file, open(temp_path, 'wb') as temp_file:
+					fcntl.ioctl(temp_file.fileno(), FICLONE, source_file.fileno())
+				method = "reflink"
+			except OSError:
+				method = None
+
+		if method is None:
+			shutil.copyfile(source_path, temp_path)
+			method = "copy"
+
+		os.replace(temp_path, destination_path)
+		return method
+	finally:
+		if os.path.exists(temp_path):
+			os.remove(temp_path)
+
+
+class AF_DownloadStore:
+	"""A content-addressed store of downloaded files. Only files with a known size are stored,
+	since the size is the only indication available that the content behind a query has not changed."""
+
+	def __init__(self, directory: str):
+		self.directory = directory
+
+	def get_object_path(self, key: str) -> str:
+		return os.path.join(self.directory, key[:2], key)
+
+	def contains(self, key: str, expected_bytes: int) -> bool:
+		object_path = self.get_object_path(key)
+		return expected_bytes > 0 and os.path.isfile(object_path) and os.path.getsize(object_path) == expected_bytes
+
+	def materialize(self, key: str, expected_bytes: int, destination_path: str) -> bool:
+		"""Places the stored file at the destination, if the store has it. Returns whether this was successful."""
+		if not self.contains(key, expected_bytes):
+			return False
+		try:
+			method = link_or_copy_file(self.get_object_path(key), destination_path)
+			LOGGER.info(f"Materialized {destination_path} from the download store using {method}.")
+			return True
+		except OSError as e:
+			LOGGER.warning(f"Could not materialize {destination_path} from the download store: {e}")
+			return False
+
+	def insert(self, key: str, expected_bytes: int, file_path: str):
+		"""Adds a downloaded file to the store, if it isn't already present."""
+		if expected_bytes <= 0 or os.path.getsize(file_path) != expected_bytes or self.contains(key, expected_bytes):
+			return
+		try:
+			os.makedirs(os.path.dirname(self.get_object_path(key)), exist_ok=True)
+			# The file stays in the implementation directory where it may be rewritten later, so the store gets its own copy
+			method = link_or_copy_file(file_path, self.get_object_path(key), allow_hardlink=False)
+			LOGGER.info(f"Added {file_path} to the download store using {method}.")
+		except OSError as e:
+			LOGGER.warning(f"Could not add {file_path} to the download store: {e}")
@@ -0,0 +1,132 @@
+"""This module contains the persistent cache for thumbnails (and other UI images).
+The cache keeps an index file next to the images which records every image's size, when it was last used and the HTTP validators
+needed to revalidate it. This means that the directory never needs to be scanned and that the least recently used images can be evicted
+once the cache exceeds its byte budget."""
+
+import json
+import logging
+import os
+import re
+import time
+from typing import Dict, Mapping
+
+from .response_cache import get_expiry_time, get_revalidation_headers
+
+LOGGER = logging.getLogger("af.util.thumbnail_cache")
+LOGGER.setLevel(logging.DEBUG)
+
+# Name of the index file inside the cache directory
+INDEX_FILE_NAME = "index.json"
+
+# Names of the files written by the cache: The sha1 hash of the image's URI (see ui_images.py), plus temporary files of unfinished downloads
+CACHE_FILE_NAME_PATTERN = re.compile(r"^[0-9a-f]{40}(\.tmp)?$")
+
+# How long an image is considered fresh if the provider did not send any caching headers (in seconds)
+DEFAULT_FRESHNESS = 24 * 60 * 60
+
+
+class AF_ThumbnailCache:
+	"""A size-capped cache of downloaded images with least-recently-used eviction.
+	The index is only modified from the main thread."""
+
+	def __init__(self, directory: str):
+		self.directory = directory
+
+		# uri hash -> {"uri", "bytes", "last_used", "expires", "etag", "last_modified"}
+		self.entries: Dict[str, Dict] = {}
+		self.is_dirty = False
+		self.last_saved = 0.0
+
+		os.makedirs(directory, exist_ok=True)
+		index_path = os.path.join(directory, INDEX_FILE_NAME)
+		if os.path.exists(index_path):
+			try:
+				with open(index_path, 'r') as index_file:
+					self.entries = json.load(index_file)
+			except Exception as e:
+				LOGGER.warning(f"Could not read thumbnail cache index {index_path}, starting with an empty cache: {e}")
+		else:
+			# Images without an index can't be tracked and would never be evicted, so they are removed.
+			# The directory can be changed by the user, so only files that the cache has written itself are touched.
+			for file_name in os.listdir(directory):
+				if CACHE_FILE_NAME_PATTERN.match(file_name) and os.path.isfile(os.path.join(directory, file_name)):
+					os.remove(os.path.join(directory, file_name))
+
+	def get_file_path(self, uri_hash: str) -> str:
+		return os.path.join(self.directory, uri_hash)
+
+	def get_total_bytes(self) -> int:
+		return sum(entry['bytes'] for entry in self.entries.values())
+
+	def get_entry(self, uri_hash: str) -> Dict | None:
+		"""Returns the index entry for an image and marks it as recently used."""
+		entry = self.entries.get(uri_hash)
+		if entry is not None:
+			entry['last_used'] = time.time()
+			self.is_dirty = True
+		return entry
+
+	def is_fresh(self, entry: Dict) -> bool:
+		return entry['expires'] > time.time()
+
+	def get_revalidation_headers(self, entry: Dict) -> Dict[str, str]:
+		"""Returns the conditional request headers for revalidating an image."""
+		return get_revalidation_headers(entry)
+
+	def store(self, uri_hash: str, uri: str, headers: Mapping[str, str]):
+		"""Records that the image for uri_hash has just been (re-)downloaded into the cache directory."""
+		now = time.time()
+		self.entries[uri_hash] = {
+			"uri": uri,
+			"bytes": os.path.getsize(self.get_file_path(uri_hash)),
+			"last_used": now,
+			"expires": get_expiry_time(headers, now, DEFAULT_FRESHNESS),
+			"etag": headers.get('ETag'),
+			"last_modified": headers.get('Last-Modified')
+		}
+		self.is_dirty = True
+
+	def refresh(self, uri_hash: str, headers: Mapping[str, str]):
+		"""Records that an image has been revalidated and is still up to date."""
+		entry = self.entries.get(uri_hash)
+		if entry is not None:
+			now = time.time()
+			entry['expires'] = get_expiry_time(headers, now, DEFAULT_FRESHNESS)
+			entry['etag'] = headers.get('ETag', entry.get('etag'))
+			entry['last_modified'] = headers.get('Last-Modified', entry.get('last_modified'))
+			self.is_dirty = True
+
+	def forget(self, uri_hash: str):
+		"""Removes an image from the cache."""
+		if uri_hash in self.entries:
+			del self.entries[uri_hash]
+			self.is_dirty = True
+		if os.path.exists(self.get_file_path(uri_hash)):
+			os.remove(self.get_file_path(uri_hash))
+
+	def evict(self, max_bytes: int):
+		"""Removes the least recently used images until the cache fits into max_bytes."""
+		total_bytes = self.get_total_bytes()
+		if total_bytes <= max_bytes:
+			return
+
+		for uri_hash, entry in sorted(self.entries.items(), key=lambda item: item[1]['last_used']):
+			if total_bytes <= max_bytes:
+				break
+			total_bytes -= entry['bytes']
+			try:
+				self.forget(uri_hash)
+			except OSError as e:
+				LOGGER.warning(f"Could not evict {uri_hash} from the thumbnail cache: {e}")
+		LOGGER.info(f"Evicted thumbnails, the cache now holds {total_bytes} bytes.")
+
+	def save(self, min_interval: float = 0.0):
+		"""Writes the index to disk, if it has changed and wasn't saved within the last min_interval seconds."""
+		if not self.is_dirty or time.time() - self.last_saved < min_interval:
+			return
+		index_path = os.path.join(self.directory, INDEX_FILE_NAME)
+		with open(index_path + ".tmp", 'w') as index_file:
+			json.dump(self.entries, index_file)
+		os.replace(index_path + ".tmp", index_path)
+		self.is_dirty = False
+		self.last_saved = time.time()
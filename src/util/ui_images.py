@@ -1,5 +1,8 @@
-from . import http
-import logging, bpy, os, hashlib, shutil
+from . import http, runtime
+from .thumbnail_cache import AF_ThumbnailCache
+import logging, bpy, os, hashlib
+import requests
+from typing import Callable, Dict, List, Tuple
 
 LOGGER = logging.getLogger("af.util.ui_images")
 LOGGER.setLevel(logging.DEBUG)
@@ -7,18 +10,50 @@ LOGGER.setLevel(logging.DEBUG)
 # Registry of images that are currently loaded into Blender as preview icons
 registry: bpy.utils.previews.ImagePreviewCollection = bpy.utils.previews.new()
 
+# Icon that is shown while an image is still being downloaded (or if it could not be downloaded)
+PLACEHOLDER_ICON_ID = bpy.types.UILayout.bl_rna.functions["prop"].parameters["icon"].enum_items['IMAGE'].value
+
+# Hashes of the images that are currently being downloaded or whose download has failed
+pending_images = set()
+failed_images = set()
+
+# The persistent cache holding all downloaded images (loaded on first use)
+thumbnail_cache: AF_ThumbnailCache | None = None
+
+# How often the cache index gets written to disk while images are being downloaded (in seconds)
+INDEX_SAVE_INTERVAL = 5.0
+
+# Number of items before and after the visible window of a list whose images are downloaded ahead of time
+VISIBLE_PASS_MARGIN = 12
+
+# Indices of the list items that have been drawn during the current visible pass (None if no pass is running)
+visible_pass_indices: List[int] | None = None
+
+# Hashes of the images that have been requested for a visible pass and might still be waiting for a download slot
+visible_pass_images = set()
+
+
+def get_thumbnail_cache() -> AF_ThumbnailCache:
+	global thumbnail_cache
+	directory = bpy.context.window_manager.af.ui_image_directory
+	if thumbnail_cache is None or thumbnail_cache.directory != directory:
+		thumbnail_cache = AF_ThumbnailCache(directory)
+	return thumbnail_cache
+
 
 def reset_image_cache():
-	"""Empties the temporary thumbnail directory and flushes all thumbnails from memory"""
+	"""Flushes all thumbnails from memory.
+	The images on disk are kept for the next session, only the index of the thumbnail cache is saved."""
 
-	# Empty temp directory
-	if os.path.exists(bpy.context.window_manager.af.ui_image_directory):
-		shutil.rmtree(bpy.context.window_manager.af.ui_image_directory)
-	os.makedirs(bpy.context.window_manager.af.ui_image_directory, exist_ok=True)
+	if thumbnail_cache is not None:
+		thumbnail_cache.save()
 
 	# Clear icons from memory
 	if registry:
 		registry.clear()
+	pending_images.clear()
+	failed_images.clear()
+	visible_pass_images.clear()
 
 
 def get_sha1_hash(string: str):
@@ -33,28 +68,149 @@ def get_sha1_hash(string: str):
 
 
 def get_ui_image_icon_id(uri: str) -> int:
-	"""Load an image from the given URL and imports it into Blender as an icon, so that it can be used in UI panels.
-	The image is stored in a temporary directory using the sha1 of the URI as its name.
-	If the requested file is already on disk then it is not loaded again.
-	It returns the 'icon_id' for this image.
+	"""Returns the 'icon_id' for the image at the given URL, so that it can be used in UI panels.
+	The image is stored in the thumbnail cache using the sha1 of the URI as its name.
+	If the requested file is not in the cache yet it gets downloaded in the background and a placeholder icon is returned until then.
+	Cached images that are no longer fresh are shown right away and revalidated in the background.
+	The UI is redrawn automatically once an image has arrived.
 	"""
 
 	# Helpful variables
-	af = bpy.context.window_manager.af
+	cache = get_thumbnail_cache()
 	uri_hash = get_sha1_hash(uri)
-	target_file_location = os.path.join(af.ui_image_directory, uri_hash)
+	target_file_location = cache.get_file_path(uri_hash)
+	cache_entry = cache.get_entry(uri_hash)
+
+	# Image is already loaded
+	if uri_hash in registry.keys():
+		return registry[uri_hash].icon_id
+
+	# Image is already in the cache and only needs to be loaded into blender
+	if cache_entry is not None and os.path.exists(target_file_location):
+		load_ui_image(uri_hash, target_file_location)
+		if not cache.is_fresh(cache_entry):
+			request_ui_image(uri, uri_hash, cache.get_revalidation_headers(cache_entry))
+		return registry[uri_hash].icon_id
+
+	# Image must be downloaded
+	request_ui_image(uri, uri_hash, {})
+	return PLACEHOLDER_ICON_ID
+
+
+def download_ui_image(query: http.AF_HttpQuery, file_location: str, revalidation_headers: Dict[str, str]) -> Tuple[int, requests.structures.CaseInsensitiveDict]:
+	"""Downloads (or revalidates) an image on a worker thread. Returns the status code and the headers of the response."""
+	response = query.open_stream(extra_headers=revalidation_headers)
+	try:
+		if response.status_code == 304:
+			return response.status_code, response.headers
+		response.raise_for_status()
+
+		# Download into a temporary file first, so that an interrupted download never ends up in the cache
+		temp_file_location = f"{file_location}.tmp"
+		with open(temp_file_location, 'wb') as file_handle:
+			for chunk in response.iter_content(chunk_size=query.chunk_size):
+				file_handle.write(chunk)
+		os.replace(temp_file_location, file_location)
+		return response.status_code, response.headers
+	finally:
+		response.close()
+
+
+def request_ui_image(uri: str, uri_hash: str, revalidation_headers: Dict[str, str]):
+	"""Downloads an image in the background, unless this is already happening or has failed before.
+	If revalidation headers are given, the cached image is only downloaded again if it has changed."""
 
-	# Download image, if needed
-	if not os.path.exists(target_file_location):
-		# Image must be downloaded
-		image_query = http.AF_HttpQuery(uri, "get", None)
-		image_query.execute_as_file(target_file_location)
-		LOGGER.debug(f"Downloaded ui image from {uri} into {target_file_location}")
+	if uri_hash in pending_images or uri_hash in failed_images:
+		return
 
-	# Load image into blender, if needed
+	pending_images.add(uri_hash)
+	cache = get_thumbnail_cache()
+	file_location = cache.get_file_path(uri_hash)
+	image_query = http.AF_HttpQuery(uri, "get", None)
+
+	def on_success(result):
+		from ..property.preferences import AF_PR_Preferences
+		status_code, headers = result
+		pending_images.discard(uri_hash)
+
+		if status_code == 304:
+			cache.refresh(uri_hash, headers)
+		else:
+			LOGGER.debug(f"Downloaded ui image from {uri} into {file_location}")
+			cache.store(uri_hash, uri, headers)
+			if uri_hash in registry.keys():
+				registry[uri_hash].reload()
+			else:
+				load_ui_image(uri_hash, file_location)
+
+		cache.evict(AF_PR_Preferences.get_prefs().thumbnail_cache_size * 1024 * 1024)
+		cache.save(min_interval=INDEX_SAVE_INTERVAL)
+
+	def on_error(error: Exception):
+		pending_images.discard(uri_hash)
+		failed_images.add(uri_hash)
+		LOGGER.warning(f"Could not download ui image from {uri}: {error}")
+
+	runtime.runtime.submit(lambda: download_ui_image(image_query, file_location, revalidation_headers),
+		on_success=on_success,
+		on_error=on_error,
+		pool="thumbnails",
+		key=f"thumbnail:{uri_hash}")
+
+
+def load_ui_image(uri_hash: str, file_location: str):
+	"""Loads an image file into blender, if it isn't loaded yet."""
 	if uri_hash not in registry.keys():
-		registry.load(name=uri_hash, path=target_file_location, path_type='IMAGE')
-		LOGGER.debug(f"Registered ui image from {target_file_location} with ID {registry[uri_hash].icon_id}")
+		registry.load(name=uri_hash, path=file_location, path_type='IMAGE')
+		LOGGER.debug(f"Registered ui image from {file_location} with ID {registry[uri_hash].icon_id}")
+
+
+# Visible passes
+# Lists which show images for their items (like the asset grid) report which items are on screen during every redraw.
+# The images of items just outside of the visible window are downloaded ahead of time and queued downloads for items
+# that the user has scrolled away from get canceled, so that large lists never cause all of their images to be downloaded.
+
+
+def begin_visible_pass():
+	"""Starts recording the items that get drawn by a list."""
+	global visible_pass_indices
+	visible_pass_indices = []
+
+
+def mark_visible(index: int):
+	"""Records that the list item at this index is currently being drawn."""
+	if visible_pass_indices is not None:
+		visible_pass_indices.append(index)
+
+
+def end_visible_pass(get_uri: Callable[[int], str | None], item_count: int):
+	"""Finishes the recording, prefetches the images around the visible window and cancels queued downloads outside of it.
+	get_uri returns the image URI for the item at an index (or None if the item has no image)."""
+	global visible_pass_indices
+	visible_indices = visible_pass_indices
+	visible_pass_indices = None
+	if not visible_indices:
+		return
+
+	cache = get_thumbnail_cache()
+	first_index = max(0, min(visible_indices) - VISIBLE_PASS_MARGIN)
+	last_index = min(item_count - 1, max(visible_indices) + VISIBLE_PASS_MARGIN)
+
+	wanted_images = set()
+	for index in range(first_index, last_index + 1):
+		uri = get_uri(index)
+		if uri is None:
+			continue
+		uri_hash = get_sha1_hash(uri)
+		wanted_images.add(uri_hash)
+
+		# Images of visible items have already been requested while drawing them
+		if uri_hash not in registry.keys() and uri_hash not in cache.entries:
+			request_ui_image(uri, uri_hash, {})
 
-	# Return the icon id
-	return registry[uri_hash].icon_id
+	# Queued downloads which are no longer needed are canceled (running ones are allowed to finish)
+	for uri_hash in visible_pass_images - wanted_images:
+		if runtime.runtime.cancel(f"thumbnail:{uri_hash}"):
+			pending_images.discard(uri_hash)
+	visible_pass_images.clear()
+	visible_pass_images.update(wanted_images & pending_images)
@@ -0,0 +1,214 @@
+"""This module contains the validation of incoming responses against the AssetFetch json-schema."""
+
+import json
+import logging
+import os
+import pathlib
+import threading
+import time
+from typing import Callable, Dict, List, Tuple
+import jsonschema
+
+from .. import SCHEMA_PATH
+from .addon_constants import AF_ValidationMode
+
+LOGGER = logging.getLogger("af.util.validation")
+LOGGER.setLevel(logging.INFO)
+
+
+class AF_SchemaRegistry:
+	"""Loads the entire json-schema tree from disk once and keeps one prepared validator per endpoint kind.
+	References between schema files are resolved from memory, so validating a response does not touch the disk.
+	RefResolver objects are not thread-safe, which is why every thread gets its own set of validators (all of them share the loaded schemas)."""
+
+	def __init__(self, schema_path: str):
+		self.schema_path = schema_path
+
+		# All loaded schema documents, keyed by their file URI (and their $id, if they have one)
+		self.store: Dict[str, Dict] | None = None
+		self.store_lock = threading.Lock()
+
+		# Validators that have been prepared on the current thread, keyed by endpoint kind
+		self.thread_local = threading.local()
+
+		# Kinds for which a response has already been fully validated (used by the "first per kind" mode)
+		self.validated_kinds = set()
+
+	def get_endpoint_schema_uri(self, kind: str) -> str:
+		return pathlib.Path(self.schema_path, "endpoint", f"{kind}.json").resolve().as_uri()
+
+	def load_store(self) -> Dict[str, Dict]:
+		"""Reads all schema files into memory, if this has not happened yet."""
+		with self.store_lock:
+			if self.store is None:
+				store = {}
+				for root, dirs, files in os.walk(self.schema_path):
+					for file_name in files:
+						if not file_name.endswith(".json"):
+							continue
+						file_path = pathlib.Path(root, file_name).resolve()
+						with open(file_path, 'r') as schema_file:
+							schema = json.load(schema_file)
+						store[file_path.as_uri()] = schema
+						if isinstance(schema, dict) and "$id" in schema:
+							store[schema['$id']] = schema
+
+						# Check every schema only once instead of during every validation
+						jsonschema.validators.validator_for(schema).check_schema(schema)
+
+				LOGGER.info(f"Loaded {len(store)} schemas from {self.schema_path}")
+				self.store = store
+		return self.store
+
+	def get_validator(self, kind: str):
+		"""Returns the validator for an endpoint kind, preparing it on first use on the current thread."""
+		validators = getattr(self.thread_local, "validators", None)
+		if validators is None:
+			validators = {}
+			self.thread_local.validators = validators
+
+		if kind not in validators:
+			store = self.load_store()
+			schema_uri = self.get_endpoint_schema_uri(kind)
+			if schema_uri not in store:
+				raise Exception(f"Kind {kind} is not recognized as an endpoint kind because no schema could be found at {schema_uri}.")
+
+			schema = store[schema_uri]
+			validator_class = jsonschema.validators.validator_for(schema)
+			resolver = jsonschema.RefResolver(base_uri=schema_uri, referrer=schema, store=store)
+			validators[kind] = validator_class(schema, resolver=resolver)
+
+		return validators[kind]
+
+	def validate(self, kind: str, instance: Dict):
+		"""Validates a parsed response against the schema for its kind and raises the most relevant error if it is invalid."""
+		error = jsonschema.exceptions.best_match(self.get_validator(kind).iter_errors(instance))
+		if error is not None:
+			raise error
+
+
+	def reset_validated_kinds(self):
+		"""Makes the "first per kind" mode fully validate the next response of every kind again, for example after connecting to a new provider."""
+		self.validated_kinds.clear()
+
+
+class AF_ValidationStatistics:
+	"""Keeps track of how many responses have been validated and how much time was spent on it, per validation mode and response kind."""
+
+	def __init__(self):
+		self.lock = threading.Lock()
+
+		# (mode, kind) -> [response count, total seconds]
+		self.entries: Dict[Tuple[str, str], List] = {}
+
+	def record(self, mode: str, kind: str, seconds: float):
+		with self.lock:
+			entry = self.entries.setdefault((mode, kind), [0, 0.0])
+			entry[0] += 1
+			entry[1] += seconds
+
+	def get_entries(self) -> List[Tuple[str, str, int, float]]:
+		"""Returns (mode, kind, response count, total seconds) for every combination that has been recorded."""
+		with self.lock:
+			return [(mode, kind, entry[0], entry[1]) for (mode, kind), entry in sorted(self.entries.items())]
+
+	def reset(self):
+		with self.lock:
+			self.entries.clear()
+
+
+# Structural checks
+# These only cover the fields that the addon actually reads from each kind of response,
+# which is much faster than a full schema validation but won't catch anything else.
+
+
+def require_structure(condition: bool, kind: str, message: str):
+	if not condition:
+		raise Exception(f"Response of kind {kind} failed the structural check: {message}")
+
+
+def require_list_of_objects(items, kind: str, field_name: str):
+	require_structure(isinstance(items, list), kind, f"Field '{field_name}' must be a list.")
+	for item in items:
+		require_structure(isinstance(item, dict), kind, f"Every entry in '{field_name}' must be an object.")
+		require_structure(isinstance(item.get('id', ""), str), kind, f"Every entry in '{field_name}' must have a string id.")
+
+
+def check_initialization_structure(response: Dict):
+	require_structure(isinstance(response.get('id'), str), "initialization", "Field 'id' must be a string.")
+	require_structure(isinstance(response.get('data'), dict), "initialization", "Field 'data' must be an object.")
+	data = response['data']
+	require_structure(isinstance(data.get('asset_list_query'), dict), "initialization", "Datablock 'asset_list_query' is missing.")
+	if "provider_configuration" in data:
+		provider_config = data['provider_configuration']
+		require_structure(isinstance(provider_config, dict), "initialization", "Datablock 'provider_configuration' must be an object.")
+		require_list_of_objects(provider_config.get('headers'), "initialization", "provider_configuration.headers")
+		require_structure(isinstance(provider_config.get('connection_status_query'), dict), "initialization",
+			"Field 'provider_configuration.connection_status_query' must be an object.")
+
+
+def check_asset_list_structure(response: Dict):
+	require_list_of_objects(response.get('assets'), "asset_list", "assets")
+	for asset in response['assets']:
+		require_structure("id" in asset, "asset_list", "An asset is missing its id.")
+		require_structure(isinstance(asset.get('data'), dict), "asset_list", f"Field 'data' of asset {asset['id']} must be an object.")
+
+
+def check_implementation_list_structure(response: Dict):
+	require_structure(isinstance(response.get('data'), dict), "implementation_list", "Field 'data' must be an object.")
+	if "unlock_queries" in response['data']:
+		require_list_of_objects(response['data']['unlock_queries'], "implementation_list", "data.unlock_queries")
+	require_list_of_objects(response.get('implementations'), "implementation_list", "implementations")
+	for implementation in response['implementations']:
+		require_structure("id" in implementation, "implementation_list", "An implementation is missing its id.")
+		require_list_of_objects(implementation.get('components'), "implementation_list", f"implementations.{implementation['id']}.components")
+		for component in implementation['components']:
+			require_structure("id" in component, "implementation_list", f"A component of implementation {implementation['id']} is missing its id.")
+			require_structure(isinstance(component.get('data'), dict), "implementation_list", f"Field 'data' of component {component['id']} must be an object.")
+
+
+def check_connection_status_structure(response: Dict):
+	require_structure(isinstance(response.get('data'), dict), "connection_status", "Field 'data' must be an object.")
+	for datablock_name in ["user", "unlock_balance"]:
+		if datablock_name in response['data']:
+			require_structure(isinstance(response['data'][datablock_name], dict), "connection_status", f"Datablock '{datablock_name}' must be an object.")
+
+
+def check_unlock_structure(response: Dict):
+	# The addon only relies on the status code of unlock responses
+	if "data" in response:
+		require_structure(isinstance(response['data'], dict), "unlock", "Field 'data' must be an object.")
+
+
+structural_checks: Dict[str, Callable[[Dict], None]] = {
+	"initialization": check_initialization_structure,
+	"asset_list": check_asset_list_structure,
+	"implementation_list": check_implementation_list_structure,
+	"connection_status": check_connection_status_structure,
+	"unlock": check_unlock_structure
+}
+
+# The registry used for all incoming responses
+registry = AF_SchemaRegistry(SCHEMA_PATH)
+
+# The time spent validating incoming responses
+statistics = AF_ValidationStatistics()
+
+
+def validate_response(kind: str, response: Dict, mode: str):
+	"""Validates a parsed response according to the given validation mode (see AF_ValidationMode) and records the time this took."""
+	start_time = time.perf_counter()
+	try:
+		if mode == AF_ValidationMode.full.value:
+			registry.validate(kind, response)
+		elif mode == AF_ValidationMode.first_per_kind.value:
+			if kind not in registry.validated_kinds:
+				registry.validate(kind, response)
+				registry.validated_kinds.add(kind)
+		elif mode == AF_ValidationMode.structural.value:
+			if kind in structural_checks:
+				structural_checks[kind](response)
+		elif mode != AF_ValidationMode.off.value:
+			raise Exception(f"Unknown validation mode {mode}.")
+	finally:
+		statistics.record(mode, kind, time.perf_counter() - start_time)